@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Daemon local que mantém um AIAgent já aquecido e responde perguntas da CLI.
+
+Protocolo: uma linha JSON por requisição ({"message": "..."}) e uma linha JSON
+por resposta ({"response": "..."}), sobre TCP em localhost.
+"""
+import json
+import os
+import socket
+import socketserver
+import sys
+
+ENDERECO_PADRAO = "127.0.0.1:5055"
+
+
+def _endereco(endereco: str = None) -> tuple:
+    host, _, porta = (endereco or os.getenv("AGENT_DAEMON_ADDR", ENDERECO_PADRAO)).rpartition(":")
+    return host or "127.0.0.1", int(porta)
+
+
+class _AgentServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco, agent):
+        super().__init__(endereco, _AgentHandler)
+        self.agent = agent
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for linha in self.rfile:
+            try:
+                pergunta = json.loads(linha)["message"]
+                resposta = {"response": self.server.agent.process_message(pergunta)}
+            except Exception as e:
+                resposta = {"error": str(e)}
+            self.wfile.write(json.dumps(resposta, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+def serve(agent, endereco: str = None):
+    """Atende perguntas até o processo ser interrompido."""
+    host, porta = _endereco(endereco)
+    with _AgentServer((host, porta), agent) as server:
+        print(f"🟢 Daemon do agente ouvindo em {host}:{porta}", file=sys.stderr)
+        server.serve_forever()
+
+
+def ask(pergunta: str, endereco: str = None, timeout: float = 120.0):
+    """
+    Envia a pergunta ao daemon e retorna a resposta.
+    Retorna None se não houver daemon rodando, para que a CLI processe localmente.
+    """
+    try:
+        conexao = socket.create_connection(_endereco(endereco), timeout=1.0)
+    except OSError:
+        return None
+
+    with conexao:
+        conexao.settimeout(timeout)
+        conexao.sendall(json.dumps({"message": pergunta}, ensure_ascii=False).encode("utf-8") + b"\n")
+        with conexao.makefile("rb") as leitor:
+            resposta = json.loads(leitor.readline())
+    if "error" in resposta:
+        raise RuntimeError(resposta["error"])
+    return resposta["response"]
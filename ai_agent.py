@@ -2,14 +2,30 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from groq import Groq
+from groq import Groq, AsyncGroq
+import asyncio
 import os
 import json
 from tools import DatabaseTools
+from model_matcher import ModelMatcher
+from intent_router import IntentRouter, extrair_limite, extrair_periodo
+from text_utils import normalizar_texto
+from streaming import SentenceChunker
+from conversation_state import ConversationStore
+from llm_client import LLMClient
+from spec_answers import formatar_valor, responder_especificacao
+from prompt_budget import PromptBudget, ajustar_documentos, cortar_texto, tokens_da_requisicao
 from rag.vector_store import VectorStoreManager
+from rag.hybrid_retriever import HybridRetriever
+from rag.answer_cache import SemanticAnswerCache
+import agent_daemon
+import metrics
+import tool_registry
 import sys
-import inspect
-import re
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 
 class AIAgent:
     """
@@ -19,18 +35,65 @@ class AIAgent:
     def __init__(self):
         self.db_tools = DatabaseTools()
         self.vector_store = VectorStoreManager()
+        self.retriever = HybridRetriever(self.vector_store)
+        # Respostas do RAG reaproveitadas para perguntas quase iguais (similaridade dos embeddings)
+        self.answer_cache = SemanticAnswerCache(
+            limiar=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL_S", "3600")),
+            max_size=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+        )
         
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
             raise ValueError("A chave da API Groq não foi encontrada. Verifique o arquivo .env e a variável GROQ_API_KEY.")
         
-        self.client = Groq(api_key=groq_api_key)
+        # Retentativas ficam a cargo do LLMClient, que respeita o prazo de cada fluxo
+        self.client = Groq(api_key=groq_api_key, max_retries=0)
+        # Cliente assíncrono usado pelo servidor ASGI (aprocess_message)
+        self.async_client = AsyncGroq(api_key=groq_api_key, max_retries=0)
         
         # MUDANÇA CRÍTICA 1: Usar modelo 70B em vez de 8B
         self.model_name = "llama-3.3-70b-versatile"  # Modelo MUITO melhor e ainda gratuito
+
+        # Prazo, retentativas, hedging e modelo reserva (menor e mais rápido) para o Groq
+        self.llm = LLMClient(
+            self.client, self.async_client, self.model_name,
+            fallback_model=os.getenv("LLM_FALLBACK_MODEL", "llama-3.1-8b-instant") or None,
+            deadline=float(os.getenv("LLM_DEADLINE_S", "15")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            hedge=os.getenv("LLM_HEDGE", "1") == "1",
+            hedge_default_s=float(os.getenv("LLM_HEDGE_DELAY_S", "3")),
+            breaker_failures=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            breaker_reset_s=float(os.getenv("LLM_BREAKER_RESET_S", "30")),
+        )
+        self.prazos_llm = {
+            fluxo: float(os.getenv(f"LLM_DEADLINE_{fluxo.upper()}_S", prazo))
+            for fluxo, prazo in self.PRAZOS_LLM.items()
+        }
         
-        self.tools = self._get_tools_definitions()
+        # Classificador de intenção local que reaproveita o modelo de embeddings do RAG
+        self.intent_router = IntentRouter(
+            self.vector_store.encode_queries,
+            min_score=float(os.getenv("ROUTER_MIN_SCORE", "0.65")),
+            min_margin=float(os.getenv("ROUTER_MIN_MARGIN", "0.02")),
+        )
+        
+        # Esquemas das ferramentas montados uma vez, na importação de tool_registry
+        self.tools = tool_registry.esquemas()
         self.system_prompt = self._build_system_prompt()
+        # Variante enxuta usada quando a completa não cabe no orçamento do fluxo
+        self.tools_compactas = tool_registry.esquemas(compacto=True)
+        self.system_prompt_compacto = self._build_system_prompt(compacto=True)
+        # Chamadas de ferramenta de uma mesma resposta do LLM rodam em paralelo
+        self._tool_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("TOOL_CALL_WORKERS", "4")), thread_name_prefix="tool"
+        )
+
+        # Orçamento de tokens de prompt por fluxo e contabilidade de uso
+        self.prompt_budget = PromptBudget({
+            fluxo: int(os.getenv(f"PROMPT_BUDGET_{fluxo.upper()}", orcamento))
+            for fluxo, orcamento in self.ORCAMENTOS_PROMPT.items()
+        })
         
         # Lista de modelos válidos (cache)
         self.modelos_validos = [
@@ -41,103 +104,80 @@ class AIAgent:
             "Xiaomi 13T",
             "Xiaomi Redmi Note 13"
         ]
-
-    def _get_tools_definitions(self) -> list:
-        """
-        Gera as definições das ferramentas de forma SIMPLIFICADA.
-        MUDANÇA CRÍTICA 2: Reduzir número de ferramentas para evitar confusão do modelo.
-        """
-        tool_definitions = []
-        
-        # APENAS as ferramentas ESSENCIAIS
-        ferramentas_essenciais = [
-            'get_smartphone_details_and_photos',
-            'get_top_sold_products',
-            'get_monthly_revenue',
-            'get_product_sales'
-        ]
         
-        for name, func in inspect.getmembers(self.db_tools, inspect.isfunction):
-            if name.startswith("_") or name not in ferramentas_essenciais:
-                continue
+        # Apelidos além dos gerados automaticamente pelo ModelMatcher
+        self.apelidos_modelos = {
+            "redmi note 13": "Xiaomi Redmi Note 13",
+            "galaxy a54": "Samsung Galaxy A54",
+            "s24 ultra": "Samsung Galaxy S24 Ultra",
+            "moto g54": "Motorola Moto G54",
+        }
+        self._model_matcher = None
+        self._model_matcher_versao = None
 
-            docstring = inspect.getdoc(func)
-            if not docstring:
-                continue
+        # Estado por remetente: modelos citados, dados já buscados e últimas trocas
+        self.conversations = ConversationStore(
+            max_turnos=int(os.getenv("CONVERSATION_MAX_TURNS", "6")),
+            ttl=float(os.getenv("CONVERSATION_TTL_S", "1800")),
+            max_conversas=int(os.getenv("CONVERSATION_MAX_SENDERS", "10000")),
+            spill_path=os.getenv("CONVERSATION_SPILL_PATH") or None,
+            max_resultados=int(os.getenv("CONVERSATION_MAX_RESULTS", "8")),
+            ttl_resultados=float(os.getenv("CONVERSATION_RESULT_TTL_S", "300")),
+        )
 
-            # Extrair descrição
-            description_match = re.match(r"^(.*?)\n", docstring, re.DOTALL)
-            description = description_match.group(1).strip() if description_match else "Sem descrição."
-            
-            # MUDANÇA CRÍTICA 3: Descrições ULTRA específicas
-            if name == "get_smartphone_details_and_photos":
-                description = """
-FERRAMENTA OBRIGATÓRIA para QUALQUER pergunta sobre especificações técnicas de smartphones.
-Use esta ferramenta quando o usuário perguntar sobre:
-- Processador, RAM, memória, armazenamento
-- Câmera, bateria, tela, display
-- Preço, valor, custo
-- Características, especificações, detalhes técnicos
-- Comparação entre dois modelos específicos
-Exemplos de perguntas que EXIGEM esta ferramenta:
-- "Qual o processador do Xiaomi 13T?"
-- "Quanto custa o iPhone 15 Pro Max?"
-- "Qual a diferença entre Samsung A54 e Xiaomi 13T?"
-"""
-            elif name == "get_top_sold_products":
-                description = "Retorna os produtos MAIS VENDIDOS. Use quando perguntarem sobre 'mais vendido', 'campeão de vendas', 'líder', 'top vendas'."
-            elif name == "get_monthly_revenue":
-                description = "Retorna o FATURAMENTO TOTAL de um mês/ano. Use quando perguntarem sobre 'receita', 'faturamento', 'quanto vendeu em dinheiro'."
-            elif name == "get_product_sales":
-                description = "Retorna as VENDAS de UM produto específico. Use quando perguntarem 'quantos [modelo] foram vendidos?', 'vendas do [modelo]'."
-
-            param_docs = dict(re.findall(r"-\s+([a-zA-Z_]+)\s+\([^)]+\):\s+(.*)", docstring))
-            sig = inspect.signature(func)
-            parameters = sig.parameters
-            
-            tool_params = {
-                "type": "object",
-                "properties": {},
-                "required": [],
-            }
+        # Tokens, caches, pool e cliente LLM entram no /metrics a cada coleta
+        metrics.registrar_coletor(self._coletar_metricas)
 
-            for param_name, param in parameters.items():
-                if param_name == 'self':
-                    continue
-                
-                param_type = "string"
-                if param.annotation == int:
-                    param_type = "integer"
-                elif param.annotation == float:
-                    param_type = "number"
-                elif param.annotation == bool:
-                    param_type = "boolean"
-                elif param.annotation == list:
-                    param_type = "array"
-
-                tool_params["properties"][param_name] = {
-                    "type": param_type,
-                    "description": param_docs.get(param_name, ""),
-                }
+    def warm_up(self, budget_s: float = None) -> dict:
+        """
+        Carrega antecipadamente tudo o que o __init__ deixa para o primeiro uso
+        (modelo de embeddings, ChromaDB, protótipos do roteador, catálogo, cubo de
+        vendas e pool do PostgreSQL). Deve rodar antes de aceitar tráfego.
+        Retorna o tempo de cada etapa e avisa se o total estourar o orçamento
+        (`STARTUP_BUDGET_S`, padrão 60s).
+        """
+        if budget_s is None:
+            budget_s = float(os.getenv("STARTUP_BUDGET_S", "60"))
 
-                if param.default is inspect.Parameter.empty:
-                    tool_params["required"].append(param_name)
-            
-            tool_definitions.append({
-                "type": "function",
-                "function": {
-                    "name": name,
-                    "description": description,
-                    "parameters": tool_params,
-                },
-            })
-            
-        return tool_definitions
+        etapas = [
+            ("embeddings+chromadb", self.vector_store.warm_up),
+            ("roteador", self.intent_router.prepare),
+            ("bm25", self.retriever.ensure_fresh),
+            ("catalogo", self.db_tools.catalog.ensure_fresh),
+            ("vendas", self.db_tools.rollup.ensure_fresh),
+            ("modelos", self._get_model_matcher),
+        ]
+        tempos = {}
+        inicio = time.perf_counter()
+        for nome, etapa in etapas:
+            t0 = time.perf_counter()
+            try:
+                etapa()
+            except Exception as e:
+                print(f"⚠️ Warm-up de {nome} falhou: {e}", file=sys.stderr)
+            tempos[nome] = time.perf_counter() - t0
+        tempos["total"] = time.perf_counter() - inicio
+
+        detalhes = ", ".join(f"{nome} {t:.2f}s" for nome, t in tempos.items())
+        if tempos["total"] > budget_s:
+            print(f"⚠️ Warm-up acima do orçamento de {budget_s:.0f}s: {detalhes}", file=sys.stderr)
+        else:
+            print(f"🔥 Warm-up concluído: {detalhes}", file=sys.stderr)
+        return tempos
 
-    def _build_system_prompt(self) -> str:
+    def _build_system_prompt(self, compacto: bool = False) -> str:
         """
         MUDANÇA CRÍTICA 4: System prompt CURTO, DIRETO e IMPERATIVO.
+        A variante compacta mantém as regras e tira os exemplos, que já estão nas ferramentas.
         """
+        if compacto:
+            return '''Você é Fabio, vendedor de smartphones. Data atual: 12 de Novembro de 2025.
+Modelos em estoque: iPhone 15 Pro Max, Motorola Moto G54, Samsung Galaxy A54, Samsung Galaxy S24 Ultra, Xiaomi 13T, Xiaomi Redmi Note 13.
+Para qualquer dado técnico ou preço, chame get_smartphone_details_and_photos com o nome EXATO do modelo e responda só com o resultado. Nunca invente dados.
+Para vendas e faturamento, use as ferramentas de vendas.
+Pergunta com mais de um dado: chame todas as ferramentas necessárias de uma vez.
+Modelo fora da lista: ofereça uma alternativa parecida.'''
+
         return f'''Você é Fabio, especialista em vendas de smartphones.
 
 DATA ATUAL: 12 de Novembro de 2025.
@@ -178,6 +218,8 @@ NORMALIZAÇÃO DE NOMES:
 - "S24 Ultra" = "Samsung Galaxy S24 Ultra"
 - "Moto G54" = "Motorola Moto G54"
 
+Se a pergunta pedir mais de um dado (ex.: "qual o mais vendido e quanto faturamos em outubro?"), chame TODAS as ferramentas necessárias na mesma resposta; elas rodam em paralelo.
+
 Se o usuário perguntar sobre um modelo que NÃO está na lista, ofereça uma alternativa da mesma marca ou similar.
 
 Seja amigável, mas SEMPRE baseie suas respostas em DADOS REAIS das ferramentas.'''
@@ -258,95 +300,568 @@ Seja amigável, mas SEMPRE baseie suas respostas em DADOS REAIS das ferramentas.
         except Exception as e:
             return f"🐞 Erro ao formatar resposta: {e}"
 
+    def _get_model_matcher(self) -> ModelMatcher:
+        """
+        Retorna o matcher de modelos, recompilando-o apenas quando o catálogo em
+        memória muda de versão (antes da primeira carga usa modelos_validos).
+        """
+        versao = self.db_tools.catalog.version
+        if self._model_matcher is None or versao != self._model_matcher_versao:
+            modelos = self.db_tools.catalog.models() or self.modelos_validos
+            self._model_matcher = ModelMatcher(modelos, self.apelidos_modelos)
+            self._model_matcher_versao = versao
+        return self._model_matcher
+
     def _normalize_model_name(self, text: str) -> str:
         """Normaliza o nome de um modelo de smartphone a partir de um texto."""
-        text_lower = text.lower()
-        
-        # Mapeamento de apelidos para nomes completos
-        model_map = {
-            "redmi note 13": "Xiaomi Redmi Note 13",
-            "galaxy a54": "Samsung Galaxy A54",
-            "iphone 15 pro max": "iPhone 15 Pro Max",
-            "s24 ultra": "Samsung Galaxy S24 Ultra",
-            "moto g54": "Motorola Moto G54",
-            "xiaomi 13t": "Xiaomi 13T"
-        }
-
-        for alias, full_name in model_map.items():
-            if alias in text_lower:
-                return full_name
-        
-        # Se não encontrar um apelido, tenta encontrar o nome completo
-        for model in self.modelos_validos:
-            if model.lower() in text_lower:
-                return model
-                
-        return None
+        return self._get_model_matcher().first(text)
 
     def _find_mentioned_models(self, text: str) -> list:
         """Encontra todos os modelos de smartphones válidos mencionados em um texto."""
-        mentioned = set()
-        text_lower = text.lower()
+        return self._get_model_matcher().find_all(text)
+
+    # Fluxos de processamento retornados por _route
+    FLUXO_COMPARACAO = "comparacao"
+    FLUXO_TECNICO = "tecnico"
+    FLUXO_FERRAMENTA = "ferramenta"
+    FLUXO_TOOLS = "tools"
+    FLUXO_VENDAS = "vendas"
+    FLUXO_RAG = "rag"
+
+    # Prazo total (segundos) das chamadas ao Groq em cada fluxo, incluindo retentativas
+    PRAZOS_LLM = {
+        FLUXO_COMPARACAO: 20.0,
+        FLUXO_TECNICO: 10.0,
+        FLUXO_TOOLS: 12.0,
+        FLUXO_VENDAS: 12.0,
+        FLUXO_RAG: 15.0,
+    }
+
+    # Orçamento de tokens de prompt (estimados) de cada fluxo
+    ORCAMENTOS_PROMPT = {
+        FLUXO_COMPARACAO: 1200,
+        FLUXO_TECNICO: 600,
+        # O pedido completo (prompt com exemplos + esquemas das ferramentas) tem ~1100 tokens
+        FLUXO_TOOLS: 1300,
+        FLUXO_VENDAS: 1300,
+        FLUXO_RAG: 900,
+    }
+
+    # Ferramentas cujo resultado pode ser reaproveitado na conversa (dados de catálogo);
+    # as de vendas mudam com o tempo e não entram
+    FERRAMENTAS_REAPROVEITAVEIS = {"get_smartphone_details_and_photos"}
+
+    # Mensagem devolvida ao usuário quando um fluxo falha
+    MENSAGENS_ERRO = {
+        FLUXO_COMPARACAO: "🐞 Ocorreu um erro ao comparar os modelos: {erro}",
+        FLUXO_TECNICO: "🐞 Ocorreu um erro ao buscar dados: {erro}",
+        FLUXO_FERRAMENTA: "🐞 Desculpe, ocorreu um erro ao consultar os dados: {erro}",
+        FLUXO_TOOLS: "🐞 Desculpe, ocorreu um erro ao tentar usar minhas ferramentas: {erro}",
+        FLUXO_VENDAS: "🐞 Desculpe, ocorreu um erro ao tentar usar minhas ferramentas: {erro}",
+        FLUXO_RAG: "Desculpe, tive um problema ao processar sua pergunta. Pode reformular?",
+    }
+
+    def _route(self, user_message: str, contexto=None) -> tuple:
+        """
+        Roteamento LOCAL por intenção, sem chamar o LLM.
+        Retorna (fluxo, modelos_mencionados, ferramenta), onde `ferramenta` é
+        (nome, argumentos) quando a própria rota já sabe qual consulta executar.
+        O LLM só escolhe a ferramenta quando a intenção é incerta ou faltam parâmetros.
+        Com `contexto` (estado da conversa), perguntas técnicas sem modelo citado
+        ("e a bateria dele?") usam os modelos da troca anterior.
+        """
+        modelos_mencionados = self._find_mentioned_models(user_message)
+        modelos_anteriores = list(contexto.modelos) if contexto is not None else []
+        try:
+            intencao, nota = self.intent_router.classify(user_message)
+        except Exception as e:
+            print(f"⚠️ Roteador de intenção indisponível ({e}). Usando palavras-chave.", file=sys.stderr)
+            return self._route_por_palavras(user_message, modelos_mencionados, modelos_anteriores)
+        print(f"🧭 Intenção: {intencao or 'incerta'} (similaridade {nota:.2f})", file=sys.stderr)
+
+        # FLUXO 1: Pergunta técnica com modelo(s) claro(s) - citados agora ou na troca anterior
+        if intencao in ("especificacoes", "comparacao"):
+            if modelos_mencionados:
+                return self._route_tecnico(modelos_mencionados)
+            if modelos_anteriores:
+                print(f"🧵 Continuação da conversa sobre {', '.join(modelos_anteriores)}", file=sys.stderr)
+                return self._route_tecnico(modelos_anteriores)
+
+        # FLUXO 3: Vendas e finanças com parâmetros extraídos do próprio texto
+        mes, ano = extrair_periodo(user_message)
+        ano_consulta = ano or date.today().year
+        if intencao == "mais_vendidos":
+            args = {"limit": extrair_limite(user_message)}
+            if mes:
+                args.update(month=mes, year=ano_consulta)
+            elif ano:
+                args["year"] = ano
+            print("📊 FLUXO VENDAS/FINANÇAS: mais vendidos", file=sys.stderr)
+            return self.FLUXO_FERRAMENTA, modelos_mencionados, ("get_top_sold_products", args)
+        if intencao == "faturamento" and mes:
+            print("📊 FLUXO VENDAS/FINANÇAS: faturamento", file=sys.stderr)
+            return self.FLUXO_FERRAMENTA, modelos_mencionados, (
+                "get_monthly_revenue", {"month": mes, "year": ano_consulta})
+        if intencao == "vendas_produto" and mes and len(modelos_mencionados) == 1:
+            print(f"📊 FLUXO VENDAS/FINANÇAS: vendas do {modelos_mencionados[0]}", file=sys.stderr)
+            return self.FLUXO_FERRAMENTA, modelos_mencionados, (
+                "get_product_sales", {"produto": modelos_mencionados[0], "month": mes, "year": ano_consulta})
+
+        # FLUXO 4: Pergunta genérica/subjetiva - Usar RAG
+        if intencao == "conversa":
+            print("💬 FLUXO RAG: Pergunta genérica", file=sys.stderr)
+            return self.FLUXO_RAG, modelos_mencionados, None
+
+        # FLUXO 2: Intenção incerta ou sem parâmetros suficientes - Usar IA com tools
+        print("⚠️ FLUXO IA COM TOOLS: intenção incerta ou parâmetros faltando", file=sys.stderr)
+        return self.FLUXO_TOOLS, modelos_mencionados, None
+
+    def _route_tecnico(self, modelos_mencionados: list) -> tuple:
+        # FLUXO 1.1: Comparação entre DOIS ou mais modelos
+        if len(modelos_mencionados) >= 2:
+            print(f"🔍 FLUXO DETERMINÍSTICO: Comparação entre {', '.join(modelos_mencionados)}", file=sys.stderr)
+            return self.FLUXO_COMPARACAO, modelos_mencionados, None
+
+        # FLUXO 1.2: Pergunta sobre UM modelo
+        print(f"✅ FLUXO DETERMINÍSTICO: Pergunta técnica sobre {modelos_mencionados[0]}", file=sys.stderr)
+        return self.FLUXO_TECNICO, modelos_mencionados, None
+
+    def _route_por_palavras(self, user_message: str, modelos_mencionados: list,
+                            modelos_anteriores: list = None) -> tuple:
+        """Roteamento antigo por palavras-chave, usado se o roteador de intenção falhar."""
+        palavras = set(normalizar_texto(user_message).split())
+        texto = normalizar_texto(user_message)
         
-        # Mapeamento de apelidos para nomes completos
-        model_map = {
-            "redmi note 13": "Xiaomi Redmi Note 13",
-            "galaxy a54": "Samsung Galaxy A54",
-            "iphone 15 pro max": "iPhone 15 Pro Max",
-            "s24 ultra": "Samsung Galaxy S24 Ultra",
-            "moto g54": "Motorola Moto G54",
-            "xiaomi 13t": "Xiaomi 13T"
+        # Palavras-chave que indicam uma pergunta técnica (comparadas por palavra inteira)
+        palavras_tecnicas = {
+            'processador', 'ram', 'memoria', 'armazenamento', 'camera', 'bateria', 
+            'tela', 'display', 'preco', 'valor', 'custo', 'caracteristica', 
+            'especificacao', 'detalhe', 'comparar', 'vs', 'x', 'diferenca', 'melhor', 'pior'
         }
+        pergunta_tecnica = bool(palavras & palavras_tecnicas) or 'ficha tecnica' in texto
 
-        # Verifica apelidos primeiro
-        for alias, full_name in model_map.items():
-            if alias in text_lower:
-                mentioned.add(full_name)
+        if pergunta_tecnica and (modelos_mencionados or modelos_anteriores):
+            return self._route_tecnico(modelos_mencionados or modelos_anteriores)
         
-        # Verifica nomes completos (para garantir que não perca nada)
-        for model in self.modelos_validos:
-            if model.lower() in text_lower:
-                mentioned.add(model)
-                
-        return list(mentioned)
+        if pergunta_tecnica:
+            print("⚠️ FLUXO IA COM TOOLS: Pergunta técnica sem modelo claro", file=sys.stderr)
+            return self.FLUXO_TOOLS, modelos_mencionados, None
+        
+        palavras_vendas = {'vendido', 'vendas', 'campeao', 'lider', 'top', 'receita', 'faturamento', 'arrecadacao'}
+        if palavras & palavras_vendas or 'mais vendeu' in texto:
+            print("📊 FLUXO VENDAS/FINANÇAS", file=sys.stderr)
+            return self.FLUXO_VENDAS, modelos_mencionados, None
+        
+        print("💬 FLUXO RAG: Pergunta genérica", file=sys.stderr)
+        return self.FLUXO_RAG, modelos_mencionados, None
 
-    def process_message(self, user_message: str) -> str:
+    def process_message(self, user_message: str, sender_id: str = None, cancelado=None) -> str:
         """
-        MUDANÇA CRÍTICA 5: Lógica de roteamento DETERMINÍSTICA.
-        A IA só é usada quando estritamente necessário.
+        Processa uma mensagem de forma síncrona.
+        Cada fluxo monta um "plano": ou a resposta pronta (str) ou a requisição
+        de chat que ainda precisa ser enviada ao Groq.
+        Com `sender_id`, a conversa daquele remetente é usada para entender
+        continuações e reaproveitar dados já buscados.
+        `cancelado` (threading.Event) é ligado quando uma mensagem mais nova do
+        remetente torna esta obsoleta: o Groq não é chamado, o turno não é
+        registrado e o retorno é None.
         """
-        user_message_lower = user_message.lower()
-        
-        # Palavras-chave que indicam uma pergunta técnica
-        palavras_tecnicas = [
-            'processador', 'ram', 'memória', 'armazenamento', 'câmera', 'bateria', 
-            'tela', 'display', 'preço', 'valor', 'custo', 'característica', 
-            'especificação', 'detalhe', 'ficha técnica', 'comparar', 'vs', 'x', 
-            'diferença', 'melhor', 'pior'
-        ]
-        
-        pergunta_tecnica = any(palavra in user_message_lower for palavra in palavras_tecnicas)
-        modelos_mencionados = self._find_mentioned_models(user_message)
+        inicio = time.perf_counter()
+        contexto = self._contexto(sender_id)
+        fluxo, modelos, ferramenta = self._rotear(user_message, contexto)
+        try:
+            plano = self._planejar(user_message, fluxo, modelos, ferramenta, contexto)
+            if cancelado is not None and cancelado.is_set():
+                print("⏭️ Mensagem substituída por outra mais recente do remetente", file=sys.stderr)
+                return None
+            resposta = self._complete(plano, fluxo)
+        except Exception as e:
+            print(f"🐞 Erro no fluxo {fluxo}: {e}", file=sys.stderr)
+            metrics.contar_erro("mensagem", fluxo)
+            return self.MENSAGENS_ERRO[fluxo].format(erro=e)
+        finally:
+            metrics.MENSAGENS.observe(time.perf_counter() - inicio, fluxo=fluxo)
+        if cancelado is not None and cancelado.is_set():
+            return None
+        self._guardar_resposta(fluxo, plano, user_message, resposta, modelos, contexto)
+        self._registrar_turno(sender_id, user_message, resposta, modelos)
+        return resposta
 
-        # FLUXO 1: Pergunta técnica com modelo(s) claro(s)
-        if pergunta_tecnica and modelos_mencionados:
-            # FLUXO 1.1: Comparação entre DOIS ou mais modelos
-            if len(modelos_mencionados) >= 2:
-                print(f"🔍 FLUXO DETERMINÍSTICO: Comparação entre {', '.join(modelos_mencionados)}", file=sys.stderr)
-                
-                dados_completos = []
-                for modelo in modelos_mencionados:
-                    dados = self.db_tools.get_smartphone_details_and_photos(modelo)
-                    if dados:
-                        # Formata os dados brutos para um texto mais limpo
-                        texto_formatado = self._format_response('get_smartphone_details_and_photos', dados)
-                        dados_completos.append(texto_formatado)
-                
-                if not dados_completos:
-                    return "😕 Não consegui encontrar dados para os modelos solicitados. Pode tentar outros?"
+    async def aprocess_message(self, user_message: str, sender_id: str = None) -> str:
+        """
+        Versão assíncrona de process_message para o servidor ASGI.
+        Groq é aguardado via AsyncGroq; Postgres e ChromaDB (bibliotecas síncronas)
+        rodam em threads, e buscas independentes são disparadas em paralelo.
+        """
+        inicio = time.perf_counter()
+        contexto = self._contexto(sender_id)
+        # O roteador roda o modelo de embeddings (CPU): fora do event loop
+        fluxo, modelos, ferramenta = await asyncio.to_thread(self._rotear, user_message, contexto)
+        try:
+            plano = await self._aplanejar(user_message, fluxo, modelos, ferramenta, contexto)
+            resposta = await self._acomplete(plano, fluxo)
+        except Exception as e:
+            print(f"🐞 Erro no fluxo {fluxo}: {e}", file=sys.stderr)
+            metrics.contar_erro("mensagem", fluxo)
+            return self.MENSAGENS_ERRO[fluxo].format(erro=e)
+        finally:
+            metrics.MENSAGENS.observe(time.perf_counter() - inicio, fluxo=fluxo)
+        await asyncio.to_thread(self._guardar_resposta, fluxo, plano, user_message, resposta, modelos, contexto)
+        self._registrar_turno(sender_id, user_message, resposta, modelos)
+        return resposta
+
+    def stream_message(self, user_message: str, sender_id: str = None):
+        """
+        Versão em streaming de process_message: gera a resposta em pedaços
+        (frases) à medida que o Groq produz os tokens. Fluxos que não usam o LLM
+        geram um único pedaço com a resposta pronta.
+        """
+        inicio = time.perf_counter()
+        contexto = self._contexto(sender_id)
+        fluxo, modelos, ferramenta = self._rotear(user_message, contexto)
+        pedacos = []
+        try:
+            plano = self._planejar(user_message, fluxo, modelos, ferramenta, contexto)
+            if isinstance(plano, str):
+                pedacos.append(plano)
+                yield plano
+            else:
+                chunker = SentenceChunker()
+                for token in self._chat_stream(plano, fluxo):
+                    for pedaco in chunker.add(token):
+                        pedacos.append(pedaco)
+                        yield pedaco
+                for pedaco in chunker.flush():
+                    pedacos.append(pedaco)
+                    yield pedaco
+        except Exception as e:
+            print(f"🐞 Erro no fluxo {fluxo}: {e}", file=sys.stderr)
+            metrics.contar_erro("mensagem", fluxo)
+            yield self.MENSAGENS_ERRO[fluxo].format(erro=e)
+            return
+        finally:
+            metrics.MENSAGENS.observe(time.perf_counter() - inicio, fluxo=fluxo)
+        self._guardar_resposta(fluxo, plano, user_message, "\n".join(pedacos), modelos, contexto)
+        self._registrar_turno(sender_id, user_message, "\n".join(pedacos), modelos)
+
+    async def astream_message(self, user_message: str, sender_id: str = None):
+        """Equivalente assíncrono de stream_message."""
+        inicio = time.perf_counter()
+        contexto = self._contexto(sender_id)
+        fluxo, modelos, ferramenta = await asyncio.to_thread(self._rotear, user_message, contexto)
+        pedacos = []
+        try:
+            plano = await self._aplanejar(user_message, fluxo, modelos, ferramenta, contexto)
+            if isinstance(plano, str):
+                pedacos.append(plano)
+                yield plano
+            else:
+                chunker = SentenceChunker()
+                async for token in self._achat_stream(plano, fluxo):
+                    for pedaco in chunker.add(token):
+                        pedacos.append(pedaco)
+                        yield pedaco
+                for pedaco in chunker.flush():
+                    pedacos.append(pedaco)
+                    yield pedaco
+        except Exception as e:
+            print(f"🐞 Erro no fluxo {fluxo}: {e}", file=sys.stderr)
+            metrics.contar_erro("mensagem", fluxo)
+            yield self.MENSAGENS_ERRO[fluxo].format(erro=e)
+            return
+        finally:
+            metrics.MENSAGENS.observe(time.perf_counter() - inicio, fluxo=fluxo)
+        await asyncio.to_thread(self._guardar_resposta, fluxo, plano, user_message, "\n".join(pedacos), modelos, contexto)
+        self._registrar_turno(sender_id, user_message, "\n".join(pedacos), modelos)
+
+    def _rotear(self, user_message: str, contexto=None) -> tuple:
+        """_route cronometrado; o tempo é registrado com o fluxo escolhido."""
+        inicio = time.perf_counter()
+        try:
+            rota = self._route(user_message, contexto)
+        except Exception:
+            metrics.contar_erro("roteamento", "")
+            raise
+        metrics.ESTAGIOS.observe(time.perf_counter() - inicio, stage="roteamento", fluxo=rota[0])
+        return rota
+
+    def _planejar(self, user_message: str, fluxo: str, modelos: list, ferramenta: tuple = None, contexto=None):
+        """_plan cronometrado; banco e ChromaDB registram seus tempos no fluxo da mensagem."""
+        token = metrics.fluxo_atual.set(fluxo)
+        try:
+            with metrics.medir("plano", fluxo):
+                return self._plan(user_message, fluxo, modelos, ferramenta, contexto)
+        finally:
+            metrics.fluxo_atual.reset(token)
+
+    async def _aplanejar(self, user_message: str, fluxo: str, modelos: list, ferramenta: tuple = None, contexto=None):
+        token = metrics.fluxo_atual.set(fluxo)
+        try:
+            with metrics.medir("plano", fluxo):
+                return await self._aplan(user_message, fluxo, modelos, ferramenta, contexto)
+        finally:
+            metrics.fluxo_atual.reset(token)
+
+    def _contexto(self, sender_id: str):
+        return self.conversations.get(sender_id) if sender_id else None
+
+    def _registrar_turno(self, sender_id: str, pergunta: str, resposta: str, modelos: list):
+        if sender_id:
+            self.conversations.record_turn(sender_id, pergunta, resposta, modelos)
+
+    # Palavras que indicam continuação da conversa ("e ele?", "isso serve pra jogo?")
+    PALAVRAS_CONTINUACAO = {
+        "ele", "ela", "eles", "elas", "dele", "dela", "deles", "delas", "nele", "nela",
+        "esse", "essa", "isso", "desse", "dessa", "disso", "nesse", "nessa", "aquele", "aquela", "outro", "outra",
+    }
+
+    def _pergunta_autonoma(self, user_message: str, contexto=None) -> bool:
+        """True se a resposta não depende das trocas anteriores (e pode ir para o cache de respostas)."""
+        if contexto is None or not contexto.turnos:
+            return True
+        palavras = normalizar_texto(user_message).split()
+        return bool(palavras) and palavras[0] not in ("e", "mas", "entao") and not set(palavras) & self.PALAVRAS_CONTINUACAO
+
+    def _chave_resposta(self, user_message: str, modelos: list) -> tuple:
+        """(embedding da pergunta, escopo, versão da coleção) usados pelo cache de respostas."""
+        self.retriever.ensure_fresh()
+        vetor = self.vector_store.encode_queries([user_message])[0]
+        escopo = tuple(sorted(modelos or [])) + tuple(sorted(self.retriever.fabricantes_mencionados(user_message)))
+        return vetor, escopo, self.retriever.versao
+
+    def _resposta_em_cache(self, user_message: str, modelos: list, contexto=None):
+        """Resposta já dada a uma pergunta quase igual, ou None (o RAG segue normalmente)."""
+        if self.answer_cache.max_size <= 0 or not self._pergunta_autonoma(user_message, contexto):
+            return None
+        vetor, escopo, versao = self._chave_resposta(user_message, modelos)
+        resposta = self.answer_cache.buscar(vetor, escopo, versao)
+        if resposta is not None:
+            print("♻️ Resposta servida do cache semântico", file=sys.stderr)
+        return resposta
 
-                dados_formatados = '\n---\n'.join(dados_completos)
-                prompt_comparacao = f"""O usuário pediu para comparar: "{user_message}"
+    def _guardar_resposta(self, fluxo: str, plano, user_message: str, resposta: str, modelos: list, contexto=None):
+        """
+        Guarda a resposta do LLM no fluxo RAG para perguntas parecidas que vierem depois.
+        Só perguntas autônomas entram, e a requisição delas foi montada sem histórico.
+        """
+        if (fluxo != self.FLUXO_RAG or not isinstance(plano, dict) or not resposta
+                or self.answer_cache.max_size <= 0 or not self._pergunta_autonoma(user_message, contexto)):
+            return
+        try:
+            vetor, escopo, versao = self._chave_resposta(user_message, modelos)
+            self.answer_cache.guardar(user_message, vetor, resposta, escopo, versao)
+        except Exception as e:
+            print(f"⚠️ Não foi possível guardar a resposta no cache: {e}", file=sys.stderr)
+
+    def _buscar_detalhes(self, modelos: list, contexto=None) -> dict:
+        """
+        Dados de cada modelo, reaproveitando os que a conversa já buscou.
+        Só os modelos que faltam vão ao catálogo/banco.
+        """
+        detalhes = self.conversations.detalhes(contexto, modelos) if contexto is not None else {}
+        faltando = [modelo for modelo in modelos if modelo not in detalhes]
+        if len(faltando) == 1:
+            novos = {faltando[0]: self.db_tools.get_smartphone_details_and_photos(faltando[0])}
+        elif faltando:
+            novos = self.db_tools.get_multiple_smartphone_details(faltando)
+        else:
+            novos = {}
+            print(f"🧵 Reaproveitando dados da conversa: {', '.join(modelos)}", file=sys.stderr)
+        if contexto is not None:
+            # Não guarda erros nem buscas vazias: a próxima pergunta tenta de novo
+            validos = {modelo: dados for modelo, dados in novos.items() if dados and "erro" not in dados[0]}
+            self.conversations.guardar_detalhes(contexto, validos)
+            detalhes.update(validos)
+        return {modelo: detalhes.get(modelo) or novos.get(modelo) for modelo in modelos}
+
+    def _executar_ferramenta(self, nome: str, args: dict, contexto=None) -> str:
+        """
+        Executa uma ferramenta da rota; a mesma consulta de catálogo na mesma
+        conversa vem do estado. Ferramentas de vendas sempre vão ao banco/cubo.
+        """
+        chave = (nome, json.dumps(args, sort_keys=True))
+        guardar = contexto is not None and nome in self.FERRAMENTAS_REAPROVEITAVEIS
+        if guardar:
+            resposta = self.conversations.resultado(contexto, chave)
+            if resposta is not None:
+                print(f"🧵 Reaproveitando resultado da conversa: {nome}({args})", file=sys.stderr)
+                return resposta
+        print(f"🔧 Executando: {nome}({args})", file=sys.stderr)
+        resposta = self._format_response(nome, getattr(self.db_tools, nome)(**args))
+        if guardar and not resposta.startswith("❌"):
+            self.conversations.guardar_resultado(contexto, chave, resposta)
+        return resposta
+
+    def _plan(self, user_message: str, fluxo: str, modelos: list, ferramenta: tuple = None, contexto=None):
+        """Busca os dados do fluxo e retorna a resposta pronta ou a requisição de chat."""
+        if fluxo == self.FLUXO_FERRAMENTA:
+            nome, args = ferramenta
+            return self._executar_ferramenta(nome, args, contexto)
+
+        if fluxo == self.FLUXO_COMPARACAO:
+            # Uma única busca para todos os modelos da comparação
+            dados = self._buscar_detalhes(modelos, contexto)
+            return self._comparison_request(user_message, [dados.get(modelo) for modelo in modelos])
+
+        if fluxo == self.FLUXO_TECNICO:
+            dados = self._buscar_detalhes(modelos[:1], contexto)[modelos[0]]
+            return self._humanize_request(user_message, modelos[0], dados)
+
+        if fluxo in (self.FLUXO_TOOLS, self.FLUXO_VENDAS):
+            print("🤖 Usando IA para escolher a melhor ferramenta...", file=sys.stderr)
+            response = self._chat(self._tools_request(user_message, fluxo), fluxo)
+            tool_calls = response.choices[0].message.tool_calls
+            if tool_calls:
+                return self._execute_tool_calls(tool_calls, contexto)
+            # MUDANÇA CRÍTICA 4: Fallback para RAG
+            print("⚠️ IA não acionou ferramenta. Acionando RAG como fallback.", file=sys.stderr)
+            return self._plan(user_message, self.FLUXO_RAG, [], contexto=contexto)
+
+        # Pergunta quase igual a uma já respondida: uma busca de embedding em vez de uma chamada ao Groq
+        em_cache = self._resposta_em_cache(user_message, modelos, contexto)
+        if em_cache is not None:
+            return em_cache
+        search_results = self.retriever.search(user_message, n_results=2, modelos=modelos)
+        return self._rag_request(user_message, search_results, self._historico_rag(user_message, contexto))
+
+    async def _aplan(self, user_message: str, fluxo: str, modelos: list, ferramenta: tuple = None, contexto=None):
+        """Equivalente assíncrono de _plan."""
+        if fluxo == self.FLUXO_FERRAMENTA:
+            nome, args = ferramenta
+            return await asyncio.to_thread(self._executar_ferramenta, nome, args, contexto)
+
+        if fluxo == self.FLUXO_COMPARACAO:
+            dados = await asyncio.to_thread(self._buscar_detalhes, modelos, contexto)
+            return self._comparison_request(user_message, [dados.get(modelo) for modelo in modelos])
+
+        if fluxo == self.FLUXO_TECNICO:
+            dados = await asyncio.to_thread(self._buscar_detalhes, modelos[:1], contexto)
+            return self._humanize_request(user_message, modelos[0], dados[modelos[0]])
+
+        if fluxo in (self.FLUXO_TOOLS, self.FLUXO_VENDAS):
+            print("🤖 Usando IA para escolher a melhor ferramenta...", file=sys.stderr)
+            response = await self._achat(self._tools_request(user_message, fluxo), fluxo)
+            tool_calls = response.choices[0].message.tool_calls
+            if tool_calls:
+                return await self._aexecute_tool_calls(tool_calls, contexto)
+            print("⚠️ IA não acionou ferramenta. Acionando RAG como fallback.", file=sys.stderr)
+            return await self._aplan(user_message, self.FLUXO_RAG, [], contexto=contexto)
+
+        em_cache = await asyncio.to_thread(self._resposta_em_cache, user_message, modelos, contexto)
+        if em_cache is not None:
+            return em_cache
+        search_results = await asyncio.to_thread(self.retriever.search, user_message, 2, modelos)
+        return self._rag_request(user_message, search_results, self._historico_rag(user_message, contexto))
+
+    @staticmethod
+    def _historico(contexto) -> list:
+        # Só as duas últimas trocas: suficiente para continuações, sem inflar o prompt
+        return contexto.historico(2) if contexto is not None else []
+
+    def _historico_rag(self, user_message: str, contexto=None) -> list:
+        """
+        Histórico do fluxo RAG: só continuações ("e ele?") levam as trocas anteriores.
+        Perguntas autônomas vão sem histórico, para que a resposta (que pode ir para o
+        cache e ser servida a outros remetentes) não dependa nem cite a conversa de ninguém.
+        """
+        return [] if self._pergunta_autonoma(user_message, contexto) else self._historico(contexto)
+
+    def _prazo(self, fluxo: str = None):
+        return self.prazos_llm.get(fluxo)
+
+    def _chat(self, request: dict, fluxo: str = None):
+        """Envia uma requisição de chat ao Groq dentro do prazo do fluxo."""
+        with metrics.medir("llm", fluxo or ""):
+            response = self.llm.create(request, self._prazo(fluxo))
+        self.prompt_budget.registrar_uso(fluxo, getattr(response, "usage", None))
+        return response
+
+    async def _achat(self, request: dict, fluxo: str = None):
+        """Envia uma requisição de chat ao Groq sem bloquear o event loop."""
+        with metrics.medir("llm", fluxo or ""):
+            response = await self.llm.acreate(request, self._prazo(fluxo))
+        self.prompt_budget.registrar_uso(fluxo, getattr(response, "usage", None))
+        return response
+
+    def _chat_stream(self, request: dict, fluxo: str = None):
+        """
+        Envia a requisição com stream=True e gera os tokens conforme chegam.
+        O tempo até o primeiro token é o que o cliente percebe como espera.
+        """
+        inicio = time.perf_counter()
+        primeiro = True
+        try:
+            for chunk in self.llm.stream(request, self._prazo(fluxo)):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if primeiro:
+                        metrics.ESTAGIOS.observe(time.perf_counter() - inicio, stage="llm_primeiro_token", fluxo=fluxo or "")
+                        primeiro = False
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            metrics.contar_erro("llm", fluxo or "")
+            raise
+
+    async def _achat_stream(self, request: dict, fluxo: str = None):
+        inicio = time.perf_counter()
+        primeiro = True
+        try:
+            async for chunk in self.llm.astream(request, self._prazo(fluxo)):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if primeiro:
+                        metrics.ESTAGIOS.observe(time.perf_counter() - inicio, stage="llm_primeiro_token", fluxo=fluxo or "")
+                        primeiro = False
+                    yield chunk.choices[0].delta.content
+        except Exception:
+            metrics.contar_erro("llm", fluxo or "")
+            raise
+
+    def _complete(self, plano, fluxo: str = None) -> str:
+        """Resolve um plano: devolve a resposta pronta ou o texto gerado pelo Groq."""
+        if isinstance(plano, str):
+            return plano
+        return self._chat(plano, fluxo).choices[0].message.content
+
+    async def _acomplete(self, plano, fluxo: str = None) -> str:
+        if isinstance(plano, str):
+            return plano
+        response = await self._achat(plano, fluxo)
+        return response.choices[0].message.content
+
+    def _ficha_compacta(self, dados: list) -> str:
+        """Ficha de UM modelo para ir no prompt: especificações, preço e destaques, sem URLs de fotos."""
+        p = dados[0]
+        linhas = [f"{p.get('modelo', 'Modelo')} ({p.get('fabricante', 'Fabricante')})"]
+        for campo, valor in (p.get('especificacoes_tecnicas') or {}).items():
+            linhas.append(f"{campo.replace('_', ' ')}: {formatar_valor(valor)}")
+        info_geral = p.get('info_geral') or {}
+        preco = info_geral.get('preco') or info_geral.get('preco_brasil_atual')
+        if preco:
+            linhas.append(f"preço: {formatar_valor(preco, 'R$')}")
+        if p.get('pontos_fortes'):
+            linhas.append(f"pontos fortes: {', '.join(p['pontos_fortes'][:3])}")
+        return "\n".join(linhas)
+
+    def _compactar(self, fluxo: str, montar, documentos: list, originais: list = None) -> dict:
+        """
+        Monta a requisição com `montar(documentos)`, cortando os documentos para
+        caber no orçamento de tokens do fluxo, e registra quanto foi economizado
+        em relação aos `originais` (padrão: os próprios documentos sem corte).
+        """
+        fixo = tokens_da_requisicao(montar([]))
+        request = montar(ajustar_documentos(documentos, self.prompt_budget.orcamento(fluxo) - fixo))
+        originais = documentos if originais is None else originais
+        self.prompt_budget.medir(fluxo, request, tokens_da_requisicao(montar(originais)))
+        return request
+
+    def _comparison_request(self, user_message: str, dados_por_modelo: list):
+        """Monta a requisição de comparação (FLUXO 1.1)."""
+        encontrados = [dados for dados in dados_por_modelo if dados and "erro" not in dados[0]]
+        if not encontrados:
+            return "😕 Não consegui encontrar dados para os modelos solicitados. Pode tentar outros?"
+
+        def montar(fichas):
+            dados_formatados = '\n---\n'.join(fichas)
+            prompt_comparacao = f"""O usuário pediu para comparar: "{user_message}"
 
 Dados dos produtos:
 
@@ -355,153 +870,172 @@ Dados dos produtos:
 ---
 
 Sua tarefa: Crie uma tabela comparativa em markdown ou uma lista clara comparando os pontos principais (câmera, processador, preço, etc.) dos produtos. Seja objetivo e use apenas os dados fornecidos."""
+            return {
+                "messages": [
+                    {"role": "system", "content": "Você é um especialista que cria comparações claras de produtos."},
+                    {"role": "user", "content": prompt_comparacao}
+                ],
+                "temperature": 0.1,
+                "max_tokens": 1024,
+            }
 
-                comparacao = self.client.chat.completions.create(
-                    messages=[
-                        {"role": "system", "content": "Você é um especialista que cria comparações claras de produtos."},
-                        {"role": "user", "content": prompt_comparacao}
-                    ],
-                    model=self.model_name,
-                    temperature=0.1,
-                    max_tokens=1024
-                )
-                return comparacao.choices[0].message.content
+        # Fichas compactas (sem fotos) no lugar do card completo formatado para o WhatsApp
+        return self._compactar(
+            self.FLUXO_COMPARACAO, montar,
+            [self._ficha_compacta(dados) for dados in encontrados],
+            [self._format_response('get_smartphone_details_and_photos', dados) for dados in encontrados],
+        )
 
-            # FLUXO 1.2: Pergunta sobre UM modelo
-            else:
-                modelo_mencionado = modelos_mencionados[0]
-                print(f"✅ FLUXO DETERMINÍSTICO: Pergunta técnica sobre {modelo_mencionado}", file=sys.stderr)
-                
-                try:
-                    # Executar ferramenta DIRETAMENTE
-                    dados = self.db_tools.get_smartphone_details_and_photos(modelo_mencionado)
-                    
-                    if dados and len(dados) > 0:
-                        resposta_formatada = self._format_response('get_smartphone_details_and_photos', dados)
-                        
-                        # Agora usar IA apenas para HUMANIZAR a resposta
-                        prompt_humanizar = f"""O usuário perguntou: "{user_message}"
+    def _humanize_request(self, user_message: str, modelo: str, dados: list):
+        """
+        Monta a requisição que humaniza os dados de UM modelo (FLUXO 1.2), ou
+        devolve a resposta pronta quando a pergunta cita campos da ficha.
+        """
+        if not dados:
+            return f"😕 Desculpe, não encontrei dados sobre o {modelo} em nosso sistema. Posso te ajudar com outro modelo?"
+
+        resposta_formatada = self._format_response('get_smartphone_details_and_photos', dados)
+
+        # Pergunta objetiva sobre campos da ficha: resposta por template, sem LLM
+        resposta_direta = responder_especificacao(user_message, dados[0], resposta_formatada)
+        if resposta_direta:
+            print(f"⚡ Resposta direta da ficha do {modelo}", file=sys.stderr)
+            return resposta_direta
+
+        # Pergunta aberta: usar IA apenas para HUMANIZAR a resposta
+        def montar(fichas):
+            prompt_humanizar = f"""O usuário perguntou: "{user_message}"
 
 Dados reais do banco de dados:
-{resposta_formatada}
+{''.join(fichas)}
 
 Sua tarefa: Responda de forma AMIGÁVEL e CONVERSACIONAL usando APENAS os dados acima. Não invente nada. Seja breve (máximo 5 linhas)."""
+            return {
+                "messages": [
+                    {"role": "system", "content": "Você é um vendedor amigável. Use APENAS os dados fornecidos."},
+                    {"role": "user", "content": prompt_humanizar}
+                ],
+                "temperature": 0.3,
+                "max_tokens": 300,
+            }
 
-                        humanizacao = self.client.chat.completions.create(
-                            messages=[
-                                {"role": "system", "content": "Você é um vendedor amigável. Use APENAS os dados fornecidos."},
-                                {"role": "user", "content": prompt_humanizar}
-                            ],
-                            model=self.model_name,
-                            temperature=0.3,
-                            max_tokens=300
-                        )
-                        
-                        return humanizacao.choices[0].message.content
-                    
-                    else:
-                        return f"😕 Desculpe, não encontrei dados sobre o {modelo_mencionado} em nosso sistema. Posso te ajudar com outro modelo?"
-                        
-                except Exception as e:
-                    print(f"🐞 Erro no fluxo determinístico: {e}", file=sys.stderr)
-                    return f"🐞 Ocorreu um erro ao buscar dados: {e}"
-        
-        # FLUXO 2: Pergunta técnica SEM modelo claro - Usar IA com tools
-        elif pergunta_tecnica:
-            print("⚠️ FLUXO IA COM TOOLS: Pergunta técnica sem modelo claro", file=sys.stderr)
-            return self._process_with_tools(user_message)
-        
-        # FLUXO 3: Pergunta sobre vendas ou finanças
-        elif any(palavra in user_message_lower for palavra in ['vendido', 'vendas', 'mais vendeu', 'campeão', 'líder', 'top', 'receita', 'faturamento', 'arrecadação']):
-            print("📊 FLUXO VENDAS/FINANÇAS", file=sys.stderr)
-            return self._process_with_tools(user_message)
-        
-        # FLUXO 4: Pergunta genérica/subjetiva - Usar RAG
-        else:
-            print("💬 FLUXO RAG: Pergunta genérica", file=sys.stderr)
-            return self._process_with_rag(user_message)
+        return self._compactar(self.FLUXO_TECNICO, montar, [self._ficha_compacta(dados)], [resposta_formatada])
 
-    def _process_with_tools(self, user_message: str) -> str:
+    def _tools_request(self, user_message: str, fluxo: str = None) -> dict:
         """
-        MUDANÇA CRÍTICA 4: Forçar o uso de RAG se a IA não escolher uma ferramenta.
+        Monta a requisição em que a IA escolhe a ferramenta (FLUXOS 2 e 3).
+        Usa o system prompt e os esquemas completos se couberem no orçamento;
+        senão, a variante compacta.
         """
-        print("🤖 Usando IA para escolher a melhor ferramenta...", file=sys.stderr)
-        
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": self.system_prompt},
+        fluxo = fluxo or self.FLUXO_TOOLS
+
+        def montar(system_prompt, tools):
+            return {
+                "messages": [
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_message}
                 ],
-                tools=self.tools,
-                tool_choice="auto",
-                temperature=0.1, # MUDANÇA CRÍTICA 2: Temperatura baixa para consistência
-                max_tokens=1024
-            )
-
-            response_message = response.choices[0].message
-            tool_calls = response_message.tool_calls
+                "tools": tools,
+                "tool_choice": "auto",
+                "temperature": 0.1,  # MUDANÇA CRÍTICA 2: Temperatura baixa para consistência
+                "max_tokens": 1024,
+            }
 
-            if tool_calls:
-                return self._execute_tool_calls(tool_calls)
-            else:
-                # MUDANÇA CRÍTICA 4: Fallback para RAG
-                print("⚠️ IA não acionou ferramenta. Acionando RAG como fallback.", file=sys.stderr)
-                return self._process_with_rag(user_message)
-
-        except Exception as e:
-            print(f"🐞 Erro ao processar com ferramentas: {e}", file=sys.stderr)
-            return f"🐞 Desculpe, ocorreu um erro ao tentar usar minhas ferramentas: {e}"
-
-    def _execute_tool_calls(self, tool_calls: list) -> str:
-        """Executa as chamadas de ferramentas."""
-        available_tools = {
-            func_name: getattr(self.db_tools, func_name) 
-            for func_name in dir(self.db_tools) 
-            if callable(getattr(self.db_tools, func_name)) and not func_name.startswith("_")
-        }
-        
-        messages.append(response_message)
+        completo = montar(self.system_prompt, self.tools)
+        tokens_completo = tokens_da_requisicao(completo)
+        request = completo
+        if tokens_completo > self.prompt_budget.orcamento(fluxo):
+            request = montar(self.system_prompt_compacto, self.tools_compactas)
+        self.prompt_budget.medir(fluxo, request, tokens_completo)
+        return request
 
+    def _preparar_tool_calls(self, tool_calls: list) -> list:
+        """
+        Valida as chamadas de ferramenta do LLM na ordem em que vieram.
+        Retorna [(nome, args, erro)], sem repetir chamadas idênticas.
+        """
+        chamadas, vistas = [], set()
         for tool_call in tool_calls:
-            function_name = tool_call.function.name
+            nome = tool_call.function.name
             try:
-                print(f"🔧 Executando: {function_name}({tool_call.function.arguments})", file=sys.stderr)
-                
-                if function_name not in available_tools:
-                    return f"❌ Erro: Ferramenta '{function_name}' não encontrada."
+                args = tool_registry.preparar_chamada(nome, tool_call.function.arguments)
+            except ValueError as e:
+                print(f"🐞 Chamada de ferramenta inválida: {e}", file=sys.stderr)
+                chamadas.append((nome, None, f"❌ Erro: {e}"))
+                continue
+            chave = (nome, json.dumps(args, sort_keys=True))
+            if chave in vistas:
+                continue
+            vistas.add(chave)
+            chamadas.append((nome, args, None))
+        return chamadas
 
-                function_to_call = available_tools[function_name]
-                function_args = json.loads(tool_call.function.arguments)
-                function_response = function_to_call(**function_args)
+    def _executar_chamada(self, nome: str, args: dict, contexto=None) -> str:
+        try:
+            return self._executar_ferramenta(nome, args, contexto)
+        except Exception as e:
+            print(f"🐞 Erro ao executar ferramenta: {e}", file=sys.stderr)
+            return f"❌ Erro ao executar {nome}: {e}"
 
-                return self._format_response(function_name, function_response)
+    def _execute_tool_calls(self, tool_calls: list, contexto=None) -> str:
+        """
+        Executa TODAS as chamadas de ferramentas da resposta do LLM em paralelo e
+        junta os resultados, na ordem das chamadas, em uma única resposta.
+        Uma chamada que falha vira uma linha de erro sem derrubar as outras.
+        """
+        chamadas = self._preparar_tool_calls(tool_calls)
+        validas = [(nome, args) for nome, args, erro in chamadas if erro is None]
+        if len(validas) > 1:
+            print(f"🔀 Executando {len(validas)} ferramentas em paralelo", file=sys.stderr)
+        # Cada thread leva uma cópia do contexto, para as métricas saberem o fluxo
+        futuros = {
+            i: self._tool_executor.submit(contextvars.copy_context().run, self._executar_chamada, nome, args, contexto)
+            for i, (nome, args, erro) in enumerate(chamadas) if erro is None
+        }
+        partes = [erro if erro is not None else futuros[i].result() for i, (_, _, erro) in enumerate(chamadas)]
+        return "\n\n".join(partes)
 
-            except Exception as e:
-                print(f"🐞 Erro ao executar ferramenta: {e}", file=sys.stderr)
-                return f"❌ Erro ao executar {function_name}: {e}"
+    async def _aexecute_tool_calls(self, tool_calls: list, contexto=None) -> str:
+        """Equivalente assíncrono de _execute_tool_calls."""
+        chamadas = self._preparar_tool_calls(tool_calls)
+        validas = [(nome, args) for nome, args, erro in chamadas if erro is None]
+        if len(validas) > 1:
+            print(f"🔀 Executando {len(validas)} ferramentas em paralelo", file=sys.stderr)
+        resultados = iter(await asyncio.gather(*(
+            asyncio.to_thread(self._executar_chamada, nome, args, contexto) for nome, args in validas
+        )))
+        partes = [erro if erro is not None else next(resultados) for _, _, erro in chamadas]
+        return "\n\n".join(partes)
 
-    def _process_with_rag(self, user_message: str) -> str:
-        """Processa usando RAG para perguntas subjetivas."""
-        try:
-            search_results = self.vector_store.search(user_message, n_results=2)
-            context_docs = search_results.get('documents', [[]])[0]
-            
-            if not context_docs:
-                # Sem contexto RAG, resposta genérica
-                response = self.client.chat.completions.create(
-                    messages=[
+    def _rag_request(self, user_message: str, search_results: dict, historico: list = None) -> dict:
+        """
+        Monta a requisição do fluxo RAG para perguntas subjetivas.
+        `historico` são as últimas trocas da conversa, enviadas antes da pergunta.
+        Documentos e histórico são cortados para caber no orçamento do fluxo.
+        """
+        historico_original = historico or []
+        # Respostas anteriores podem ser fichas longas: basta o começo para dar contexto
+        historico = [dict(m, content=cortar_texto(m["content"], 120)) for m in historico_original]
+        context_docs = search_results.get('documents', [[]])[0]
+        
+        if not context_docs:
+            # Sem contexto RAG, resposta genérica
+            def montar_generico(hist):
+                return {
+                    "messages": [
                         {"role": "system", "content": f"Você é Fabio, vendedor de smartphones. Modelos disponíveis: {', '.join(self.modelos_validos)}. Seja breve e amigável."},
+                        *hist,
                         {"role": "user", "content": user_message}
                     ],
-                    model=self.model_name,
-                    temperature=0.7,
-                    max_tokens=300
-                )
-                return response.choices[0].message.content
-            
-            context_str = "\n- ".join(context_docs)
+                    "temperature": 0.7,
+                    "max_tokens": 300,
+                }
+            request = montar_generico(historico)
+            self.prompt_budget.medir(self.FLUXO_RAG, request, tokens_da_requisicao(montar_generico(historico_original)))
+            return request
+        
+        def montar(docs, hist=historico):
+            context_str = "\n- ".join(docs)
             rag_prompt = f'''Contexto de documentos:
 - {context_str}
 
@@ -510,21 +1044,65 @@ Modelos disponíveis: {', '.join(self.modelos_validos)}
 Pergunta: {user_message}
 
 Responda de forma amigável e útil, mas se mencionar qualquer especificação técnica, deixe claro que são informações gerais e que você pode buscar dados precisos se o cliente quiser.'''
-
-            final_response = self.client.chat.completions.create(
-                messages=[
+            return {
+                "messages": [
                     {"role": "system", "content": "Você é um vendedor prestativo."},
+                    *hist,
                     {"role": "user", "content": rag_prompt}
                 ],
-                model=self.model_name,
-                temperature=0.7,
-                max_tokens=512
-            )
-            return final_response.choices[0].message.content
+                "temperature": 0.7,
+                "max_tokens": 512,
+            }
 
-        except Exception as e:
-            print(f"🐞 Erro no RAG: {e}", file=sys.stderr)
-            return "Desculpe, tive um problema ao processar sua pergunta. Pode reformular?"
+        fixo = tokens_da_requisicao(montar([]))
+        request = montar(ajustar_documentos(context_docs, self.prompt_budget.orcamento(self.FLUXO_RAG) - fixo))
+        self.prompt_budget.medir(self.FLUXO_RAG, request, tokens_da_requisicao(montar(context_docs, historico_original)))
+        return request
+
+    def _coletar_metricas(self):
+        """Estatísticas mantidas pelos componentes, lidas a cada coleta do /metrics."""
+        for fluxo, linha in self.prompt_budget.stats().items():
+            yield ("chatbot_llm_tokens_total", "counter", "Tokens informados pelo Groq.",
+                   {"fluxo": fluxo, "tipo": "prompt"}, linha["tokens_prompt"])
+            yield ("chatbot_llm_tokens_total", "counter", "Tokens informados pelo Groq.",
+                   {"fluxo": fluxo, "tipo": "resposta"}, linha["tokens_resposta"])
+            yield ("chatbot_prompt_tokens_estimated_total", "counter", "Tokens de prompt estimados antes do envio.",
+                   {"fluxo": fluxo}, linha["tokens_estimados"])
+            yield ("chatbot_prompt_tokens_saved_total", "counter", "Tokens de prompt economizados pela compactação.",
+                   {"fluxo": fluxo}, linha["tokens_economizados"])
+            yield ("chatbot_prompt_over_budget_total", "counter", "Prompts acima do orçamento mesmo após compactar.",
+                   {"fluxo": fluxo}, linha["acima_do_orcamento"])
+
+        for chave, valor in self.llm.stats().items():
+            if chave.startswith("disjuntor:"):
+                yield ("chatbot_llm_circuit_open", "gauge", "1 se o disjuntor do modelo está aberto.",
+                       {"modelo": chave.split(":", 1)[1]}, int(valor == "aberto"))
+            elif chave.startswith("p95_s:"):
+                yield ("chatbot_llm_p95_seconds", "gauge", "p95 recente das respostas do modelo (base do hedging).",
+                       {"modelo": chave.split(":", 1)[1]}, valor)
+            else:
+                yield ("chatbot_llm_events_total", "counter", "Chamadas, retentativas, hedges e reservas do cliente LLM.",
+                       {"evento": chave}, valor)
+
+        caches = {"embeddings": self.vector_store.query_cache.stats(), "respostas": self.answer_cache.stats()}
+        for nome, cache in caches.items():
+            yield ("chatbot_cache_hits_total", "counter", "Acertos de cache.", {"cache": nome}, cache["acertos"])
+            yield ("chatbot_cache_misses_total", "counter", "Faltas de cache.", {"cache": nome}, cache["erros"])
+            yield ("chatbot_cache_hit_ratio", "gauge", "Taxa de acerto do cache.", {"cache": nome}, cache["taxa_acerto"])
+            yield ("chatbot_cache_entries", "gauge", "Entradas no cache.", {"cache": nome}, cache["tamanho"])
+
+        for chave, valor in self.db_tools.pool_metrics().items():
+            tipo = "counter" if chave in ("checkouts", "timeouts", "reconexoes") else "gauge"
+            yield (f"chatbot_db_pool_{chave}", tipo, "Pool de conexões do PostgreSQL.", {}, valor)
+
+        yield ("chatbot_cache_invalidations_total", "counter", "Vezes que o cache de respostas foi descartado por mudança na coleção.",
+               {"cache": "respostas"}, self.answer_cache.invalidacoes)
+
+        yield ("chatbot_conversations", "gauge", "Conversas ativas em memória.", {}, len(self.conversations))
+
+    def token_stats(self) -> dict:
+        """Tokens por fluxo (estimados, reais do Groq e economizados pela compactação)."""
+        return self.prompt_budget.stats()
 
 
 def main():
@@ -533,9 +1111,19 @@ def main():
             print("Erro: Pergunta não fornecida.", file=sys.stderr)
             sys.exit(1)
 
+        # Modo daemon: mantém um agente aquecido respondendo perguntas da CLI
+        if sys.argv[1] == "--daemon":
+            agent = AIAgent()
+            agent.warm_up()
+            agent_daemon.serve(agent)
+            return
+
         question = sys.argv[1]
-        agent = AIAgent()
-        response = agent.process_message(question)
+        # Se houver um daemon rodando, a pergunta não paga o carregamento dos modelos
+        response = agent_daemon.ask(question)
+        if response is None:
+            agent = AIAgent()
+            response = agent.process_message(question)
         print(response)
 
     except Exception as e:
@@ -543,4 +1131,4 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,8 +1,20 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from ai_agent import AIAgent
+from coalescer import criar_coalescer
+from inbound_queue import criar_fila
+from streaming import evento_sse
+import metrics
 
 app = Flask(__name__)
 agent = AIAgent()
+# Carrega modelos, ChromaDB e catálogo antes de aceitar a primeira mensagem
+agent.warm_up()
+# Com WEBHOOK_QUEUE_PATH, o /webhook só enfileira e as respostas saem por callback
+fila = criar_fila(agent.process_message)
+if fila is not None:
+    fila.start()
+# Rajadas do mesmo remetente viram um turno só (na fila, isso é feito pelos workers)
+coalescer = criar_coalescer(agent.process_message) if fila is None else None
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
@@ -10,12 +22,52 @@ def webhook():
     if not data or 'message' not in data:
         return jsonify({'status': 'error', 'message': 'Invalid data'}), 400
 
+    if fila is not None:
+        corpo, status = fila.aceitar(data)
+        return jsonify(corpo), status
+
     user_message = data['message']
+    # Identificador do remetente (ex.: número do WhatsApp) para manter o contexto da conversa
+    sender_id = data.get('sender')
     
     # Processa a mensagem usando o agente de IA
-    response_message = agent.process_message(user_message)
+    if coalescer is not None:
+        response_message = coalescer.enviar(user_message, sender_id)
+        if response_message is None:
+            # Absorvida por uma mensagem mais nova do mesmo remetente, que leva a resposta
+            return jsonify({'status': 'coalesced', 'response': None})
+    else:
+        response_message = agent.process_message(user_message, sender_id)
     
     return jsonify({'response': response_message})
 
+@app.route('/webhook/stream', methods=['POST'])
+def webhook_stream():
+    """Mesma entrada do /webhook, mas a resposta sai em pedaços via Server-Sent Events."""
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return jsonify({'status': 'error', 'message': 'Invalid data'}), 400
+
+    user_message = data['message']
+    sender_id = data.get('sender')
+
+    def gerar():
+        for pedaco in agent.stream_message(user_message, sender_id):
+            yield evento_sse(pedaco)
+        yield evento_sse(fim=True)
+
+    return Response(stream_with_context(gerar()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Tokens de prompt por fluxo (estimados, reais e economizados) e estado das chamadas ao Groq."""
+    return jsonify({'tokens': agent.token_stats(), 'llm': agent.llm.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metricas():
+    """Métricas no formato do Prometheus: tempos por estágio e fluxo, tokens, caches e erros."""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
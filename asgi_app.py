@@ -0,0 +1,99 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from ai_agent import AIAgent
+from coalescer import criar_coalescer
+from inbound_queue import criar_fila
+import metrics
+from streaming import evento_sse
+
+app = FastAPI()
+agent = AIAgent()
+# Com WEBHOOK_QUEUE_PATH, o /webhook só enfileira e as respostas saem por callback
+fila = criar_fila(agent.process_message)
+# Rajadas do mesmo remetente viram um turno só (na fila, isso é feito pelos workers)
+coalescer = criar_coalescer(agent.aprocess_message, assincrono=True) if fila is None else None
+
+@app.on_event("startup")
+async def inicializar():
+    # Postgres e ChromaDB são síncronos e rodam em threads (asyncio.to_thread).
+    # O executor padrão é pequeno demais para centenas de conversas simultâneas.
+    max_workers = int(os.getenv("ASGI_IO_THREADS", "64"))
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=max_workers))
+    # Carrega modelos, ChromaDB e catálogo antes de aceitar a primeira mensagem
+    await asyncio.to_thread(agent.warm_up)
+    if fila is not None:
+        fila.start()
+
+@app.on_event("shutdown")
+async def finalizar():
+    if fila is not None:
+        await asyncio.to_thread(fila.stop)
+
+@app.post('/webhook')
+async def webhook(request: Request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or 'message' not in data:
+        return JSONResponse({'status': 'error', 'message': 'Invalid data'}, status_code=400)
+
+    if fila is not None:
+        # Gravação síncrona no SQLite: fora do event loop
+        corpo, status = await asyncio.to_thread(fila.aceitar, data)
+        return JSONResponse(corpo, status_code=status)
+
+    user_message = data['message']
+    # Identificador do remetente (ex.: número do WhatsApp) para manter o contexto da conversa
+    sender_id = data.get('sender')
+
+    # Processa a mensagem sem bloquear o event loop enquanto o Groq responde
+    if coalescer is not None:
+        response_message = await coalescer.enviar(user_message, sender_id)
+        if response_message is None:
+            # Absorvida por uma mensagem mais nova do mesmo remetente, que leva a resposta
+            return {'status': 'coalesced', 'response': None}
+    else:
+        response_message = await agent.aprocess_message(user_message, sender_id)
+
+    return {'response': response_message}
+
+@app.post('/webhook/stream')
+async def webhook_stream(request: Request):
+    """Mesma entrada do /webhook, mas a resposta sai em pedaços via Server-Sent Events."""
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or 'message' not in data:
+        return JSONResponse({'status': 'error', 'message': 'Invalid data'}, status_code=400)
+
+    user_message = data['message']
+    sender_id = data.get('sender')
+
+    async def gerar():
+        async for pedaco in agent.astream_message(user_message, sender_id):
+            yield evento_sse(pedaco)
+        yield evento_sse(fim=True)
+
+    return StreamingResponse(gerar(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.get('/stats')
+async def stats():
+    """Tokens de prompt por fluxo (estimados, reais e economizados) e estado das chamadas ao Groq."""
+    return {'tokens': agent.token_stats(), 'llm': agent.llm.stats()}
+
+@app.get('/metrics')
+async def metricas():
+    """Métricas no formato do Prometheus: tempos por estágio e fluxo, tokens, caches e erros."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
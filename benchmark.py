@@ -0,0 +1,532 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark offline do chatbot: vazão e latência (p50/p95/p99) por fluxo.
+
+Roda sem cota do Groq e sem o banco de produção:
+- o LLM é o servidor falso de fake_groq_server.py (latência configurável);
+- o Postgres é um banco LOCAL (`BENCH_DATABASE_URL`), semeado com dados
+  sintéticos por `--semear`;
+- a busca semântica usa o ChromaDB já gravado em ./data/chroma_db.
+
+Modos:
+- `agente`: chama `AIAgent.process_message` direto, em N threads;
+- `async`: chama `AIAgent.aprocess_message` com N tarefas concorrentes;
+- `http`: envia POST para um `/webhook` já em execução (Flask ou ASGI), que
+  deve ter sido iniciado com `GROQ_BASE_URL` e `DATABASE_URL` locais.
+
+    python benchmark.py --semear --modo agente --mensagens 300 --concorrencia 8 --json atual.json
+    python benchmark.py --modo http --url http://127.0.0.1:5000/webhook --comparar atual.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import urlparse
+
+from fake_groq_server import FakeGroqServer, argumentos_latencia, latencia_dos_argumentos
+
+# Roteiros de conversa por categoria. Cada roteiro é enviado em ordem pelo
+# mesmo remetente; a categoria de cada mensagem é o fluxo que ela exercita.
+ROTEIROS = {
+    "tecnico": [
+        [("tecnico", "Qual o processador do Xiaomi 13T?")],
+        [("tecnico", "Quanto custa o iPhone 15 Pro Max?")],
+        [("tecnico", "Quantos mAh tem a bateria do Motorola Moto G54?")],
+        [("tecnico", "Qual o tamanho da tela do Samsung Galaxy S24 Ultra?")],
+        [("tecnico", "Quanta memória RAM tem o Redmi Note 13?")],
+        [("tecnico", "Me passa a ficha técnica do Galaxy A54")],
+        [("tecnico", "O Xiaomi 13T vale a pena pra quem joga muito?")],
+        [("tecnico", "A câmera do iPhone 15 Pro Max é boa pra fotos à noite?")],
+    ],
+    "comparacao": [
+        [("comparacao", "Qual a diferença entre Samsung Galaxy A54 e Xiaomi 13T?")],
+        [("comparacao", "iPhone 15 Pro Max ou Galaxy S24 Ultra, qual tem a melhor câmera?")],
+        [("comparacao", "Compare o Moto G54 com o Redmi Note 13")],
+        [("comparacao", "Xiaomi 13T vs Samsung Galaxy S24 Ultra: qual a bateria dura mais?")],
+    ],
+    "ferramenta": [
+        [("ferramenta", "Qual foi o celular mais vendido em março de 2024?")],
+        [("ferramenta", "Quais os 3 mais vendidos de 2024?")],
+        [("ferramenta", "Qual foi o faturamento de janeiro de 2024?")],
+        [("ferramenta", "Quantos Xiaomi 13T foram vendidos em junho de 2024?")],
+        [("ferramenta", "Top 5 mais vendidos em 12/2024")],
+    ],
+    "tools": [
+        [("tools", "Quanto a loja faturou no total?")],
+        [("tools", "Como foram as vendas do Galaxy A54?")],
+        [("tools", "Qual fabricante vendeu mais?")],
+        [("tools", "Qual o celular com o melhor processador que vocês têm?")],
+    ],
+    "rag": [
+        [("rag", "Oi, tudo bem?")],
+        [("rag", "Qual celular vocês recomendam pra minha mãe que só usa WhatsApp?")],
+        [("rag", "Tenho até 2 mil reais, qual celular compro?")],
+        [("rag", "Vocês parcelam no cartão?")],
+        [("rag", "Preciso de um celular com bateria que dure o dia todo")],
+        [("rag", "Qual é melhor pra tirar foto, Samsung ou Xiaomi?")],
+    ],
+    "continuacao": [
+        [("tecnico", "Qual o processador do Samsung Galaxy A54?"), ("continuacao", "E a bateria dele?")],
+        [("tecnico", "Quanto custa o Xiaomi 13T?"), ("continuacao", "E quanta RAM ele tem?")],
+        [("comparacao", "Compare o iPhone 15 Pro Max com o Galaxy S24 Ultra"),
+         ("continuacao", "E qual tem a melhor tela?")],
+    ],
+}
+
+# Peso de cada categoria no sorteio dos roteiros (aproxima o tráfego real)
+PESOS = {"tecnico": 30, "comparacao": 12, "ferramenta": 18, "tools": 10, "rag": 22, "continuacao": 8}
+
+# Início das mensagens de erro de AIAgent.MENSAGENS_ERRO
+PREFIXOS_ERRO = ("🐞", "Desculpe, tive um problema")
+
+HOSTS_LOCAIS = {"localhost", "127.0.0.1", "::1", ""}
+
+
+# ---------------------------------------------------------------------------
+# Banco sintético
+# ---------------------------------------------------------------------------
+
+ESQUEMA = """
+    CREATE TABLE IF NOT EXISTS smartphones (
+        id SERIAL PRIMARY KEY,
+        modelo TEXT NOT NULL,
+        fabricante TEXT NOT NULL,
+        info_geral JSONB,
+        especificacoes_tecnicas JSONB,
+        performance_score NUMERIC,
+        categoria TEXT,
+        segmento TEXT
+    );
+    CREATE TABLE IF NOT EXISTS fotos (
+        id SERIAL PRIMARY KEY,
+        smartphone_id INTEGER REFERENCES smartphones(id) ON DELETE CASCADE,
+        url_imagem TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS vendas_smartphones (
+        id SERIAL PRIMARY KEY,
+        modelo TEXT NOT NULL,
+        fabricante TEXT NOT NULL,
+        mes INTEGER NOT NULL,
+        ano INTEGER NOT NULL,
+        unidades_vendidas INTEGER NOT NULL,
+        receita NUMERIC(14, 2) NOT NULL
+    );
+"""
+
+MODELOS_REAIS = [
+    ("iPhone 15 Pro Max", "Apple", "premium", "A17 Pro", 9499.0),
+    ("Samsung Galaxy S24 Ultra", "Samsung", "premium", "Snapdragon 8 Gen 3", 8999.0),
+    ("Xiaomi 13T", "Xiaomi", "intermediario_premium", "MediaTek Dimensity 8200-Ultra", 3299.0),
+    ("Samsung Galaxy A54", "Samsung", "intermediario", "Exynos 1380", 2199.0),
+    ("Xiaomi Redmi Note 13", "Xiaomi", "intermediario", "Snapdragon 685", 1399.0),
+    ("Motorola Moto G54", "Motorola", "entrada", "MediaTek Dimensity 7020", 1299.0),
+]
+
+FABRICANTES_SINTETICOS = {
+    "Samsung": "Galaxy", "Xiaomi": "Redmi", "Motorola": "Moto", "Realme": "Realme", "Asus": "Zenfone",
+}
+CHIPS = ["Snapdragon 7s Gen 2", "Dimensity 7050", "Exynos 1330", "Helio G99", "Snapdragon 6 Gen 1"]
+CORES = ["Preto", "Azul", "Verde", "Prata", "Lilás", "Grafite"]
+
+
+def _especificacoes(rnd: random.Random, chip: str, preco: float) -> dict:
+    return {
+        "processador": chip,
+        "ram": rnd.choice([4, 6, 8, 12]),
+        "armazenamento": rnd.choice([[128], [128, 256], [256, 512]]),
+        "camera_principal": f"{rnd.choice([48, 50, 64, 108, 200])} MP",
+        "camera_frontal": f"{rnd.choice([8, 12, 16, 32])} MP",
+        "bateria": rnd.choice([4000, 4500, 5000, 6000]),
+        "carregamento": f"{rnd.choice([18, 25, 33, 45, 67])}W",
+        "tela": f"{rnd.choice(['6,1', '6,5', '6,67', '6,8'])}\" {rnd.choice(['AMOLED', 'LCD', 'OLED'])} "
+                f"{rnd.choice([60, 90, 120])}Hz",
+        "so": rnd.choice(["Android 14", "Android 13"]),
+        "peso": rnd.randint(165, 235),
+        "conectividade": {"5g": preco > 1500, "nfc": rnd.random() > 0.3, "wifi": "Wi-Fi 6"},
+        "performance_score": round(rnd.uniform(5.5, 9.8), 1),
+        "categoria": "smartphone",
+        "segmento": "premium" if preco > 5000 else "intermediario" if preco > 1800 else "entrada",
+    }
+
+
+def gerar_catalogo(modelos_sinteticos: int, seed: int = 42) -> list:
+    """Os 6 modelos conhecidos pelo agente mais `modelos_sinteticos` modelos inventados."""
+    rnd = random.Random(seed)
+    catalogo = []
+    for modelo, fabricante, segmento, chip, preco in MODELOS_REAIS:
+        specs = _especificacoes(rnd, chip, preco)
+        specs["segmento"] = segmento
+        catalogo.append((modelo, fabricante, preco, specs))
+    fabricantes = list(FABRICANTES_SINTETICOS.items())
+    for i in range(modelos_sinteticos):
+        fabricante, linha = fabricantes[i % len(fabricantes)]
+        preco = float(rnd.randrange(899, 7999, 100))
+        catalogo.append((f"{fabricante} {linha} Bench {i + 1}", fabricante, preco,
+                         _especificacoes(rnd, rnd.choice(CHIPS), preco)))
+    return catalogo
+
+
+def _periodos(anos: int) -> list:
+    hoje = date.today()
+    return [(mes, ano) for ano in range(hoje.year - anos + 1, hoje.year + 1)
+            for mes in range(1, 13) if (ano, mes) <= (hoje.year, hoje.month)]
+
+
+def semear_banco(url: str, modelos_sinteticos: int = 200, anos: int = 3, seed: int = 42):
+    """
+    Recria o conteúdo das tabelas smartphones, fotos e vendas_smartphones com
+    dados sintéticos. APAGA o que houver nelas: use só em um banco local.
+    """
+    import psycopg2
+    from psycopg2.extras import Json, execute_values
+
+    from catalog import CANAL_CATALOGO
+    from db_migrations import aplicar_migracoes
+
+    rnd = random.Random(seed)
+    catalogo = gerar_catalogo(modelos_sinteticos, seed)
+    periodos = _periodos(anos)
+    conn = psycopg2.connect(url.split("?schema=")[0])
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ESQUEMA)
+        # Chave normalizada e índices, iguais aos de produção
+        aplicar_migracoes(conn)
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE fotos, vendas_smartphones, smartphones RESTART IDENTITY CASCADE;")
+            ids = execute_values(
+                cur,
+                """INSERT INTO smartphones (modelo, fabricante, info_geral, especificacoes_tecnicas,
+                                            performance_score, categoria, segmento)
+                   VALUES %s RETURNING id""",
+                [(modelo, fabricante,
+                  Json({"preco": preco, "cores": rnd.sample(CORES, 3), "lancamento": str(rnd.randint(2022, 2024))}),
+                  Json(specs), specs["performance_score"], specs["categoria"], specs["segmento"])
+                 for modelo, fabricante, preco, specs in catalogo],
+                fetch=True,
+            )
+            fotos = []
+            for (id_,), (modelo, _, _, _) in zip(ids, catalogo):
+                slug = modelo.lower().replace(" ", "-")
+                fotos += [(id_, f"https://example.com/fotos/{slug}-{k}.jpg") for k in (1, 2)]
+            execute_values(cur, "INSERT INTO fotos (smartphone_id, url_imagem) VALUES %s", fotos)
+
+            vendas = []
+            for modelo, fabricante, preco, _ in catalogo:
+                popularidade = rnd.uniform(50, 3000)
+                for mes, ano in periodos:
+                    unidades = max(0, int(rnd.gauss(popularidade, popularidade * 0.3)))
+                    vendas.append((modelo, fabricante, mes, ano, unidades, round(unidades * preco, 2)))
+            execute_values(
+                cur,
+                "INSERT INTO vendas_smartphones (modelo, fabricante, mes, ano, unidades_vendidas, receita) VALUES %s",
+                vendas, page_size=1000,
+            )
+            cur.execute(f"NOTIFY {CANAL_CATALOGO};")
+        conn.commit()
+        # Estatísticas novas para o planejador escolher os índices com o volume semeado
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE smartphones, fotos, vendas_smartphones;")
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"🌱 Banco semeado: {len(catalogo)} modelos, {len(catalogo) * 2} fotos, {len(vendas)} linhas de vendas",
+          file=sys.stderr)
+
+
+# ---------------------------------------------------------------------------
+# Carga
+# ---------------------------------------------------------------------------
+
+def sortear_roteiros(total_mensagens: int, pesos: dict, seed: int = 7) -> list:
+    """Roteiros (com remetente próprio) até somar `total_mensagens` mensagens."""
+    rnd = random.Random(seed)
+    categorias = [c for c in pesos if pesos[c] > 0 and c in ROTEIROS]
+    roteiros = []
+    mensagens = 0
+    while mensagens < total_mensagens:
+        categoria = rnd.choices(categorias, weights=[pesos[c] for c in categorias])[0]
+        roteiro = rnd.choice(ROTEIROS[categoria])
+        roteiros.append((f"bench-{len(roteiros)}", roteiro))
+        mensagens += len(roteiro)
+    return roteiros
+
+
+def _falhou(resposta) -> bool:
+    return not isinstance(resposta, str) or not resposta.strip() or resposta.startswith(PREFIXOS_ERRO)
+
+
+class Resultados:
+    def __init__(self):
+        self.latencias = {}  # categoria -> [segundos]
+        self.erros = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, categoria: str, segundos: float, erro: bool):
+        with self._lock:
+            self.latencias.setdefault(categoria, []).append(segundos)
+            if erro:
+                self.erros[categoria] = self.erros.get(categoria, 0) + 1
+
+
+def percentil(valores: list, p: float) -> float:
+    """Percentil por posição (nearest-rank) de uma lista já ordenada."""
+    if not valores:
+        return 0.0
+    return valores[max(0, math.ceil(p / 100 * len(valores)) - 1)]
+
+
+def _enviar_http(url: str, mensagem: str, remetente: str, timeout: float) -> str:
+    corpo = json.dumps({"message": mensagem, "sender": remetente}).encode("utf-8")
+    requisicao = urllib.request.Request(url, data=corpo, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+        return json.loads(resposta.read()).get("response")
+
+
+def executar_sincrono(enviar, roteiros: list, concorrencia: int, resultados: Resultados):
+    def conversa(remetente, roteiro):
+        for categoria, mensagem in roteiro:
+            inicio = time.perf_counter()
+            try:
+                erro = _falhou(enviar(mensagem, remetente))
+            except Exception as e:
+                print(f"⚠️ {categoria}: {e}", file=sys.stderr)
+                erro = True
+            resultados.registrar(categoria, time.perf_counter() - inicio, erro)
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        for futuro in [executor.submit(conversa, remetente, roteiro) for remetente, roteiro in roteiros]:
+            futuro.result()
+
+
+async def executar_assincrono(agent, roteiros: list, concorrencia: int, resultados: Resultados):
+    limite = asyncio.Semaphore(concorrencia)
+
+    async def conversa(remetente, roteiro):
+        async with limite:
+            for categoria, mensagem in roteiro:
+                inicio = time.perf_counter()
+                try:
+                    erro = _falhou(await agent.aprocess_message(mensagem, remetente))
+                except Exception as e:
+                    print(f"⚠️ {categoria}: {e}", file=sys.stderr)
+                    erro = True
+                resultados.registrar(categoria, time.perf_counter() - inicio, erro)
+
+    await asyncio.gather(*(conversa(remetente, roteiro) for remetente, roteiro in roteiros))
+
+
+# ---------------------------------------------------------------------------
+# Relatório
+# ---------------------------------------------------------------------------
+
+def resumir(resultados: Resultados, duracao: float, parametros: dict) -> dict:
+    fluxos = {}
+    todas = []
+    for categoria, latencias in sorted(resultados.latencias.items()):
+        ordenadas = sorted(latencias)
+        todas += ordenadas
+        fluxos[categoria] = {
+            "mensagens": len(ordenadas),
+            "erros": resultados.erros.get(categoria, 0),
+            "p50_ms": percentil(ordenadas, 50) * 1000,
+            "p95_ms": percentil(ordenadas, 95) * 1000,
+            "p99_ms": percentil(ordenadas, 99) * 1000,
+            "media_ms": sum(ordenadas) / len(ordenadas) * 1000,
+            "max_ms": ordenadas[-1] * 1000,
+        }
+    todas.sort()
+    return {
+        "parametros": parametros,
+        "duracao_s": duracao,
+        "mensagens": len(todas),
+        "erros": sum(resultados.erros.values()),
+        "vazao_msg_s": len(todas) / duracao if duracao else 0.0,
+        "p50_ms": percentil(todas, 50) * 1000,
+        "p95_ms": percentil(todas, 95) * 1000,
+        "p99_ms": percentil(todas, 99) * 1000,
+        "fluxos": fluxos,
+    }
+
+
+def imprimir(resumo: dict):
+    print(f"\n{'fluxo':<12} {'msgs':>6} {'erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'média ms':>9}")
+    for fluxo, linha in resumo["fluxos"].items():
+        print(f"{fluxo:<12} {linha['mensagens']:>6} {linha['erros']:>6} {linha['p50_ms']:>9.1f} "
+              f"{linha['p95_ms']:>9.1f} {linha['p99_ms']:>9.1f} {linha['media_ms']:>9.1f}")
+    print(f"{'TOTAL':<12} {resumo['mensagens']:>6} {resumo['erros']:>6} {resumo['p50_ms']:>9.1f} "
+          f"{resumo['p95_ms']:>9.1f} {resumo['p99_ms']:>9.1f}")
+    print(f"\n⏱️ {resumo['mensagens']} mensagens em {resumo['duracao_s']:.1f}s: "
+          f"{resumo['vazao_msg_s']:.2f} msg/s")
+
+
+def comparar(resumo: dict, base: dict, tolerancia: float) -> bool:
+    """Imprime a variação em relação a uma execução anterior; False se alguma piora passar da tolerância."""
+    print("\nVariação em relação à base (p95 e vazão):")
+    ok = True
+    for fluxo, linha in resumo["fluxos"].items():
+        anterior = base.get("fluxos", {}).get(fluxo)
+        if not anterior or not anterior["p95_ms"]:
+            continue
+        variacao = linha["p95_ms"] / anterior["p95_ms"] - 1
+        piorou = variacao > tolerancia
+        ok &= not piorou
+        print(f"  {'❌' if piorou else '✅'} {fluxo:<12} p95 {anterior['p95_ms']:.1f} → {linha['p95_ms']:.1f} ms "
+              f"({variacao:+.1%})")
+    if base.get("vazao_msg_s"):
+        variacao = resumo["vazao_msg_s"] / base["vazao_msg_s"] - 1
+        piorou = variacao < -tolerancia
+        ok &= not piorou
+        print(f"  {'❌' if piorou else '✅'} vazão {base['vazao_msg_s']:.2f} → {resumo['vazao_msg_s']:.2f} msg/s "
+              f"({variacao:+.1%})")
+    return ok
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _exigir_banco_local(url: str, permitir_remoto: bool):
+    host = urlparse(url).hostname or ""
+    if host not in HOSTS_LOCAIS and not permitir_remoto:
+        sys.exit(f"❌ {host} não é um banco local. O benchmark apaga e recria as tabelas; "
+                 "use --permitir-remoto se tiver certeza.")
+
+
+def _pesos(texto: str) -> dict:
+    """'tecnico=30,rag=10' -> pesos; categorias omitidas ficam com peso 0."""
+    if not texto:
+        return dict(PESOS)
+    pesos = {categoria: 0 for categoria in PESOS}
+    for item in texto.split(","):
+        categoria, _, peso = item.partition("=")
+        if categoria.strip() not in ROTEIROS:
+            sys.exit(f"❌ Categoria desconhecida: {categoria}. Opções: {', '.join(ROTEIROS)}")
+        pesos[categoria.strip()] = float(peso or 1)
+    return pesos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do chatbot (vazão e p50/p95/p99 por fluxo).")
+    parser.add_argument("--modo", choices=("agente", "async", "http"), default="agente")
+    parser.add_argument("--url", default="http://127.0.0.1:5000/webhook", help="endpoint do modo http")
+    parser.add_argument("--mensagens", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=8)
+    parser.add_argument("--aquecimento", type=int, default=10, help="mensagens enviadas antes de medir")
+    parser.add_argument("--pesos", help="peso de cada categoria, ex.: tecnico=30,rag=20 (padrão: mix realista)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=120, help="timeout de cada requisição no modo http")
+
+    banco = parser.add_argument_group("banco sintético")
+    banco.add_argument("--banco", default=os.getenv("BENCH_DATABASE_URL"),
+                       help="Postgres local do benchmark (padrão: BENCH_DATABASE_URL)")
+    banco.add_argument("--semear", action="store_true", help="recria as tabelas com dados sintéticos antes de rodar")
+    banco.add_argument("--modelos-sinteticos", type=int, default=200)
+    banco.add_argument("--anos", type=int, default=3, help="anos de histórico de vendas sintético")
+    banco.add_argument("--permitir-remoto", action="store_true")
+
+    groq = parser.add_argument_group("Groq falso")
+    groq.add_argument("--sem-groq-falso", action="store_true",
+                      help="não inicia o servidor falso (use GROQ_BASE_URL de outro servidor)")
+    groq.add_argument("--porta-groq", type=int, default=8090)
+    argumentos_latencia(groq)
+
+    saida = parser.add_argument_group("saída")
+    saida.add_argument("--json", help="grava o resumo em JSON (para comparar depois)")
+    saida.add_argument("--comparar", help="JSON de uma execução anterior para mostrar a variação")
+    saida.add_argument("--tolerancia", type=float, default=0.10,
+                       help="piora máxima aceita no p95/vazão ao comparar (sai com código 1 se passar)")
+    args = parser.parse_args()
+
+    if args.modo != "http" and not args.banco:
+        sys.exit("❌ Informe o Postgres local do benchmark em --banco ou BENCH_DATABASE_URL.")
+    if args.banco:
+        _exigir_banco_local(args.banco, args.permitir_remoto)
+    if args.semear:
+        if not args.banco:
+            sys.exit("❌ --semear precisa de --banco ou BENCH_DATABASE_URL.")
+        semear_banco(args.banco, args.modelos_sinteticos, args.anos)
+
+    servidor = None
+    if not args.sem_groq_falso:
+        servidor = FakeGroqServer(("127.0.0.1", args.porta_groq), latencia_dos_argumentos(args, args.seed))
+        servidor.iniciar_em_segundo_plano()
+        print(f"🤖 Groq falso em {servidor.base_url}", file=sys.stderr)
+        if args.modo == "http":
+            print(f"   Inicie o servidor testado com GROQ_BASE_URL={servidor.base_url}", file=sys.stderr)
+
+    # Nunca aponta para o Groq ou o banco de produção nos modos em processo
+    if args.modo != "http":
+        os.environ["DATABASE_URL"] = args.banco
+        if servidor is not None:
+            os.environ["GROQ_BASE_URL"] = servidor.base_url
+            os.environ["GROQ_API_KEY"] = "benchmark"
+        elif not os.getenv("GROQ_BASE_URL"):
+            sys.exit("❌ Com --sem-groq-falso, defina GROQ_BASE_URL para um servidor local.")
+
+    pesos = _pesos(args.pesos)
+    aquecimento = sortear_roteiros(args.aquecimento, pesos, args.seed + 1) if args.aquecimento else []
+    roteiros = sortear_roteiros(args.mensagens, pesos, args.seed)
+
+    try:
+        if args.modo == "http":
+            def enviar(mensagem, remetente):
+                return _enviar_http(args.url, mensagem, remetente, args.timeout)
+            executar_sincrono(enviar, aquecimento, args.concorrencia, Resultados())
+            resultados = Resultados()
+            inicio = time.perf_counter()
+            executar_sincrono(enviar, roteiros, args.concorrencia, resultados)
+        else:
+            from ai_agent import AIAgent
+            agent = AIAgent()
+            agent.warm_up()
+            if args.modo == "agente":
+                executar_sincrono(agent.process_message, aquecimento, args.concorrencia, Resultados())
+                resultados = Resultados()
+                inicio = time.perf_counter()
+                executar_sincrono(agent.process_message, roteiros, args.concorrencia, resultados)
+            else:
+                async def rodar():
+                    await executar_assincrono(agent, aquecimento, args.concorrencia, Resultados())
+                    medidos = Resultados()
+                    comeco = time.perf_counter()
+                    await executar_assincrono(agent, roteiros, args.concorrencia, medidos)
+                    return medidos, comeco
+                resultados, inicio = asyncio.run(rodar())
+        duracao = time.perf_counter() - inicio
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+            servidor.server_close()
+
+    parametros = {
+        "modo": args.modo, "mensagens": args.mensagens, "concorrencia": args.concorrencia,
+        "latencia_ms": args.latencia_ms, "jitter_ms": args.jitter_ms, "cauda": args.cauda,
+        "erros": args.erros, "groq_falso": servidor is not None, "pesos": pesos,
+    }
+    resumo = resumir(resultados, duracao, parametros)
+    imprimir(resumo)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as arquivo:
+            json.dump(resumo, arquivo, ensure_ascii=False, indent=2)
+        print(f"💾 Resumo gravado em {args.json}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            base = json.load(arquivo)
+        if not comparar(resumo, base, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+import select
+import sys
+import threading
+import time
+
+from text_utils import normalizar_texto
+
+CANAL_CATALOGO = "catalog_changed"
+
+QUERY_CATALOGO = """
+    SELECT
+        s.id, s.modelo, s.fabricante, s.info_geral, s.especificacoes_tecnicas,
+        s.performance_score, s.categoria, s.segmento,
+        array_remove(array_agg(f.url_imagem), NULL) as fotos
+    FROM smartphones s
+    LEFT JOIN fotos f ON s.id = f.smartphone_id
+    GROUP BY s.id
+    ORDER BY s.id;
+"""
+
+# Impressão digital barata do conteúdo das duas tabelas: muda sempre que
+# qualquer linha é inserida, alterada ou removida.
+QUERY_VERSAO = """
+    SELECT
+        (SELECT md5(coalesce(string_agg(s::text, '|' ORDER BY s.id), '')) FROM smartphones s),
+        (SELECT md5(coalesce(string_agg(f::text, '|' ORDER BY f::text), '')) FROM fotos f);
+"""
+
+
+class CatalogSnapshot:
+    """
+    Cópia em memória do catálogo (`smartphones` + `fotos`), indexada pelo nome
+    normalizado do modelo. As consultas de especificações são respondidas sem
+    ir ao banco.
+
+    A cópia é recarregada quando:
+    - chega um NOTIFY no canal `catalog_changed` (ex.: ao fim de setup_database.py), ou
+    - a impressão digital das tabelas muda (verificada a cada `refresh_interval` segundos).
+    """
+
+    def __init__(self, pool, connect=None, refresh_interval: float = 300.0, listen: bool = True):
+        self.pool = pool
+        self.connect = connect
+        self.refresh_interval = refresh_interval
+        self.listen = listen and connect is not None
+
+        self.version = 0  # incrementa a cada recarga bem-sucedida
+        self._fingerprint = None
+        self._rows = []
+        self._index = {}  # nome normalizado -> linhas
+        self._checked_at = 0.0
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._listener = None
+
+    # ---------- Carga ----------
+
+    def _fetch(self, query: str) -> list:
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                colunas = [desc[0] for desc in cur.description]
+                return [dict(zip(colunas, row)) for row in cur.fetchall()]
+
+    def _current_fingerprint(self):
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(QUERY_VERSAO)
+                return cur.fetchone()
+
+    def load(self):
+        """Lê o catálogo inteiro em uma única consulta e troca o índice de uma vez."""
+        fingerprint = self._current_fingerprint()
+        rows = []
+        index = {}
+        for row in self._fetch(QUERY_CATALOGO):
+            row.pop("id", None)
+            row["fotos"] = list(row.get("fotos") or [])
+            rows.append(row)
+            index.setdefault(normalizar_texto(row["modelo"]), []).append(row)
+
+        with self._lock:
+            self._rows = rows
+            self._index = index
+            self._fingerprint = fingerprint
+            self._checked_at = time.monotonic()
+            self._dirty = False
+            self.version += 1
+        print(f"📦 Catálogo carregado em memória: {len(rows)} modelos (versão {self.version})", file=sys.stderr)
+
+        if self.listen and self._listener is None:
+            self._start_listener()
+
+    def ensure_fresh(self):
+        """Recarrega se houve NOTIFY ou se a impressão digital mudou desde a última verificação."""
+        if self.version and not self._dirty and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        # Só uma thread recarrega; as outras seguem com a versão atual (se existir).
+        if not self._refresh_lock.acquire(blocking=not self.version):
+            return
+        try:
+            if not self.version or self._dirty:
+                self.load()
+            elif time.monotonic() - self._checked_at >= self.refresh_interval:
+                if self._current_fingerprint() != self._fingerprint:
+                    self.load()
+                else:
+                    self._checked_at = time.monotonic()
+        finally:
+            self._refresh_lock.release()
+
+    def invalidate(self):
+        """Força a recarga na próxima consulta."""
+        self._dirty = True
+
+    # ---------- Consulta ----------
+
+    def models(self) -> list:
+        """Nomes de todos os modelos do catálogo."""
+        return [row["modelo"] for row in self._rows]
+
+    def lookup(self, modelo: str):
+        """
+        Retorna as linhas cujo nome contém `modelo` (mesma semântica do antigo
+        LIKE '%modelo%', mas respeitando palavras inteiras e ignorando acentos).
+        Retorna None se o catálogo não puder ser carregado.
+        """
+        try:
+            self.ensure_fresh()
+        except Exception as e:
+            print(f"⚠️ Catálogo em memória indisponível: {e}", file=sys.stderr)
+            if not self.version:
+                return None
+
+        chave = normalizar_texto(modelo)
+        index = self._index
+        rows = index.get(chave)
+        if rows is None:
+            alvo = f" {chave} "
+            rows = [row for nome, linhas in index.items() if alvo in f" {nome} " for row in linhas]
+        return [dict(row) for row in rows]
+
+    # ---------- LISTEN/NOTIFY ----------
+
+    def _start_listener(self):
+        self._listener = threading.Thread(target=self._listen_loop, name="catalog-listener", daemon=True)
+        self._listener.start()
+
+    def _listen_loop(self):
+        espera = 1.0
+        while True:
+            conn = None
+            try:
+                conn = self.connect()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CANAL_CATALOGO};")
+                espera = 1.0
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        print("🔔 Catálogo alterado (NOTIFY). Recarregando na próxima consulta.", file=sys.stderr)
+                        self.invalidate()
+            except Exception as e:
+                print(f"⚠️ Listener do catálogo desconectado: {e}", file=sys.stderr)
+                time.sleep(espera)
+                espera = min(espera * 2, 60.0)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
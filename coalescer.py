@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+Agrupamento de rajadas de mensagens do mesmo remetente.
+
+No WhatsApp, uma ideia costuma chegar em três ou quatro mensagens seguidas
+("oi" / "queria saber" / "o a54 tem nfc?"). Em vez de rotear, consultar e
+chamar o Groq para cada uma, as mensagens de um remetente são seguradas por
+`janela` segundos de silêncio (no máximo `janela_max` desde a primeira) e
+viram um único turno. Se chegar mensagem nova enquanto o turno anterior ainda
+está sendo processado, o trabalho antigo é cancelado e o texto dele entra no
+turno seguinte.
+
+Quem enviou as mensagens absorvidas recebe None (não há o que responder); só
+a última mensagem da rajada recebe a resposta.
+
+`SenderRateLimiter` limita quantos turnos por minuto cada remetente gera.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+MENSAGEM_LIMITE = "⏳ Você está enviando muitas mensagens seguidas. Aguarde um instante e tente de novo, por favor."
+
+
+class SenderRateLimiter:
+    """
+    Balde de fichas por remetente: `por_minuto` turnos por minuto, com rajada
+    de até `rajada`. Guarda no máximo `max_remetentes` baldes (LRU).
+    """
+
+    def __init__(self, por_minuto: float = 20.0, rajada: int = 5, max_remetentes: int = 10000):
+        self.taxa = por_minuto / 60.0
+        self.rajada = rajada
+        self.max_remetentes = max_remetentes
+        self._baldes = OrderedDict()  # remetente -> [fichas, atualizado_em, avisado]
+        self._lock = threading.Lock()
+        self.bloqueados = 0
+
+    def permitir(self, remetente: str) -> tuple:
+        """(permitido, avisar): `avisar` é True só no primeiro bloqueio de uma sequência."""
+        agora = time.monotonic()
+        with self._lock:
+            balde = self._baldes.get(remetente)
+            if balde is None:
+                balde = self._baldes[remetente] = [float(self.rajada), agora, False]
+                if len(self._baldes) > self.max_remetentes:
+                    self._baldes.popitem(last=False)
+            self._baldes.move_to_end(remetente)
+            balde[0] = min(self.rajada, balde[0] + (agora - balde[1]) * self.taxa)
+            balde[1] = agora
+            if balde[0] >= 1:
+                balde[0] -= 1
+                balde[2] = False
+                return True, False
+            self.bloqueados += 1
+            avisar = not balde[2]
+            balde[2] = True
+            return False, avisar
+
+
+class _Rajada:
+    def __init__(self, cond=None):
+        self.textos = []
+        self.geracao = 0
+        self.primeiro_em = None
+        self.ultimo_em = None
+        self.em_andamento = False
+        self.em_turno = None   # (textos, primeiro_em) do turno em andamento
+        self.cancelar = None   # threading.Event do turno em andamento (versão síncrona)
+        self.tarefa = None     # asyncio.Task do turno em andamento (versão assíncrona)
+        self.esperando = 0
+        self.cond = cond
+        self.evento = None
+
+
+class _BaseCoalescer:
+    def __init__(self, janela: float = 1.5, janela_max: float = 5.0, limite: SenderRateLimiter = None):
+        self.janela = janela
+        self.janela_max = janela_max
+        self.limite = limite
+        self._rajadas = {}
+        self._stats = {"mensagens": 0, "turnos": 0, "canceladas": 0, "limitadas": 0}
+
+    def _chegou(self, rajada: _Rajada, texto: str) -> int:
+        agora = time.monotonic()
+        rajada.textos.append(texto)
+        rajada.geracao += 1
+        rajada.primeiro_em = rajada.primeiro_em or agora
+        rajada.ultimo_em = agora
+        self._stats["mensagens"] += 1
+        return rajada.geracao
+
+    def _restante(self, rajada: _Rajada) -> float:
+        if rajada.primeiro_em is None:
+            # Os textos já foram levados por um turno
+            return 0.0
+        prazo = min(rajada.ultimo_em + self.janela, rajada.primeiro_em + self.janela_max)
+        return prazo - time.monotonic()
+
+    def _iniciar_turno(self, rajada: _Rajada) -> str:
+        self._stats["turnos"] += 1
+        rajada.em_andamento = True
+        # Os textos saem da rajada: o que chegar durante o turno fica para o próximo
+        rajada.em_turno = (rajada.textos, rajada.primeiro_em)
+        rajada.textos = []
+        rajada.primeiro_em = None
+        # Mensagens curtas de uma rajada: uma por linha, na ordem em que chegaram
+        return "\n".join(rajada.em_turno[0])
+
+    def _devolver_turno(self, rajada: _Rajada):
+        """Turno cancelado: os textos dele voltam para a frente da rajada e entram no próximo."""
+        textos, primeiro_em = rajada.em_turno
+        rajada.textos = textos + rajada.textos
+        rajada.primeiro_em = primeiro_em
+        rajada.em_turno = None
+        rajada.em_andamento = False
+
+    def _descartar(self, rajada: _Rajada):
+        rajada.textos = []
+        rajada.primeiro_em = None
+
+    def _concluir_turno(self, remetente: str, rajada: _Rajada):
+        rajada.em_turno = None
+        rajada.em_andamento = False
+        if rajada.esperando == 0 and not rajada.textos:
+            self._rajadas.pop(remetente, None)
+
+    def _limitar(self, remetente: str):
+        """None se o turno pode seguir; senão, a resposta a devolver (aviso ou nada)."""
+        if self.limite is None:
+            return None
+        permitido, avisar = self.limite.permitir(remetente)
+        if permitido:
+            return None
+        self._stats["limitadas"] += 1
+        print(f"🚦 Remetente {remetente} acima do limite de mensagens", file=sys.stderr)
+        return MENSAGEM_LIMITE if avisar else ""
+
+    def stats(self) -> dict:
+        # Mensagens que não geraram turno próprio
+        agrupadas = max(0, self._stats["mensagens"] - self._stats["turnos"] - self._stats["limitadas"])
+        return dict(self._stats, agrupadas=agrupadas, remetentes=len(self._rajadas))
+
+    def coletar_metricas(self):
+        estatisticas = self.stats()
+        for chave in ("mensagens", "turnos", "agrupadas", "canceladas", "limitadas"):
+            yield ("chatbot_coalescer_events_total", "counter",
+                   "Mensagens recebidas, turnos gerados, mensagens agrupadas, turnos cancelados e limitados.",
+                   {"evento": chave}, estatisticas[chave])
+
+
+class MessageCoalescer(_BaseCoalescer):
+    """
+    Versão com threads (Flask e workers da fila). `processar(texto, remetente,
+    cancelado)` recebe um threading.Event que é ligado quando uma mensagem nova
+    do mesmo remetente torna o turno obsoleto.
+    """
+
+    def __init__(self, processar, janela: float = 1.5, janela_max: float = 5.0, limite: SenderRateLimiter = None):
+        super().__init__(janela, janela_max, limite)
+        self.processar = processar
+        self._lock = threading.Lock()
+
+    def enviar(self, texto: str, remetente: str = None):
+        """Resposta para a rajada que esta mensagem encerra, ou None se ela foi absorvida."""
+        if not remetente:
+            return self.processar(texto, remetente, None)
+        if self.janela <= 0:
+            recusa = self._limitar(remetente)
+            return self.processar(texto, remetente, None) if recusa is None else recusa or None
+
+        with self._lock:
+            rajada = self._rajadas.get(remetente)
+            if rajada is None:
+                rajada = self._rajadas[remetente] = _Rajada(threading.Condition(self._lock))
+            minha = self._chegou(rajada, texto)
+            if rajada.cancelar is not None and not rajada.cancelar.is_set():
+                rajada.cancelar.set()
+                self._stats["canceladas"] += 1
+            rajada.cond.notify_all()
+
+            rajada.esperando += 1
+            try:
+                # Espera a rajada terminar e o turno antigo (já cancelado) sair
+                while rajada.geracao == minha and (rajada.em_andamento or self._restante(rajada) > 0):
+                    rajada.cond.wait(max(self._restante(rajada), 0.05) if not rajada.em_andamento else None)
+                if rajada.geracao != minha:
+                    return None
+            finally:
+                rajada.esperando -= 1
+
+            recusa = self._limitar(remetente)
+            if recusa is not None:
+                self._descartar(rajada)
+                self._concluir_turno(remetente, rajada)
+                return recusa or None
+            texto_turno = self._iniciar_turno(rajada)
+            cancelado = rajada.cancelar = threading.Event()
+
+        try:
+            resposta = self.processar(texto_turno, remetente, cancelado)
+        finally:
+            with self._lock:
+                rajada.cancelar = None
+                if cancelado.is_set():
+                    # Os textos ficam para o turno da mensagem que chegou depois
+                    self._devolver_turno(rajada)
+                else:
+                    self._concluir_turno(remetente, rajada)
+                rajada.cond.notify_all()
+        return None if cancelado.is_set() else resposta
+
+
+class AsyncMessageCoalescer(_BaseCoalescer):
+    """
+    Versão asyncio (servidor ASGI). `processar(texto, remetente)` é uma
+    corrotina; o turno obsoleto é cancelado com Task.cancel().
+    """
+
+    def __init__(self, processar, janela: float = 1.5, janela_max: float = 5.0, limite: SenderRateLimiter = None):
+        super().__init__(janela, janela_max, limite)
+        self.processar = processar
+
+    async def enviar(self, texto: str, remetente: str = None):
+        if not remetente:
+            return await self.processar(texto, remetente)
+        if self.janela <= 0:
+            recusa = self._limitar(remetente)
+            return await self.processar(texto, remetente) if recusa is None else recusa or None
+
+        rajada = self._rajadas.get(remetente)
+        if rajada is None:
+            rajada = self._rajadas[remetente] = _Rajada()
+        minha = self._chegou(rajada, texto)
+        if rajada.tarefa is not None and not rajada.tarefa.done():
+            rajada.tarefa.cancel()
+            self._stats["canceladas"] += 1
+        if rajada.evento is not None:
+            rajada.evento.set()
+        rajada.evento = evento = asyncio.Event()
+
+        rajada.esperando += 1
+        try:
+            while rajada.geracao == minha and self._restante(rajada) > 0:
+                try:
+                    await asyncio.wait_for(evento.wait(), self._restante(rajada))
+                except asyncio.TimeoutError:
+                    pass
+            # O turno anterior precisa terminar (e devolver os textos, se cancelado) antes de o novo começar
+            while rajada.geracao == minha and rajada.em_andamento:
+                if rajada.tarefa is not None and not rajada.tarefa.done():
+                    await asyncio.wait({rajada.tarefa})
+                else:
+                    await asyncio.sleep(0)
+            if rajada.geracao != minha:
+                return None
+        finally:
+            rajada.esperando -= 1
+
+        recusa = self._limitar(remetente)
+        if recusa is not None:
+            self._descartar(rajada)
+            self._concluir_turno(remetente, rajada)
+            return recusa or None
+        geracao = rajada.geracao
+        tarefa = rajada.tarefa = asyncio.ensure_future(self.processar(self._iniciar_turno(rajada), remetente))
+        await asyncio.wait({tarefa})
+        if rajada.tarefa is tarefa:
+            rajada.tarefa = None
+        if tarefa.cancelled():
+            # Os textos ficam para o turno da mensagem que chegou depois
+            self._devolver_turno(rajada)
+            return None
+        if rajada.geracao == geracao:
+            self._concluir_turno(remetente, rajada)
+        else:
+            # Mensagem nova chegou depois de o turno terminar: a rajada continua viva para ela
+            rajada.em_turno = None
+            rajada.em_andamento = False
+        return tarefa.result()
+
+
+def criar_coalescer(processar, assincrono: bool = False):
+    """
+    Agrupador configurado pelo ambiente, ou None se estiver desligado
+    (`COALESCE_WINDOW_S`=0 e `SENDER_RATE_PER_MIN`=0, o padrão).
+    """
+    janela = float(os.getenv("COALESCE_WINDOW_S", "0"))
+    por_minuto = float(os.getenv("SENDER_RATE_PER_MIN", "0"))
+    if janela <= 0 and por_minuto <= 0:
+        return None
+    limite = None
+    if por_minuto > 0:
+        limite = SenderRateLimiter(por_minuto, rajada=int(os.getenv("SENDER_RATE_BURST", "5")))
+    classe = AsyncMessageCoalescer if assincrono else MessageCoalescer
+    coalescer = classe(processar, janela=janela, janela_max=float(os.getenv("COALESCE_MAX_WINDOW_S", "5")),
+                       limite=limite)
+    metrics.registrar_coletor(coalescer.coletar_metricas)
+    return coalescer
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class ConversationState:
+    """
+    Estado de uma conversa: últimos modelos resolvidos, dados já buscados e as
+    últimas trocas de mensagens (buffer circular de `max_turnos`).
+    """
+
+    def __init__(self, max_turnos: int = 6):
+        self.modelos = []
+        self.detalhes = {}    # modelo -> linhas de get_smartphone_details_and_photos
+        self.resultados = OrderedDict()  # (ferramenta, argumentos) -> (resposta formatada, guardada_em)
+        self.turnos = deque(maxlen=max_turnos)
+        self.atualizado_em = time.time()
+
+    def historico(self, n: int = None) -> list:
+        """Últimas `n` trocas como mensagens de chat (user/assistant)."""
+        turnos = list(self.turnos)[-n:] if n else list(self.turnos)
+        mensagens = []
+        for pergunta, resposta in turnos:
+            mensagens.append({"role": "user", "content": pergunta})
+            mensagens.append({"role": "assistant", "content": resposta})
+        return mensagens
+
+    def to_json(self) -> str:
+        # Só o essencial vai para o disco; dados do banco são baratos de buscar de novo
+        return json.dumps({"modelos": self.modelos, "turnos": list(self.turnos)}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, dados: str, max_turnos: int, atualizado_em: float):
+        estado = cls(max_turnos)
+        conteudo = json.loads(dados)
+        estado.modelos = conteudo.get("modelos", [])
+        estado.turnos.extend(tuple(turno) for turno in conteudo.get("turnos", []))
+        estado.atualizado_em = atualizado_em
+        return estado
+
+
+class ConversationStore:
+    """
+    Estados de conversa por remetente, em memória, com limite de conversas
+    (LRU) e expiração por inatividade (`ttl` segundos).
+
+    Resultados de ferramentas guardados na conversa têm validade própria
+    (`ttl_resultados`) e no máximo `max_resultados` por conversa (LRU), para que
+    uma conversa longa não responda indefinidamente com dados antigos.
+
+    Se `spill_path` for informado, conversas despejadas da memória por falta de
+    espaço são gravadas em SQLite e recuperadas quando o remetente voltar.
+    """
+
+    def __init__(self, max_turnos: int = 6, ttl: float = 1800.0, max_conversas: int = 10000,
+                 spill_path: str = None, max_resultados: int = 8, ttl_resultados: float = 300.0):
+        self.max_turnos = max_turnos
+        self.ttl = ttl
+        self.max_conversas = max_conversas
+        self.max_resultados = max_resultados
+        self.ttl_resultados = ttl_resultados
+        self.spill_path = spill_path
+        self._conversas = OrderedDict()
+        self._lock = threading.Lock()
+        # Despejadas da memória que ainda estão sendo gravadas em disco
+        self._despejando = {}
+        # Acesso ao SQLite fica fora de self._lock, para o disco não travar os outros remetentes
+        self._db_lock = threading.Lock()
+        self._db = None
+        if spill_path:
+            self._db = sqlite3.connect(spill_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS conversas (remetente TEXT PRIMARY KEY, dados TEXT, atualizado_em REAL)"
+            )
+            self._db.commit()
+
+    def get(self, remetente: str) -> ConversationState:
+        """Retorna o estado do remetente, criando um novo se não houver (ou se expirou)."""
+        agora = time.time()
+        with self._lock:
+            estado = self._valido(self._conversas.get(remetente), agora)
+            if estado is None:
+                estado = self._valido(self._despejando.get(remetente), agora)
+                if estado is not None:
+                    self._conversas[remetente] = estado
+            if estado is not None:
+                self._conversas.move_to_end(remetente)
+                despejadas = self._evict(agora)
+        if estado is None:
+            # A leitura do disco acontece sem o lock; o resultado entra na memória depois
+            carregado = self._load_spilled(remetente, agora)
+            with self._lock:
+                estado = self._valido(self._conversas.get(remetente), agora)
+                if estado is None:
+                    estado = carregado or ConversationState(self.max_turnos)
+                    self._conversas[remetente] = estado
+                self._conversas.move_to_end(remetente)
+                despejadas = self._evict(agora)
+        for despejado, estado_despejado in despejadas:
+            self._spill(despejado, estado_despejado)
+        return estado
+
+    def _valido(self, estado, agora: float):
+        if estado is not None and agora - estado.atualizado_em > self.ttl:
+            return None
+        return estado
+
+    def record_turn(self, remetente: str, pergunta: str, resposta: str, modelos: list = None):
+        estado = self.get(remetente)
+        with self._lock:
+            estado.turnos.append((pergunta, resposta))
+            if modelos:
+                if modelos != estado.modelos:
+                    estado.detalhes = {m: d for m, d in estado.detalhes.items() if m in modelos}
+                estado.modelos = list(modelos)
+            estado.atualizado_em = time.time()
+
+    def resultado(self, estado: ConversationState, chave: tuple):
+        """Resultado de ferramenta guardado na conversa, ou None se não houver ou tiver vencido."""
+        with self._lock:
+            guardado = estado.resultados.get(chave)
+            if guardado is None:
+                return None
+            if time.time() - guardado[1] > self.ttl_resultados:
+                del estado.resultados[chave]
+                return None
+            estado.resultados.move_to_end(chave)
+            return guardado[0]
+
+    def guardar_resultado(self, estado: ConversationState, chave: tuple, resposta: str):
+        if self.max_resultados <= 0:
+            return
+        with self._lock:
+            estado.resultados[chave] = (resposta, time.time())
+            estado.resultados.move_to_end(chave)
+            while len(estado.resultados) > self.max_resultados:
+                estado.resultados.popitem(last=False)
+
+    def detalhes(self, estado: ConversationState, modelos: list) -> dict:
+        """Dados já buscados na conversa para os `modelos` que houver."""
+        with self._lock:
+            return {modelo: estado.detalhes[modelo] for modelo in modelos if modelo in estado.detalhes}
+
+    def guardar_detalhes(self, estado: ConversationState, novos: dict):
+        with self._lock:
+            estado.detalhes.update(novos)
+
+    def _evict(self, agora: float) -> list:
+        """
+        Remove as expiradas e o excesso (chamada com self._lock). Retorna as
+        despejadas por excesso, para serem gravadas em disco fora do lock.
+        """
+        # Remove expiradas a partir das menos recentes
+        while self._conversas:
+            remetente, estado = next(iter(self._conversas.items()))
+            if agora - estado.atualizado_em <= self.ttl:
+                break
+            self._conversas.popitem(last=False)
+        # Excesso: despeja as menos recentes (em disco, se configurado)
+        despejadas = []
+        while len(self._conversas) > self.max_conversas:
+            remetente, estado = self._conversas.popitem(last=False)
+            if self._db is not None:
+                self._despejando[remetente] = estado
+                despejadas.append((remetente, estado))
+        return despejadas
+
+    def _spill(self, remetente: str, estado: ConversationState):
+        try:
+            with self._lock:
+                dados, atualizado_em = estado.to_json(), estado.atualizado_em
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO conversas (remetente, dados, atualizado_em) VALUES (?, ?, ?)",
+                    (remetente, dados, atualizado_em),
+                )
+                self._db.execute("DELETE FROM conversas WHERE atualizado_em < ?", (time.time() - self.ttl,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Não foi possível gravar a conversa em disco: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                if self._despejando.get(remetente) is estado:
+                    del self._despejando[remetente]
+
+    def _load_spilled(self, remetente: str, agora: float):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                linha = self._db.execute(
+                    "SELECT dados, atualizado_em FROM conversas WHERE remetente = ?", (remetente,)
+                ).fetchone()
+                if linha is None:
+                    return None
+                self._db.execute("DELETE FROM conversas WHERE remetente = ?", (remetente,))
+                self._db.commit()
+            if agora - linha[1] > self.ttl:
+                return None
+            return ConversationState.from_json(linha[0], self.max_turnos, linha[1])
+        except sqlite3.Error as e:
+            print(f"⚠️ Não foi possível ler a conversa do disco: {e}", file=sys.stderr)
+            return None
+
+    def __len__(self):
+        return len(self._conversas)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Migrações de esquema do PostgreSQL, aplicadas em ordem e uma única vez.
+
+As aplicadas ficam registradas na tabela `schema_migracoes`; rodar de novo
+não faz nada. O `setup_database.py` aplica as pendentes antes de sincronizar,
+e este módulo também pode ser executado sozinho:
+
+    python db_migrations.py
+"""
+import sys
+
+# Chave normalizada do modelo, igual a text_utils.normalizar_texto: minúsculas, sem
+# acentos e qualquer sequência de pontuação/espaços reduzida a um espaço.
+# unaccent() não é IMMUTABLE (depende do search_path); o invólucro fixa o dicionário,
+# no esquema em que a extensão estiver instalada, e pode ser usado em coluna gerada.
+FUNCAO_CHAVE_MODELO = """
+    DO $$
+    DECLARE
+        esquema TEXT;
+    BEGIN
+        SELECT n.nspname INTO esquema
+        FROM pg_extension e JOIN pg_namespace n ON n.oid = e.extnamespace
+        WHERE e.extname = 'unaccent';
+        EXECUTE format($f$
+            CREATE OR REPLACE FUNCTION chave_modelo(texto TEXT) RETURNS TEXT
+                LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS
+            $c$ SELECT btrim(regexp_replace(lower(%1$I.unaccent(%2$L::regdictionary, texto)),
+                                            '[^a-z0-9]+', ' ', 'g')) $c$
+        $f$, esquema, format('%I.unaccent', esquema));
+    END
+    $$;
+"""
+
+MIGRACOES = [
+    ("001_chave_modelo_e_indices", f"""
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE EXTENSION IF NOT EXISTS unaccent;
+        {FUNCAO_CHAVE_MODELO}
+        ALTER TABLE smartphones
+            ADD COLUMN IF NOT EXISTS modelo_chave TEXT GENERATED ALWAYS AS (chave_modelo(modelo)) STORED;
+        ALTER TABLE vendas_smartphones
+            ADD COLUMN IF NOT EXISTS modelo_chave TEXT GENERATED ALWAYS AS (chave_modelo(modelo)) STORED;
+
+        -- Nome exato (= / ANY) e busca por trecho (LIKE '%...%')
+        CREATE INDEX IF NOT EXISTS smartphones_modelo_chave_idx ON smartphones (modelo_chave);
+        CREATE INDEX IF NOT EXISTS smartphones_modelo_chave_trgm_idx
+            ON smartphones USING gin (modelo_chave gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS fotos_smartphone_id_idx ON fotos (smartphone_id);
+
+        CREATE INDEX IF NOT EXISTS vendas_modelo_chave_ano_mes_idx
+            ON vendas_smartphones (modelo_chave, ano, mes);
+        CREATE INDEX IF NOT EXISTS vendas_modelo_chave_trgm_idx
+            ON vendas_smartphones USING gin (modelo_chave gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS vendas_ano_mes_idx ON vendas_smartphones (ano, mes);
+
+        ANALYZE smartphones;
+        ANALYZE fotos;
+        ANALYZE vendas_smartphones;
+    """),
+]
+
+
+def aplicar_migracoes(conn) -> list:
+    """
+    Aplica as migrações pendentes em UMA transação e retorna os nomes aplicados.
+    Um lock consultivo impede que dois processos migrem ao mesmo tempo.
+    Os CREATE INDEX bloqueiam escritas nas tabelas enquanto os índices são criados.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migracoes'));")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migracoes (
+                nome TEXT PRIMARY KEY,
+                aplicada_em TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """)
+        cur.execute("SELECT nome FROM schema_migracoes;")
+        feitas = {row[0] for row in cur.fetchall()}
+        aplicadas = []
+        for nome, sql in MIGRACOES:
+            if nome in feitas:
+                continue
+            print(f"🛠️ Aplicando migração {nome}...", file=sys.stderr)
+            cur.execute(sql)
+            cur.execute("INSERT INTO schema_migracoes (nome) VALUES (%s);", (nome,))
+            aplicadas.append(nome)
+    conn.commit()
+    return aplicadas
+
+
+if __name__ == "__main__":
+    from tools import get_db_connection
+
+    conexao = get_db_connection()
+    try:
+        aplicadas = aplicar_migracoes(conexao)
+    except Exception:
+        conexao.rollback()
+        raise
+    finally:
+        conexao.close()
+    print(f"✅ Migrações aplicadas: {', '.join(aplicadas)}" if aplicadas else "✅ Esquema já está atualizado.",
+          file=sys.stderr)
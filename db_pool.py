@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+
+class PoolTimeout(Exception):
+    """Nenhuma conexão ficou livre dentro do tempo de espera."""
+
+
+class ConnectionPool:
+    """
+    Pool de conexões PostgreSQL com tamanho limitado e seguro entre threads.
+
+    - `size` conexões ficam guardadas; até `max_overflow` conexões extras são
+      abertas em picos e fechadas ao serem devolvidas.
+    - Quem pede uma conexão com o pool cheio espera até `timeout` segundos.
+    - Conexões paradas há mais de `health_check_interval` segundos são testadas
+      com `SELECT 1` antes do uso e reabertas se estiverem quebradas.
+    """
+
+    def __init__(self, connect, size: int = 5, max_overflow: int = 5,
+                 timeout: float = 10.0, health_check_interval: float = 30.0):
+        self._connect = connect
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = []  # pilha de (conexão, momento da devolução)
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # Métricas
+        self._checkouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._overflow_peak = 0
+        self._timeouts = 0
+        self._reconnects = 0
+
+    def _checkout(self):
+        inicio = time.monotonic()
+        limite = inicio + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("O pool de conexões foi fechado.")
+                if self._idle:
+                    conn, devolvida_em = self._idle.pop()
+                    break
+                if self._opened < self.size + self.max_overflow:
+                    self._opened += 1
+                    conn, devolvida_em = None, None
+                    self._overflow_peak = max(self._overflow_peak, self._opened - self.size)
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"Nenhuma conexão livre após {self.timeout:.1f}s.")
+                self._cond.wait(restante)
+
+            espera = time.monotonic() - inicio
+            self._checkouts += 1
+            self._wait_total += espera
+            self._wait_max = max(self._wait_max, espera)
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif conn.closed or (time.monotonic() - devolvida_em > self.health_check_interval
+                                 and not self._is_healthy(conn)):
+                conn = self._reconnect(conn)
+        except Exception:
+            self._discard(None)
+            raise
+        return conn
+
+    def _checkin(self, conn, broken: bool = False):
+        with self._cond:
+            overflow = self._opened > self.size
+            if broken or overflow or self._closed or conn.closed:
+                self._opened -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn) -> bool:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _reconnect(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._reconnects += 1
+        return self._connect()
+
+    @staticmethod
+    def _close_quietly(conn):
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Empresta uma conexão exclusiva para o bloco `with`.
+        Em caso de erro a transação daquela conexão é desfeita; as demais não
+        são afetadas. Conexões que caíram são descartadas em vez de voltar ao pool.
+        """
+        conn = self._checkout()
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) or conn.closed
+            if not broken:
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            self._checkin(conn, broken=broken)
+            raise
+        else:
+            self._checkin(conn)
+
+    def metrics(self) -> dict:
+        """Retorna o estado atual do pool e os contadores acumulados."""
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "tamanho": self.size,
+                "max_overflow": self.max_overflow,
+                "abertas": self._opened,
+                "em_uso": self._opened - idle,
+                "ociosas": idle,
+                "overflow": max(0, self._opened - self.size),
+                "overflow_pico": self._overflow_peak,
+                "checkouts": self._checkouts,
+                "espera_media_s": self._wait_total / self._checkouts if self._checkouts else 0.0,
+                "espera_max_s": self._wait_max,
+                "timeouts": self._timeouts,
+                "reconexoes": self._reconnects,
+            }
+
+    def close(self):
+        """Fecha todas as conexões ociosas; as emprestadas são fechadas ao voltar."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._opened -= 1
+                self._close_quietly(conn)
+            self._cond.notify_all()
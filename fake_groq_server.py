@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Servidor local compatível com a API de chat do Groq/OpenAI, para benchmarks.
+
+Responde `POST /openai/v1/chat/completions` (e `/v1/chat/completions`) com
+latência configurável, sem gastar cota nem depender de rede:
+- com `tools` na requisição, devolve uma chamada de ferramenta escolhida por
+  palavras-chave da última mensagem do usuário;
+- senão, um texto em português (em SSE quando `stream` é pedido).
+
+O cliente do Groq lê `GROQ_BASE_URL`, então basta iniciar o agente com
+`GROQ_BASE_URL=http://127.0.0.1:8090` e qualquer `GROQ_API_KEY`.
+
+    python fake_groq_server.py --porta 8090 --latencia-ms 600 --jitter-ms 200
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from text_utils import normalizar_texto
+
+CAMINHOS = ("/openai/v1/chat/completions", "/v1/chat/completions")
+
+RESPOSTA_PADRAO = (
+    "Ótima pergunta! Pelo que temos no catálogo, a escolha depende do seu uso: "
+    "para fotos e desempenho, os topos de linha se destacam; para o dia a dia, "
+    "os intermediários entregam bateria longa e bom custo-benefício. "
+    "Quer que eu compare dois modelos específicos para você? 😊"
+)
+
+
+class LatenciaSimulada:
+    """
+    Latência de cada resposta: `base` ± `jitter` segundos e, com probabilidade
+    `cauda`, mais `cauda_s` (as respostas lentas que disparam hedge e prazo).
+    Modelos com "8b" no nome (o reserva) respondem em `fator_reserva` do tempo.
+    """
+
+    def __init__(self, base: float = 0.6, jitter: float = 0.2, cauda: float = 0.0, cauda_s: float = 3.0,
+                 por_token: float = 0.01, fator_reserva: float = 0.4, erros: float = 0.0, seed: int = None):
+        self.base = base
+        self.jitter = jitter
+        self.cauda = cauda
+        self.cauda_s = cauda_s
+        self.por_token = por_token
+        self.fator_reserva = fator_reserva
+        self.erros = erros
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sortear(self, modelo: str) -> tuple:
+        """(segundos até a resposta, se a resposta deve ser um erro 500)."""
+        with self._lock:
+            atraso = max(0.0, self.base + self._random.uniform(-self.jitter, self.jitter))
+            if self._random.random() < self.cauda:
+                atraso += self.cauda_s
+            falha = self._random.random() < self.erros
+        if "8b" in (modelo or ""):
+            atraso *= self.fator_reserva
+        return atraso, falha
+
+
+def _ultima_pergunta(mensagens: list) -> str:
+    for mensagem in reversed(mensagens or []):
+        if mensagem.get("role") == "user":
+            return mensagem.get("content") or ""
+    return ""
+
+
+def _escolher_ferramenta(pergunta: str, tools: list):
+    """Imita a escolha do modelo: (nome, argumentos) ou None para responder em texto."""
+    nomes = {t.get("function", {}).get("name") for t in tools or []}
+    texto = normalizar_texto(pergunta)
+    ano = int(m.group(0)) if (m := re.search(r"\b20\d{2}\b", texto)) else 2024
+    if "get_monthly_revenue" in nomes and re.search(r"faturamento|receita|arrecad", texto):
+        return "get_monthly_revenue", {"month": 1, "year": ano}
+    if "get_top_sold_products" in nomes and re.search(r"vendid|vendas|campea|lider|top", texto):
+        return "get_top_sold_products", {"limit": 3, "year": ano}
+    if "get_smartphone_details_and_photos" in nomes and re.search(
+            r"iphone|galaxy|xiaomi|redmi|moto|pixel|modelo", texto):
+        palavras = pergunta.split()
+        return "get_smartphone_details_and_photos", {"modelo": " ".join(palavras[-2:]).strip("?!.,")}
+    return None
+
+
+def _resposta(modelo: str, mensagem: dict, finish_reason: str, tokens_prompt: int, tokens_resposta: int) -> dict:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": modelo,
+        "choices": [{"index": 0, "message": mensagem, "finish_reason": finish_reason, "logprobs": None}],
+        "usage": {
+            "prompt_tokens": tokens_prompt,
+            "completion_tokens": tokens_resposta,
+            "total_tokens": tokens_prompt + tokens_resposta,
+        },
+    }
+
+
+def _pedaco(id_resposta: str, modelo: str, delta: dict, finish_reason=None) -> bytes:
+    corpo = {
+        "id": id_resposta,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": modelo,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason, "logprobs": None}],
+    }
+    return f"data: {json.dumps(corpo, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        if self.server.verbose:
+            super().log_message(formato, *args)
+
+    def _enviar_json(self, status: int, corpo: dict):
+        dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            modelos = [{"id": m, "object": "model"} for m in ("llama-3.3-70b-versatile", "llama-3.1-8b-instant")]
+            return self._enviar_json(200, {"object": "list", "data": modelos})
+        self._enviar_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.split("?")[0] not in CAMINHOS:
+            return self._enviar_json(404, {"error": {"message": "not found"}})
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        try:
+            requisicao = json.loads(self.rfile.read(tamanho) or b"{}")
+        except ValueError:
+            return self._enviar_json(400, {"error": {"message": "invalid json"}})
+
+        modelo = requisicao.get("model", "")
+        mensagens = requisicao.get("messages", [])
+        tokens_prompt = sum(len(m.get("content") or "") for m in mensagens) // 4 + 1
+        atraso, falha = self.server.latencia.sortear(modelo)
+        time.sleep(atraso)
+        if falha:
+            return self._enviar_json(500, {"error": {"message": "falha simulada", "type": "internal_server_error"}})
+
+        escolha = None
+        if requisicao.get("tools") and requisicao.get("tool_choice", "auto") != "none":
+            escolha = _escolher_ferramenta(_ultima_pergunta(mensagens), requisicao["tools"])
+        if escolha is not None:
+            nome, argumentos = escolha
+            chamada = {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                       "function": {"name": nome, "arguments": json.dumps(argumentos, ensure_ascii=False)}}
+            mensagem = {"role": "assistant", "content": None, "tool_calls": [chamada]}
+            return self._enviar_json(200, _resposta(modelo, mensagem, "tool_calls", tokens_prompt, 20))
+
+        texto = self.server.texto
+        if requisicao.get("stream"):
+            return self._stream(modelo, texto)
+        mensagem = {"role": "assistant", "content": texto}
+        self._enviar_json(200, _resposta(modelo, mensagem, "stop", tokens_prompt, len(texto) // 4))
+
+    def _stream(self, modelo: str, texto: str):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        id_resposta = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        self.wfile.write(_pedaco(id_resposta, modelo, {"role": "assistant", "content": ""}))
+        for palavra in re.findall(r"\S+\s*", texto):
+            time.sleep(self.server.latencia.por_token)
+            self.wfile.write(_pedaco(id_resposta, modelo, {"content": palavra}))
+            self.wfile.flush()
+        self.wfile.write(_pedaco(id_resposta, modelo, {}, finish_reason="stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco: tuple, latencia: LatenciaSimulada = None, texto: str = RESPOSTA_PADRAO,
+                 verbose: bool = False):
+        super().__init__(endereco, _Handler)
+        self.latencia = latencia or LatenciaSimulada()
+        self.texto = texto
+        self.verbose = verbose
+
+    @property
+    def base_url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar_em_segundo_plano(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="fake-groq", daemon=True)
+        thread.start()
+        return thread
+
+
+def argumentos_latencia(parser: argparse.ArgumentParser):
+    """Opções de latência simulada, compartilhadas com benchmark.py."""
+    parser.add_argument("--latencia-ms", type=float, default=600, help="latência média de cada resposta")
+    parser.add_argument("--jitter-ms", type=float, default=200, help="variação uniforme em torno da média")
+    parser.add_argument("--cauda", type=float, default=0.0, help="fração de respostas lentas (0-1)")
+    parser.add_argument("--cauda-ms", type=float, default=3000, help="atraso extra das respostas lentas")
+    parser.add_argument("--token-ms", type=float, default=10, help="intervalo entre pedaços no streaming")
+    parser.add_argument("--erros", type=float, default=0.0, help="fração de respostas com erro 500 (0-1)")
+
+
+def latencia_dos_argumentos(args, seed: int = None) -> LatenciaSimulada:
+    return LatenciaSimulada(
+        base=args.latencia_ms / 1000, jitter=args.jitter_ms / 1000,
+        cauda=args.cauda, cauda_s=args.cauda_ms / 1000,
+        por_token=args.token_ms / 1000, erros=args.erros, seed=seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor falso compatível com a API do Groq.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8090)
+    parser.add_argument("--verbose", action="store_true", help="registra cada requisição no log")
+    argumentos_latencia(parser)
+    args = parser.parse_args()
+
+    servidor = FakeGroqServer((args.host, args.porta), latencia_dos_argumentos(args), verbose=args.verbose)
+    print(f"🤖 Groq falso em {servidor.base_url} (latência {args.latencia_ms:.0f}±{args.jitter_ms:.0f} ms)",
+          file=sys.stderr)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
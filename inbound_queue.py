@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Fila durável de mensagens recebidas pelo /webhook (modo "aceita e enfileira").
+
+O /webhook só grava a mensagem em SQLite e responde na hora; um pool de
+workers processa a fila com concorrência limitada e devolve cada resposta por
+callback HTTP (o conector do WhatsApp). Assim a entrada nunca espera o Groq e
+um pico de mensagens vira fila, não timeout.
+
+- Mensagens com o mesmo ID (reentregas do WhatsApp) entram uma vez só.
+- Mensagens de um mesmo remetente são processadas em ordem, uma por vez.
+- Se o processo cair, as mensagens em andamento voltam para a fila ao reiniciar.
+- Falhas de processamento ou de entrega são repetidas com backoff até
+  `max_tentativas`; a resposta já gerada não é recalculada para reentregar.
+"""
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+
+import metrics
+from coalescer import criar_coalescer
+
+PENDENTE = "pendente"          # aguardando um worker
+PROCESSANDO = "processando"    # com um worker (agente ou entrega)
+RESPONDIDA = "respondida"      # resposta pronta, falta entregar pelo callback
+CONCLUIDA = "concluida"
+FALHOU = "falhou"
+
+# Endereço em que o wppconnect_qrcode.js recebe as respostas (WEBHOOK_CALLBACK_PORT padrão)
+CALLBACK_CONECTOR = "http://127.0.0.1:5001/resposta"
+
+
+class FilaCheia(Exception):
+    """A fila atingiu o limite de mensagens pendentes."""
+
+
+class InboundQueue:
+    """
+    Armazenamento da fila em SQLite (WAL, gravação síncrona: uma mensagem
+    aceita pelo /webhook sobrevive a uma queda do processo).
+    """
+
+    def __init__(self, path: str, max_pendentes: int = 10000, max_tentativas: int = 3,
+                 retencao: float = 86400.0, backoff_base: float = 2.0, backoff_max: float = 60.0,
+                 um_por_remetente: bool = True):
+        self.path = path
+        # Com o agrupador de rajadas, várias mensagens do remetente precisam estar com workers ao mesmo tempo
+        self.um_por_remetente = um_por_remetente
+        self.max_pendentes = max_pendentes
+        self.max_tentativas = max_tentativas
+        self.retencao = retencao  # tempo que mensagens concluídas ficam guardadas para deduplicar
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._disponivel = threading.Condition(self._lock)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS mensagens (
+                id TEXT PRIMARY KEY,
+                remetente TEXT,
+                texto TEXT NOT NULL,
+                callback TEXT,
+                status TEXT NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                resposta TEXT,
+                erro TEXT,
+                criada_em REAL NOT NULL,
+                disponivel_em REAL NOT NULL,
+                atualizada_em REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS mensagens_fila ON mensagens (status, disponivel_em)")
+        self._recuperar()
+
+    def _recuperar(self):
+        """Mensagens que estavam com um worker quando o processo caiu voltam para a fila."""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE mensagens SET status = CASE WHEN resposta IS NULL THEN ? ELSE ? END WHERE status = ?",
+                (PENDENTE, RESPONDIDA, PROCESSANDO),
+            )
+        if cur.rowcount:
+            print(f"♻️ {cur.rowcount} mensagem(ns) em andamento voltaram para a fila", file=sys.stderr)
+
+    def enfileirar(self, id_mensagem: str, texto: str, remetente: str = None, callback: str = None) -> bool:
+        """
+        Grava a mensagem na fila. Retorna False se o ID já foi recebido antes
+        (reentrega) e levanta FilaCheia se houver `max_pendentes` esperando.
+        """
+        agora = time.time()
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM mensagens WHERE id = ?", (id_mensagem,)).fetchone():
+                return False
+            pendentes = self._db.execute(
+                "SELECT count(*) FROM mensagens WHERE status IN (?, ?, ?)", (PENDENTE, PROCESSANDO, RESPONDIDA)
+            ).fetchone()[0]
+            if pendentes >= self.max_pendentes:
+                raise FilaCheia(f"{pendentes} mensagens aguardando processamento")
+            self._db.execute(
+                "INSERT INTO mensagens (id, remetente, texto, callback, status, criada_em, disponivel_em, atualizada_em)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (id_mensagem, remetente, texto, callback, PENDENTE, agora, agora, agora),
+            )
+            self._disponivel.notify()
+        return True
+
+    def reservar(self, espera: float = 1.0):
+        """
+        Entrega a um worker a próxima mensagem pronta (dict) ou None após
+        `espera` segundos. Cada remetente tem no máximo uma mensagem em
+        andamento e as dele saem na ordem de chegada (inclusive reentregas).
+        """
+        limite = time.monotonic() + espera
+        with self._lock:
+            while True:
+                agora = time.time()
+                if self.um_por_remetente:
+                    linha = self._db.execute("""
+                        SELECT id, remetente, texto, callback, status, tentativas, resposta, criada_em
+                        FROM mensagens m
+                        WHERE status IN (?, ?) AND disponivel_em <= ?
+                          AND (remetente IS NULL OR NOT EXISTS (
+                              SELECT 1 FROM mensagens o
+                              WHERE o.remetente = m.remetente AND o.id <> m.id
+                                AND (o.status = ? OR (o.status IN (?, ?) AND o.criada_em < m.criada_em))))
+                        ORDER BY criada_em
+                        LIMIT 1
+                    """, (PENDENTE, RESPONDIDA, agora, PROCESSANDO, PENDENTE, RESPONDIDA)).fetchone()
+                else:
+                    linha = self._db.execute("""
+                        SELECT id, remetente, texto, callback, status, tentativas, resposta, criada_em
+                        FROM mensagens
+                        WHERE status IN (?, ?) AND disponivel_em <= ?
+                        ORDER BY criada_em
+                        LIMIT 1
+                    """, (PENDENTE, RESPONDIDA, agora)).fetchone()
+                if linha is not None:
+                    self._db.execute(
+                        "UPDATE mensagens SET status = ?, atualizada_em = ? WHERE id = ?", (PROCESSANDO, agora, linha[0])
+                    )
+                    chaves = ("id", "remetente", "texto", "callback", "status", "tentativas", "resposta", "criada_em")
+                    return dict(zip(chaves, linha))
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                # Acorda com um novo enfileiramento, uma conclusão ou para rever os backoffs
+                self._disponivel.wait(min(restante, 0.5))
+
+    def responder(self, id_mensagem: str, resposta: str):
+        """Guarda a resposta gerada; a mensagem continua com o worker até a entrega."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE mensagens SET resposta = ?, atualizada_em = ? WHERE id = ?", (resposta, time.time(), id_mensagem)
+            )
+
+    def concluir(self, id_mensagem: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE mensagens SET status = ?, erro = NULL, atualizada_em = ? WHERE id = ?",
+                (CONCLUIDA, time.time(), id_mensagem),
+            )
+            self._disponivel.notify_all()
+
+    def falhar(self, id_mensagem: str, erro: str):
+        """Devolve a mensagem à fila com backoff, ou a marca como falha após `max_tentativas`."""
+        agora = time.time()
+        with self._lock:
+            resposta, tentativas = self._db.execute(
+                "SELECT resposta, tentativas FROM mensagens WHERE id = ?", (id_mensagem,)
+            ).fetchone()
+            tentativas += 1
+            if tentativas >= self.max_tentativas:
+                status, disponivel_em = FALHOU, agora
+            else:
+                status = PENDENTE if resposta is None else RESPONDIDA
+                atraso = min(self.backoff_max, self.backoff_base * 2 ** (tentativas - 1))
+                disponivel_em = agora + random.uniform(atraso / 2, atraso)
+            self._db.execute(
+                "UPDATE mensagens SET status = ?, tentativas = ?, erro = ?, disponivel_em = ?, atualizada_em = ?"
+                " WHERE id = ?",
+                (status, tentativas, str(erro)[:500], disponivel_em, agora, id_mensagem),
+            )
+            self._disponivel.notify_all()
+        return status
+
+    def limpar(self) -> int:
+        """Remove as mensagens concluídas (ou que falharam) há mais de `retencao` segundos."""
+        with self._lock:
+            cur = self._db.execute(
+                "DELETE FROM mensagens WHERE status IN (?, ?) AND atualizada_em < ?",
+                (CONCLUIDA, FALHOU, time.time() - self.retencao),
+            )
+        return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            contagens = dict(self._db.execute("SELECT status, count(*) FROM mensagens GROUP BY status").fetchall())
+            mais_antiga = self._db.execute(
+                "SELECT min(criada_em) FROM mensagens WHERE status = ?", (PENDENTE,)
+            ).fetchone()[0]
+        estatisticas = {status: contagens.get(status, 0) for status in (PENDENTE, PROCESSANDO, RESPONDIDA, CONCLUIDA, FALHOU)}
+        estatisticas["espera_mais_antiga_s"] = time.time() - mais_antiga if mais_antiga else 0.0
+        return estatisticas
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def entregar_callback(url: str, corpo: dict, timeout: float = 10.0):
+    """POST JSON da resposta para o callback; qualquer status fora de 2xx é falha."""
+    dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+    requisicao = urllib.request.Request(url, data=dados, headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+        if not 200 <= resposta.status < 300:
+            raise RuntimeError(f"callback respondeu {resposta.status}")
+
+
+class QueueWorkers:
+    """
+    Pool de `workers` threads que esvazia a fila: gera a resposta com
+    `processar(texto, remetente)` e a entrega com `entregar(url, corpo)`.
+    As respostas só vão para `callback_padrao` ou para um dos `callbacks_permitidos`:
+    o /webhook não é autenticado, então a URL enviada na mensagem não é confiável.
+    """
+
+    def __init__(self, fila: InboundQueue, processar, entregar=entregar_callback, workers: int = 4,
+                 callback_padrao: str = None, callbacks_permitidos=(), intervalo_limpeza: float = 600.0):
+        self.fila = fila
+        self.processar = processar
+        self.entregar = entregar
+        self.workers = workers
+        self.callback_padrao = callback_padrao
+        self.callbacks_permitidos = {url for url in (callback_padrao, *callbacks_permitidos) if url}
+        self.intervalo_limpeza = intervalo_limpeza
+        self._threads = []
+        self._parar = threading.Event()
+        self._ultima_limpeza = time.monotonic()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"fila-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"📥 Fila de mensagens ativa em {self.fila.path} com {self.workers} workers", file=sys.stderr)
+
+    def stop(self, timeout: float = 5.0):
+        self._parar.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def aceitar(self, data: dict) -> tuple:
+        """Enfileira o corpo de um POST no /webhook; retorna (resposta JSON, status HTTP)."""
+        callback = data.get('callback') or self.callback_padrao
+        if not callback:
+            return {'status': 'error', 'message': 'Missing callback'}, 400
+        if callback not in self.callbacks_permitidos:
+            print(f"⚠️ Callback fora da lista permitida recusado: {callback}", file=sys.stderr)
+            return {'status': 'error', 'message': 'Callback not allowed'}, 400
+        id_mensagem = str(data.get('id') or uuid.uuid4().hex)
+        try:
+            nova = self.fila.enfileirar(id_mensagem, data['message'], data.get('sender'), callback)
+        except FilaCheia as e:
+            print(f"⚠️ Fila cheia, mensagem {id_mensagem} recusada: {e}", file=sys.stderr)
+            return {'status': 'error', 'message': 'Queue full'}, 503
+        return {'status': 'queued' if nova else 'duplicate', 'id': id_mensagem}, 202 if nova else 200
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                mensagem = self.fila.reservar()
+                if mensagem is not None:
+                    self._tratar_com_seguranca(mensagem)
+                elif time.monotonic() - self._ultima_limpeza > self.intervalo_limpeza:
+                    self._ultima_limpeza = time.monotonic()
+                    self.fila.limpar()
+            except Exception as e:
+                # Nunca deixa um worker morrer (ex.: disco cheio no SQLite)
+                metrics.contar_erro("fila", "")
+                print(f"🐞 Erro no worker da fila: {e}", file=sys.stderr)
+                time.sleep(1)
+
+    def _tratar_com_seguranca(self, mensagem: dict):
+        """
+        Trata a mensagem reservada; qualquer erro não tratado (ex.: SQLite) a devolve
+        à fila com `falhar`, para ela não ficar presa em PROCESSANDO bloqueando o remetente.
+        """
+        try:
+            self._tratar(mensagem)
+        except Exception as e:
+            metrics.contar_erro("fila", "")
+            print(f"🐞 Erro inesperado na mensagem {mensagem['id']}: {e}", file=sys.stderr)
+            self.fila.falhar(mensagem["id"], e)
+
+    def _tratar(self, mensagem: dict):
+        id_mensagem = mensagem["id"]
+        resposta = mensagem["resposta"]
+        if resposta is None:
+            metrics.ESTAGIOS.observe(time.time() - mensagem["criada_em"], stage="fila", fluxo="")
+            try:
+                resposta = self.processar(mensagem["texto"], mensagem["remetente"])
+            except Exception as e:
+                metrics.contar_erro("fila", "")
+                print(f"🐞 Erro ao processar a mensagem {id_mensagem}: {e}", file=sys.stderr)
+                self.fila.falhar(id_mensagem, e)
+                return
+            if resposta is None:
+                # Absorvida pelo agrupador: a resposta da rajada vai com a última mensagem
+                self.fila.concluir(id_mensagem)
+                return
+            self.fila.responder(id_mensagem, resposta)
+
+        callback = mensagem["callback"]
+        if callback not in self.callbacks_permitidos:
+            # Gravada antes de a lista mudar: vai para o callback do servidor
+            callback = self.callback_padrao
+        try:
+            with metrics.medir("callback", ""):
+                self.entregar(callback, {"id": id_mensagem, "sender": mensagem["remetente"], "response": resposta})
+        except Exception as e:
+            status = self.fila.falhar(id_mensagem, e)
+            print(f"⚠️ Entrega da resposta {id_mensagem} falhou ({e}); {status}", file=sys.stderr)
+            return
+        self.fila.concluir(id_mensagem)
+
+    def coletar_metricas(self):
+        for status, valor in self.fila.stats().items():
+            if status == "espera_mais_antiga_s":
+                yield ("chatbot_queue_oldest_pending_seconds", "gauge",
+                       "Há quanto tempo a mensagem pendente mais antiga espera.", {}, valor)
+            else:
+                yield ("chatbot_queue_messages", "gauge", "Mensagens na fila por status.", {"status": status}, valor)
+
+
+def criar_fila(processar):
+    """
+    Fila e workers configurados pelo ambiente, ou None se `WEBHOOK_QUEUE_PATH`
+    não estiver definido (o /webhook responde na mesma requisição, como antes).
+    `processar(texto, remetente, cancelado)` é o process_message do agente;
+    com o agrupador de rajadas ligado, os workers passam por ele.
+    """
+    path = os.getenv("WEBHOOK_QUEUE_PATH")
+    if not path:
+        return None
+    coalescer = criar_coalescer(processar)
+    fila = InboundQueue(
+        path,
+        max_pendentes=int(os.getenv("WEBHOOK_QUEUE_MAX_PENDING", "10000")),
+        max_tentativas=int(os.getenv("WEBHOOK_QUEUE_MAX_ATTEMPTS", "3")),
+        retencao=float(os.getenv("WEBHOOK_QUEUE_RETENTION_S", "86400")),
+        um_por_remetente=coalescer is None,
+    )
+    workers = QueueWorkers(
+        fila, coalescer.enviar if coalescer is not None else processar,
+        workers=int(os.getenv("WEBHOOK_QUEUE_WORKERS", "4")),
+        callback_padrao=os.getenv("WEBHOOK_CALLBACK_URL", CALLBACK_CONECTOR) or None,
+        callbacks_permitidos=[url.strip() for url in os.getenv("WEBHOOK_CALLBACK_ALLOWLIST", "").split(",")],
+    )
+    metrics.registrar_coletor(workers.coletar_metricas)
+    return workers
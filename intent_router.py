@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import re
+import threading
+from datetime import date
+
+import numpy as np
+
+from text_utils import normalizar_texto
+
+# Frases-protótipo de cada intenção. Os vetores são calculados uma única vez
+# com o mesmo modelo de embeddings do VectorStoreManager.
+PROTOTIPOS = {
+    "especificacoes": [
+        "qual o processador desse celular",
+        "quanta memória RAM ele tem",
+        "qual o tamanho da tela",
+        "quanto custa esse aparelho",
+        "qual o preço do celular",
+        "como é a câmera dele",
+        "quantos mAh tem a bateria",
+        "qual o armazenamento interno",
+        "me passa a ficha técnica completa",
+        "quais as especificações do modelo",
+    ],
+    "comparacao": [
+        "qual a diferença entre esses dois celulares",
+        "compare os dois modelos",
+        "qual é melhor, um ou outro",
+        "esse versus aquele, qual vale mais a pena",
+        "comparação entre os aparelhos",
+        "qual tem a melhor câmera entre os dois",
+    ],
+    "mais_vendidos": [
+        "qual o celular mais vendido",
+        "quais foram os produtos mais vendidos",
+        "qual o campeão de vendas",
+        "top 3 mais vendidos do ano",
+        "qual modelo vendeu mais no mês",
+        "ranking de vendas dos celulares",
+    ],
+    "faturamento": [
+        "qual foi o faturamento do mês",
+        "quanto faturamos em outubro",
+        "qual a receita total do mês",
+        "quanto dinheiro entrou em vendas no mês",
+        "valor total vendido no período",
+        "arrecadação do mês passado",
+    ],
+    "vendas_produto": [
+        "quantas unidades desse modelo foram vendidas",
+        "quantos desse celular vendemos no mês",
+        "vendas desse produto em outubro",
+        "quanto esse modelo vendeu",
+        "número de vendas do aparelho",
+    ],
+    "conversa": [
+        "oi, tudo bem?",
+        "bom dia",
+        "obrigado pela ajuda",
+        "vocês entregam na minha cidade?",
+        "qual celular você recomenda para mim?",
+        "quero um celular bom e barato",
+        "qual o melhor celular para fotos?",
+        "vocês aceitam cartão?",
+    ],
+}
+
+MESES = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+}
+_MES_ANO_NUMERICO = re.compile(r"\b(0?[1-9]|1[0-2])\s*/\s*(20\d{2})\b")
+_ANO = re.compile(r"\b(20\d{2})\b")
+_LIMITE = re.compile(r"\btop\s*(\d{1,2})\b|\b(\d{1,2})\s+(?:mais|menos)\b")
+
+
+def extrair_periodo(texto: str) -> tuple:
+    """
+    Extrai (mes, ano) de um texto em português. Qualquer um pode ser None.
+    Ex.: 'faturamento de outubro de 2025' -> (10, 2025); 'vendas em 03/2024' -> (3, 2024).
+    """
+    normalizado = normalizar_texto(texto)
+    numerico = _MES_ANO_NUMERICO.search(texto)
+    if numerico:
+        return int(numerico.group(1)), int(numerico.group(2))
+
+    mes = None
+    for token in normalizado.split():
+        if token in MESES:
+            mes = MESES[token]
+            break
+    if mes is None and "mes passado" in normalizado:
+        hoje = date.today()
+        return (12, hoje.year - 1) if hoje.month == 1 else (hoje.month - 1, hoje.year)
+    if mes is None and ("este mes" in normalizado or "esse mes" in normalizado):
+        mes = date.today().month
+
+    ano = _ANO.search(normalizado)
+    return mes, (int(ano.group(1)) if ano else None)
+
+
+def extrair_limite(texto: str, padrao: int = 1) -> int:
+    """Extrai o N de perguntas como 'top 3' ou '5 mais vendidos'."""
+    match = _LIMITE.search(normalizar_texto(texto))
+    if not match:
+        return padrao
+    return max(1, int(match.group(1) or match.group(2)))
+
+
+class IntentRouter:
+    """
+    Classificador de intenção local, sem LLM.
+
+    A mensagem é comparada (similaridade de cosseno) com as frases-protótipo de
+    cada intenção; a nota de uma intenção é a maior similaridade entre seus
+    protótipos. Se a melhor nota ficar abaixo de `min_score`, ou muito perto da
+    segunda colocada (`min_margin`), `classify` retorna None e quem chamou deve
+    recorrer ao LLM.
+    """
+
+    def __init__(self, encode, min_score: float = 0.65, min_margin: float = 0.02):
+        self.encode = encode  # recebe uma lista de textos e devolve vetores normalizados
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self._intencoes = None
+        self._matriz = None
+        self._lock = threading.Lock()
+
+    def prepare(self):
+        """Calcula os vetores dos protótipos (uma única vez)."""
+        with self._lock:
+            if self._matriz is not None:
+                return
+            intencoes, frases = [], []
+            for intencao, exemplos in PROTOTIPOS.items():
+                intencoes.extend([intencao] * len(exemplos))
+                frases.extend(exemplos)
+            self._matriz = np.asarray(self.encode(frases), dtype=np.float32)
+            self._intencoes = intencoes
+
+    def scores(self, texto: str) -> dict:
+        """Maior similaridade da mensagem com os protótipos de cada intenção."""
+        self.prepare()
+        vetor = np.asarray(self.encode([texto]), dtype=np.float32)[0]
+        similaridades = self._matriz @ vetor
+        notas = {}
+        for intencao, similaridade in zip(self._intencoes, similaridades):
+            if similaridade > notas.get(intencao, -1.0):
+                notas[intencao] = float(similaridade)
+        return notas
+
+    def classify(self, texto: str) -> tuple:
+        """Retorna (intencao ou None, nota da melhor intenção)."""
+        ranking = sorted(self.scores(texto).items(), key=lambda item: item[1], reverse=True)
+        melhor, nota = ranking[0]
+        segunda = ranking[1][1] if len(ranking) > 1 else -1.0
+        if nota < self.min_score or nota - segunda < self.min_margin:
+            return None, nota
+        return melhor, nota
@@ -0,0 +1,468 @@
+# -*- coding: utf-8 -*-
+"""
+Cliente de chat com controle de latência para o Groq.
+
+- Prazo (deadline) por chamada: nenhuma tentativa passa do tempo restante.
+- Retentativas com backoff exponencial e jitter para erros transitórios
+  (timeout, conexão, 429, 5xx).
+- Hedging: se a resposta não chega no p95 observado do modelo principal, uma
+  segunda requisição é disparada no modelo reserva (menor e mais rápido) e
+  vale a que chegar primeiro. Se o principal falhar, o reserva assume na hora.
+- Disjuntor por modelo: após `falhas_max` falhas seguidas o modelo é evitado
+  por `reset_s` segundos; depois disso uma única requisição de teste decide
+  se ele volta.
+"""
+import asyncio
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import groq
+
+from metrics import LLM_REQUISICOES
+
+
+class LLMTimeout(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+ERROS_TRANSITORIOS = (
+    TimeoutError, asyncio.TimeoutError, LLMTimeout,
+    groq.APITimeoutError, groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError,
+)
+
+
+class LatencyTracker:
+    """Latências recentes de um modelo (janela deslizante) para estimar o p95."""
+
+    def __init__(self, janela: int = 200, min_amostras: int = 20):
+        self.min_amostras = min_amostras
+        self._amostras = deque(maxlen=janela)
+
+    def add(self, segundos: float):
+        self._amostras.append(segundos)
+
+    def percentil(self, p: float):
+        """Retorna o percentil `p` (0-100) ou None se ainda houver poucas amostras."""
+        amostras = sorted(self._amostras)
+        if len(amostras) < self.min_amostras:
+            return None
+        return amostras[min(len(amostras) - 1, int(len(amostras) * p / 100))]
+
+
+class CircuitBreaker:
+    """
+    Disjuntor simples: fechado -> aberto (após falhas seguidas) -> meio-aberto.
+    No estado meio-aberto passa uma única requisição de teste por vez: a falha
+    dela reabre o disjuntor e o sucesso o fecha. Um teste que não foi
+    reportado em `reset_s` segundos (ex.: cancelado) libera a vaga para outro.
+    """
+
+    def __init__(self, falhas_max: int = 5, reset_s: float = 30.0):
+        self.falhas_max = falhas_max
+        self.reset_s = reset_s
+        self.falhas = 0
+        self.aberto_em = None
+        self.teste_em = None  # início da requisição de teste em andamento (meio-aberto)
+        self._lock = threading.Lock()
+
+    @property
+    def estado(self) -> str:
+        if self.aberto_em is None:
+            return "fechado"
+        return "meio-aberto" if time.monotonic() - self.aberto_em >= self.reset_s else "aberto"
+
+    def allow(self) -> bool:
+        """True se a requisição pode seguir; no meio-aberto, reserva a vaga de teste."""
+        with self._lock:
+            estado = self.estado
+            if estado != "meio-aberto":
+                return estado == "fechado"
+            agora = time.monotonic()
+            if self.teste_em is not None and agora - self.teste_em < self.reset_s:
+                return False
+            self.teste_em = agora
+            return True
+
+    def release(self):
+        """Devolve a vaga de teste reservada por allow() e não usada."""
+        with self._lock:
+            self.teste_em = None
+
+    def success(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_em = None
+            self.teste_em = None
+
+    def failure(self) -> bool:
+        """Registra uma falha; retorna True se o disjuntor acabou de (re)abrir."""
+        with self._lock:
+            self.falhas += 1
+            self.teste_em = None
+            if self.estado == "meio-aberto" or (self.aberto_em is None and self.falhas >= self.falhas_max):
+                self.aberto_em = time.monotonic()
+                return True
+            return False
+
+
+class LLMClient:
+    """
+    Envolve os clientes Groq (síncrono e assíncrono) com prazo, retentativas,
+    hedging, modelo reserva e disjuntor. `create`/`acreate` retornam a mesma
+    resposta de `chat.completions.create`; `stream`/`astream` geram os chunks.
+    """
+
+    def __init__(self, client, async_client, model: str, fallback_model: str = None,
+                 deadline: float = 15.0, max_retries: int = 2, hedge: bool = True,
+                 hedge_min_s: float = 0.5, hedge_default_s: float = 3.0,
+                 backoff_base: float = 0.2, backoff_max: float = 2.0,
+                 breaker_failures: int = 5, breaker_reset_s: float = 30.0, threads: int = 32):
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.fallback_model = fallback_model if fallback_model != model else None
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.hedge_min_s = hedge_min_s
+        self.hedge_default_s = hedge_default_s
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        modelos = [model] + ([self.fallback_model] if self.fallback_model else [])
+        self.latencias = {nome: LatencyTracker() for nome in modelos}
+        self.disjuntores = {nome: CircuitBreaker(breaker_failures, breaker_reset_s) for nome in modelos}
+        self.contadores = {"chamadas": 0, "retentativas": 0, "hedges": 0, "hedges_vencedores": 0,
+                           "reservas": 0, "timeouts": 0, "falhas": 0}
+        self._lock = threading.Lock()
+        # As chamadas síncronas rodam aqui para que a espera seja limitada pelo prazo;
+        # uma requisição perdedora termina em segundo plano (no máximo até o próprio timeout)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="llm")
+
+    # ---------- Estado ----------
+
+    def _contar(self, chave: str, n: int = 1):
+        with self._lock:
+            self.contadores[chave] += n
+
+    def _modelos_disponiveis(self) -> list:
+        return [nome for nome, disjuntor in self.disjuntores.items() if disjuntor.allow()]
+
+    def _liberar(self, modelos: list):
+        """Devolve as vagas de teste dos modelos reservados que não chegaram a ser chamados."""
+        for nome in modelos:
+            if self.disjuntores[nome].estado == "meio-aberto":
+                self.disjuntores[nome].release()
+
+    def _atraso_hedge(self) -> float:
+        p95 = self.latencias[self.model].percentil(95)
+        return max(self.hedge_min_s, p95 if p95 is not None else self.hedge_default_s)
+
+    def _sucesso(self, modelo: str, segundos: float = None):
+        if segundos is not None:
+            self.latencias[modelo].add(segundos)
+        self.disjuntores[modelo].success()
+
+    def _falha(self, modelo: str, erro: Exception):
+        self._contar("falhas")
+        if not isinstance(erro, ERROS_TRANSITORIOS):
+            # O modelo respondeu (ex.: requisição inválida): não conta, mas libera o teste
+            self.disjuntores[modelo].release()
+        elif self.disjuntores[modelo].failure():
+            print(f"⛔ Disjuntor aberto para {modelo} após falhas seguidas ({erro})", file=sys.stderr)
+
+    def _espera_backoff(self, tentativa: int, limite: float):
+        """Tempo de espera antes da próxima tentativa (full jitter) ou None se não cabe no prazo."""
+        if tentativa >= self.max_retries:
+            return None
+        espera = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** tentativa))
+        if time.monotonic() + espera >= limite:
+            return None
+        self._contar("retentativas")
+        return espera
+
+    def stats(self) -> dict:
+        with self._lock:
+            resultado = dict(self.contadores)
+        for nome, latencias in self.latencias.items():
+            resultado[f"p95_s:{nome}"] = latencias.percentil(95)
+            resultado[f"disjuntor:{nome}"] = self.disjuntores[nome].estado
+        return resultado
+
+    # ---------- Chamadas síncronas ----------
+
+    def _chamar(self, modelo: str, request: dict, limite: float):
+        inicio = time.monotonic()
+        try:
+            resposta = self.client.chat.completions.create(
+                model=modelo, timeout=max(limite - inicio, 0.01), **request)
+        except Exception as e:
+            LLM_REQUISICOES.observe(time.monotonic() - inicio, modelo=modelo, resultado="erro")
+            self._falha(modelo, e)
+            raise
+        LLM_REQUISICOES.observe(time.monotonic() - inicio, modelo=modelo, resultado="ok")
+        self._sucesso(modelo, time.monotonic() - inicio)
+        return resposta
+
+    def _tentativa(self, request: dict, limite: float):
+        candidatos = self._modelos_disponiveis()
+        if not candidatos:
+            raise CircuitOpen("Serviço de IA temporariamente indisponível.")
+        try:
+            return self._tentar_modelos(candidatos, request, limite)
+        finally:
+            self._liberar(candidatos)
+
+    def _tentar_modelos(self, candidatos: list, request: dict, limite: float):
+        principal = candidatos.pop(0)
+        futuros = {self._executor.submit(self._chamar, principal, request, limite): False}
+        if principal != self.model:
+            self._contar("reservas")
+        hedge_em = time.monotonic() + self._atraso_hedge() if self.hedge else None
+        erro = None
+
+        # futuro -> se é a requisição de hedge
+        while futuros:
+            prazo = limite if hedge_em is None else min(limite, hedge_em)
+            feitos, _ = wait(futuros, timeout=max(prazo - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                e_hedge = futuros.pop(futuro)
+                try:
+                    resposta = futuro.result()
+                except Exception as e:
+                    if not isinstance(e, ERROS_TRANSITORIOS):
+                        raise
+                    erro = e
+                    continue
+                if e_hedge:
+                    self._contar("hedges_vencedores")
+                return resposta
+
+            if time.monotonic() >= limite:
+                break
+            if feitos and not futuros and candidatos:
+                # O principal falhou: o reserva assume sem esperar a próxima tentativa
+                reserva = candidatos.pop(0)
+                print(f"↪️ Usando modelo reserva {reserva}: {erro}", file=sys.stderr)
+                self._contar("reservas")
+                futuros[self._executor.submit(self._chamar, reserva, request, limite)] = False
+                hedge_em = None
+            elif not feitos and hedge_em is not None and time.monotonic() >= hedge_em:
+                alvo = candidatos.pop(0) if candidatos else principal
+                print(f"⏱️ {principal} lento, disparando requisição paralela em {alvo}", file=sys.stderr)
+                self._contar("hedges")
+                futuros[self._executor.submit(self._chamar, alvo, request, limite)] = True
+                hedge_em = None
+
+        if erro is not None and not futuros:
+            raise erro
+        raise LLMTimeout("A IA demorou demais para responder.")
+
+    def create(self, request: dict, deadline: float = None):
+        limite = time.monotonic() + (deadline or self.deadline)
+        self._contar("chamadas")
+        for tentativa in range(self.max_retries + 1):
+            try:
+                return self._tentativa(request, limite)
+            except ERROS_TRANSITORIOS as e:
+                espera = self._espera_backoff(tentativa, limite)
+                if espera is None:
+                    if isinstance(e, LLMTimeout):
+                        self._contar("timeouts")
+                    raise
+                print(f"🔁 Nova tentativa em {espera:.2f}s: {e}", file=sys.stderr)
+                time.sleep(espera)
+
+    def stream(self, request: dict, deadline: float = None):
+        """
+        Abre o stream no primeiro modelo disponível. Retentativas e reserva só
+        valem até o primeiro token; depois disso o texto já foi entregue.
+        """
+        limite = time.monotonic() + (deadline or self.deadline)
+        self._contar("chamadas")
+        erro = None
+        for tentativa in range(self.max_retries + 1):
+            modelos = self._modelos_disponiveis()
+            if not modelos and erro is None:
+                raise CircuitOpen("Serviço de IA temporariamente indisponível.")
+            pendentes = list(modelos)
+            while pendentes:
+                modelo = pendentes.pop(0)
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._liberar([modelo] + pendentes)
+                    break
+                try:
+                    chunks = iter(self.client.chat.completions.create(
+                        model=modelo, stream=True, timeout=restante, **request))
+                    primeiro = next(chunks, None)
+                except Exception as e:
+                    self._falha(modelo, e)
+                    if not isinstance(e, ERROS_TRANSITORIOS):
+                        self._liberar(pendentes)
+                        raise
+                    erro = e
+                    continue
+                self._sucesso(modelo)
+                self._liberar(pendentes)
+                if modelo != self.model:
+                    self._contar("reservas")
+                if primeiro is not None:
+                    yield primeiro
+                yield from chunks
+                return
+            espera = self._espera_backoff(tentativa, limite)
+            if espera is None:
+                break
+            time.sleep(espera)
+        if erro is None:
+            self._contar("timeouts")
+        raise erro or LLMTimeout("A IA demorou demais para responder.")
+
+    # ---------- Chamadas assíncronas ----------
+
+    async def _achamar(self, modelo: str, request: dict, limite: float):
+        inicio = time.monotonic()
+        try:
+            resposta = await self.async_client.chat.completions.create(
+                model=modelo, timeout=max(limite - inicio, 0.01), **request)
+        except asyncio.CancelledError:
+            LLM_REQUISICOES.observe(time.monotonic() - inicio, modelo=modelo, resultado="cancelada")
+            # Perdeu o hedge ou estourou o prazo: sem resultado, a vaga de teste volta
+            self.disjuntores[modelo].release()
+            raise
+        except Exception as e:
+            LLM_REQUISICOES.observe(time.monotonic() - inicio, modelo=modelo, resultado="erro")
+            self._falha(modelo, e)
+            raise
+        LLM_REQUISICOES.observe(time.monotonic() - inicio, modelo=modelo, resultado="ok")
+        self._sucesso(modelo, time.monotonic() - inicio)
+        return resposta
+
+    async def _atentativa(self, request: dict, limite: float):
+        candidatos = self._modelos_disponiveis()
+        if not candidatos:
+            raise CircuitOpen("Serviço de IA temporariamente indisponível.")
+        principal = candidatos.pop(0)
+        tarefas = {asyncio.ensure_future(self._achamar(principal, request, limite)): False}
+        if principal != self.model:
+            self._contar("reservas")
+        hedge_em = time.monotonic() + self._atraso_hedge() if self.hedge else None
+        erro = None
+
+        try:
+            while tarefas:
+                prazo = limite if hedge_em is None else min(limite, hedge_em)
+                feitas, _ = await asyncio.wait(tarefas, timeout=max(prazo - time.monotonic(), 0),
+                                               return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in feitas:
+                    e_hedge = tarefas.pop(tarefa)
+                    try:
+                        resposta = tarefa.result()
+                    except Exception as e:
+                        if not isinstance(e, ERROS_TRANSITORIOS):
+                            raise
+                        erro = e
+                        continue
+                    if e_hedge:
+                        self._contar("hedges_vencedores")
+                    return resposta
+
+                if time.monotonic() >= limite:
+                    break
+                if feitas and not tarefas and candidatos:
+                    reserva = candidatos.pop(0)
+                    print(f"↪️ Usando modelo reserva {reserva}: {erro}", file=sys.stderr)
+                    self._contar("reservas")
+                    tarefas[asyncio.ensure_future(self._achamar(reserva, request, limite))] = False
+                    hedge_em = None
+                elif not feitas and hedge_em is not None and time.monotonic() >= hedge_em:
+                    alvo = candidatos.pop(0) if candidatos else principal
+                    print(f"⏱️ {principal} lento, disparando requisição paralela em {alvo}", file=sys.stderr)
+                    self._contar("hedges")
+                    tarefas[asyncio.ensure_future(self._achamar(alvo, request, limite))] = True
+                    hedge_em = None
+        finally:
+            # A requisição perdedora (ou que estourou o prazo) é cancelada de verdade
+            for tarefa in tarefas:
+                tarefa.cancel()
+            self._liberar(candidatos)
+
+        if erro is not None and not tarefas:
+            raise erro
+        raise LLMTimeout("A IA demorou demais para responder.")
+
+    async def acreate(self, request: dict, deadline: float = None):
+        limite = time.monotonic() + (deadline or self.deadline)
+        self._contar("chamadas")
+        for tentativa in range(self.max_retries + 1):
+            try:
+                return await self._atentativa(request, limite)
+            except ERROS_TRANSITORIOS as e:
+                espera = self._espera_backoff(tentativa, limite)
+                if espera is None:
+                    if isinstance(e, LLMTimeout):
+                        self._contar("timeouts")
+                    raise
+                print(f"🔁 Nova tentativa em {espera:.2f}s: {e}", file=sys.stderr)
+                await asyncio.sleep(espera)
+
+    async def astream(self, request: dict, deadline: float = None):
+        """Equivalente assíncrono de stream."""
+        limite = time.monotonic() + (deadline or self.deadline)
+        self._contar("chamadas")
+        erro = None
+        for tentativa in range(self.max_retries + 1):
+            modelos = self._modelos_disponiveis()
+            if not modelos and erro is None:
+                raise CircuitOpen("Serviço de IA temporariamente indisponível.")
+            pendentes = list(modelos)
+            while pendentes:
+                modelo = pendentes.pop(0)
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    self._liberar([modelo] + pendentes)
+                    break
+                try:
+                    stream = await asyncio.wait_for(self.async_client.chat.completions.create(
+                        model=modelo, stream=True, timeout=restante, **request), restante)
+                    chunks = stream.__aiter__()
+                    primeiro = await asyncio.wait_for(chunks.__anext__(), max(limite - time.monotonic(), 0.01))
+                except StopAsyncIteration:
+                    self._sucesso(modelo)
+                    self._liberar(pendentes)
+                    return
+                except asyncio.CancelledError:
+                    self.disjuntores[modelo].release()
+                    self._liberar(pendentes)
+                    raise
+                except Exception as e:
+                    self._falha(modelo, e)
+                    if not isinstance(e, ERROS_TRANSITORIOS):
+                        self._liberar(pendentes)
+                        raise
+                    erro = e
+                    continue
+                self._sucesso(modelo)
+                self._liberar(pendentes)
+                if modelo != self.model:
+                    self._contar("reservas")
+                yield primeiro
+                async for chunk in chunks:
+                    yield chunk
+                return
+            espera = self._espera_backoff(tentativa, limite)
+            if espera is None:
+                break
+            await asyncio.sleep(espera)
+        if erro is None:
+            self._contar("timeouts")
+        raise erro or LLMTimeout("A IA demorou demais para responder.")
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas do chatbot no formato texto do Prometheus, sem dependências externas.
+
+- `medir(estagio)`: cronometra um trecho no histograma `chatbot_stage_seconds`
+  (por estágio e fluxo) e conta exceções em `chatbot_errors_total`.
+- `fluxo_atual`: fluxo da mensagem em andamento; vale também para o que roda
+  em `asyncio.to_thread`, que copia o contexto.
+- `registrar_coletor(funcao)`: valores lidos só na hora da coleta (pool,
+  caches, tokens), a partir das estatísticas que cada componente já mantém.
+"""
+import contextvars
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+fluxo_atual = contextvars.ContextVar("fluxo_atual", default="")
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{chave}="{_escapar(valor)}"' for chave, valor in labels.items()) + "}"
+
+
+def _numero(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Counter:
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = labels
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **labels):
+        chave = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def amostras(self):
+        with self._lock:
+            valores = dict(self._valores)
+        for chave, valor in sorted(valores.items()):
+            yield self.nome, dict(zip(self.labels, chave)), valor
+
+
+class Histogram:
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # rótulos -> [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, valor: float, **labels):
+        chave = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def amostras(self):
+        with self._lock:
+            series = {chave: (list(contagens), soma, total) for chave, (contagens, soma, total) in self._series.items()}
+        for chave, (contagens, soma, total) in sorted(series.items()):
+            labels = dict(zip(self.labels, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                yield f"{self.nome}_bucket", {**labels, "le": _numero(limite)}, acumulado
+            yield f"{self.nome}_bucket", {**labels, "le": "+Inf"}, total
+            yield f"{self.nome}_sum", labels, soma
+            yield f"{self.nome}_count", labels, total
+
+
+class Registry:
+    def __init__(self):
+        self._metricas = []
+        self._coletores = []
+        self._lock = threading.Lock()
+
+    def counter(self, nome: str, ajuda: str, labels: tuple = ()) -> Counter:
+        metrica = Counter(nome, ajuda, labels)
+        self._metricas.append(metrica)
+        return metrica
+
+    def histogram(self, nome: str, ajuda: str, labels: tuple = (), buckets: tuple = BUCKETS) -> Histogram:
+        metrica = Histogram(nome, ajuda, labels, buckets)
+        self._metricas.append(metrica)
+        return metrica
+
+    def registrar_coletor(self, coletor):
+        """`coletor()` retorna tuplas (nome, tipo, ajuda, rótulos, valor) lidas na hora da coleta."""
+        with self._lock:
+            self._coletores.append(coletor)
+
+    def render(self) -> str:
+        linhas = []
+        for metrica in self._metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            for nome, labels, valor in metrica.amostras():
+                linhas.append(f"{nome}{_rotulos(labels)} {_numero(valor)}")
+
+        # Amostras dos coletores agrupadas por nome (HELP/TYPE uma vez só)
+        agrupadas = {}
+        for coletor in list(self._coletores):
+            try:
+                amostras = list(coletor())
+            except Exception as e:
+                ERROS.inc(stage="metricas", fluxo="")
+                print(f"⚠️ Coletor de métricas falhou: {e}", file=sys.stderr)
+                continue
+            for nome, tipo, ajuda, labels, valor in amostras:
+                if valor is None:
+                    continue
+                agrupadas.setdefault(nome, (tipo, ajuda, []))[2].append((labels, valor))
+        for nome, (tipo, ajuda, amostras) in agrupadas.items():
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for labels, valor in amostras:
+                linhas.append(f"{nome}{_rotulos(labels)} {_numero(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRY = Registry()
+
+MENSAGENS = REGISTRY.histogram(
+    "chatbot_message_seconds", "Tempo total de processamento de uma mensagem.", ("fluxo",))
+ESTAGIOS = REGISTRY.histogram(
+    "chatbot_stage_seconds", "Tempo de cada estágio do processamento.", ("stage", "fluxo"))
+ERROS = REGISTRY.counter(
+    "chatbot_errors_total", "Erros por estágio e fluxo.", ("stage", "fluxo"))
+LLM_REQUISICOES = REGISTRY.histogram(
+    "chatbot_llm_request_seconds", "Tempo de cada requisição ao Groq (incluindo hedges e reservas).",
+    ("modelo", "resultado"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextmanager
+def medir(estagio: str, fluxo: str = None):
+    """Cronometra o bloco como `estagio`; exceções contam como erro e são repassadas."""
+    fluxo = fluxo if fluxo is not None else fluxo_atual.get()
+    inicio = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERROS.inc(stage=estagio, fluxo=fluxo)
+        raise
+    finally:
+        ESTAGIOS.observe(time.perf_counter() - inicio, stage=estagio, fluxo=fluxo)
+
+
+def contar_erro(estagio: str, fluxo: str = None):
+    ERROS.inc(stage=estagio, fluxo=fluxo if fluxo is not None else fluxo_atual.get())
+
+
+def registrar_coletor(coletor):
+    REGISTRY.registrar_coletor(coletor)
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import re
+
+from text_utils import normalizar_texto
+
+
+def _gerar_apelidos(nome_normalizado: str) -> list:
+    """
+    Gera apelidos a partir dos sufixos do nome do modelo:
+    'samsung galaxy a54' -> ['galaxy a54', 'a54'].
+    Só aceita sufixos que identificam o modelo (com algum número) e descarta
+    números soltos como '13', que aparecem em qualquer frase.
+    """
+    tokens = nome_normalizado.split()
+    apelidos = []
+    for i in range(1, len(tokens)):
+        sufixo = tokens[i:]
+        if not any(ch.isdigit() for token in sufixo for ch in token):
+            continue
+        if len(sufixo) == 1 and sufixo[0].isdigit():
+            continue
+        apelidos.append(" ".join(sufixo))
+    return apelidos
+
+
+def _trie_para_regex(trie: dict) -> str:
+    """Converte uma trie de caracteres em uma regex com prefixos fatorados."""
+    fim = "" in trie
+    ramos = [re.escape(ch) + _trie_para_regex(filho) for ch, filho in sorted(trie.items()) if ch]
+    if not ramos:
+        return ""
+    corpo = ramos[0] if len(ramos) == 1 else "(?:" + "|".join(ramos) + ")"
+    if fim:
+        # O maior casamento vence: tenta continuar antes de aceitar o fim aqui
+        return "(?:" + corpo + ")?"
+    return corpo
+
+
+class ModelMatcher:
+    """
+    Encontra menções a modelos do catálogo em uma única passada sobre o texto.
+
+    Nomes completos, apelidos explícitos e apelidos gerados automaticamente são
+    normalizados (minúsculas, sem acentos) e compilados uma única vez em uma
+    regex em forma de trie, com limites de palavra. Um apelido que aponta para
+    mais de um modelo é descartado por ser ambíguo.
+    """
+
+    def __init__(self, modelos: list, apelidos: dict = None):
+        gerados = {}
+        for modelo in modelos:
+            for apelido in _gerar_apelidos(normalizar_texto(modelo)):
+                gerados.setdefault(apelido, set()).add(modelo)
+
+        self.termos = {apelido: next(iter(alvos)) for apelido, alvos in gerados.items() if len(alvos) == 1}
+        for apelido, modelo in (apelidos or {}).items():
+            self.termos[normalizar_texto(apelido)] = modelo
+        for modelo in modelos:
+            self.termos[normalizar_texto(modelo)] = modelo
+        self.termos.pop("", None)
+        self.modelos = list(modelos)
+
+        trie = {}
+        for termo in self.termos:
+            no = trie
+            for ch in termo:
+                no = no.setdefault(ch, {})
+            no[""] = {}
+        corpo = _trie_para_regex(trie) or r"(?!x)x"
+        self._regex = re.compile(r"(?<![a-z0-9])(" + corpo + r")(?![a-z0-9])")
+
+    def find_all(self, texto: str) -> list:
+        """Todos os modelos mencionados, na ordem em que aparecem, sem repetição."""
+        encontrados = []
+        for match in self._regex.finditer(normalizar_texto(texto)):
+            modelo = self.termos.get(match.group(1))
+            if modelo and modelo not in encontrados:
+                encontrados.append(modelo)
+        return encontrados
+
+    def first(self, texto: str):
+        """O primeiro modelo mencionado no texto, ou None."""
+        for match in self._regex.finditer(normalizar_texto(texto)):
+            modelo = self.termos.get(match.group(1))
+            if modelo:
+                return modelo
+        return None
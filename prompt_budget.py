@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Contabilidade de tokens dos prompts enviados ao Groq.
+
+Os tokens são estimados antes do envio (para caber no orçamento de cada fluxo)
+e os números reais (`usage` da resposta do Groq) são somados depois, junto com
+quanto a compactação economizou. Se `PROMPT_TOKENIZER` apontar para um
+tokenizer.json (ex.: o do Llama 3), a contagem usa o tokenizador de verdade;
+senão, uma estimativa por caracteres.
+"""
+import json
+import math
+import os
+import sys
+import threading
+
+CARACTERES_POR_TOKEN = 3.5
+TOKENS_POR_MENSAGEM = 4  # papel + delimitadores de cada mensagem no template de chat
+
+_tokenizer = None
+_tokenizer_carregado = False
+
+
+def _carregar_tokenizer():
+    global _tokenizer, _tokenizer_carregado
+    if _tokenizer_carregado:
+        return _tokenizer
+    _tokenizer_carregado = True
+    caminho = os.getenv("PROMPT_TOKENIZER")
+    if caminho:
+        try:
+            from tokenizers import Tokenizer
+            _tokenizer = Tokenizer.from_file(caminho)
+        except Exception as e:
+            print(f"⚠️ Tokenizador {caminho} indisponível ({e}). Usando estimativa.", file=sys.stderr)
+    return _tokenizer
+
+
+def contar_tokens(texto: str) -> int:
+    if not texto:
+        return 0
+    tokenizer = _carregar_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(texto, add_special_tokens=False).ids)
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+
+def tokens_da_requisicao(request: dict) -> int:
+    """Tokens de prompt de uma requisição de chat: mensagens e esquemas das ferramentas."""
+    total = sum(contar_tokens(m.get("content") or "") + TOKENS_POR_MENSAGEM for m in request.get("messages", []))
+    if request.get("tools"):
+        total += contar_tokens(json.dumps(request["tools"], ensure_ascii=False, separators=(",", ":")))
+    return total
+
+
+def cortar_texto(texto: str, max_tokens: int) -> str:
+    """Corta o texto em um limite de palavra para caber em `max_tokens`."""
+    if max_tokens <= 0:
+        return ""
+    if contar_tokens(texto) <= max_tokens:
+        return texto
+    limite = int(max_tokens * CARACTERES_POR_TOKEN)
+    while limite > 0:
+        corte = texto[:limite]
+        espaco = corte.rfind(" ")
+        corte = (corte[:espaco] if espaco > limite // 2 else corte).rstrip() + "…"
+        if contar_tokens(corte) <= max_tokens:
+            return corte
+        limite = int(limite * 0.9)
+    return ""
+
+
+def ajustar_documentos(documentos: list, max_tokens: int, minimo_por_doc: int = 60) -> list:
+    """
+    Faz os documentos caberem em `max_tokens`, mantendo a ordem: documentos
+    curtos entram inteiros e a sobra da cota deles vai para os mais longos, que
+    são cortados. Se não der nem `minimo_por_doc` tokens para cada um, os
+    últimos (menos relevantes) são descartados.
+    """
+    documentos = [d for d in documentos if d]
+    while documentos and max_tokens // len(documentos) < minimo_por_doc:
+        documentos = documentos[:-1]
+    tamanhos = [contar_tokens(d) for d in documentos]
+    cotas = [0] * len(documentos)
+    restante = max_tokens
+    for k, i in enumerate(sorted(range(len(documentos)), key=tamanhos.__getitem__)):
+        cotas[i] = min(tamanhos[i], restante // (len(documentos) - k))
+        restante -= cotas[i]
+    ajustados = [d if cotas[i] >= tamanhos[i] else cortar_texto(d, cotas[i]) for i, d in enumerate(documentos)]
+    return [d for d in ajustados if d]
+
+
+class PromptBudget:
+    """Orçamento de tokens de prompt por fluxo e totais para acompanhar o custo."""
+
+    def __init__(self, orcamentos: dict, padrao: int = 1500):
+        self.orcamentos = dict(orcamentos)
+        self.padrao = padrao
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def orcamento(self, fluxo: str) -> int:
+        return self.orcamentos.get(fluxo, self.padrao)
+
+    def _linha(self, fluxo: str) -> dict:
+        return self._stats.setdefault(fluxo, {
+            "prompts": 0, "tokens_estimados": 0, "tokens_economizados": 0, "acima_do_orcamento": 0,
+            "chamadas": 0, "tokens_prompt": 0, "tokens_resposta": 0,
+        })
+
+    def medir(self, fluxo: str, request: dict, tokens_originais: int = None) -> int:
+        """Registra o tamanho de um prompt montado (e quanto a compactação economizou)."""
+        tokens = tokens_da_requisicao(request)
+        with self._lock:
+            linha = self._linha(fluxo)
+            linha["prompts"] += 1
+            linha["tokens_estimados"] += tokens
+            if tokens_originais is not None and tokens_originais > tokens:
+                linha["tokens_economizados"] += tokens_originais - tokens
+            if tokens > self.orcamento(fluxo):
+                linha["acima_do_orcamento"] += 1
+        if tokens > self.orcamento(fluxo):
+            print(f"⚠️ Prompt do fluxo {fluxo} com ~{tokens} tokens (orçamento {self.orcamento(fluxo)})", file=sys.stderr)
+        return tokens
+
+    def registrar_uso(self, fluxo: str, usage):
+        """Soma os tokens reais informados pelo Groq na resposta."""
+        if usage is None:
+            return
+        with self._lock:
+            linha = self._linha(fluxo)
+            linha["chamadas"] += 1
+            linha["tokens_prompt"] += getattr(usage, "prompt_tokens", 0) or 0
+            linha["tokens_resposta"] += getattr(usage, "completion_tokens", 0) or 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {fluxo: dict(linha, orcamento=self.orcamento(fluxo)) for fluxo, linha in self._stats.items()}
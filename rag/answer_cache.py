@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Cache de respostas do LLM indexado pelo embedding da pergunta: uma pergunta
+    nova com similaridade de cosseno >= `limiar` com uma já respondida recebe a
+    mesma resposta, sem chamar o Groq.
+
+    - Só casa entradas do mesmo `escopo` (modelos/fabricantes citados), para
+      "melhor Samsung pra foto" não responder "melhor Xiaomi pra foto".
+    - Entradas expiram após `ttl` segundos; acima de `max_size`, saem as usadas
+      há mais tempo (LRU).
+    - Tudo é descartado quando a `versao` da coleção de documentos muda.
+    Os vetores devem vir normalizados (produto interno = cosseno).
+    """
+
+    def __init__(self, limiar: float = 0.92, ttl: float = 3600.0, max_size: int = 1000):
+        self.limiar = limiar
+        self.ttl = ttl
+        self.max_size = max_size
+        self.versao = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+        self._data = OrderedDict()  # id -> (vetor, resposta, escopo, criada_em, pergunta), em ordem de uso (LRU)
+        self._criacao = OrderedDict()  # id -> criada_em, em ordem de criação (para expirar)
+        self._matriz = None         # vetores empilhados na ordem de _data (refeita após mudanças)
+        self._ids = []
+        self._proximo_id = 0
+        self._lock = threading.Lock()
+
+    def _sincronizar_versao(self, versao):
+        if versao != self.versao:
+            if self._data:
+                self.invalidacoes += 1
+            self._data.clear()
+            self._criacao.clear()
+            self._matriz = None
+            self.versao = versao
+
+    def _expirar(self, agora: float):
+        # As mais antigas estão na frente: para na primeira ainda válida
+        expirou = False
+        while self._criacao:
+            chave, criada_em = next(iter(self._criacao.items()))
+            if agora - criada_em <= self.ttl:
+                break
+            del self._criacao[chave]
+            del self._data[chave]
+            expirou = True
+        if expirou:
+            self._matriz = None
+
+    def buscar(self, vetor, escopo=(), versao=None):
+        """Resposta guardada para a pergunta mais parecida (acima do limiar), ou None."""
+        agora = time.time()
+        with self._lock:
+            self._sincronizar_versao(versao)
+            self._expirar(agora)
+            if self._matriz is None and self._data:
+                self._ids = list(self._data)
+                self._matriz = np.stack([entrada[0] for entrada in self._data.values()])
+            melhor = None
+            if self._data:
+                notas = self._matriz @ np.asarray(vetor, dtype=np.float32)
+                for i in np.argsort(-notas):
+                    if notas[i] < self.limiar:
+                        break
+                    if self._data[self._ids[i]][2] == escopo:
+                        melhor = self._ids[i]
+                        break
+            if melhor is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._data.move_to_end(melhor)
+            return self._data[melhor][1]
+
+    def guardar(self, pergunta: str, vetor, resposta: str, escopo=(), versao=None):
+        with self._lock:
+            self._sincronizar_versao(versao)
+            criada_em = time.time()
+            self._data[self._proximo_id] = (np.asarray(vetor, dtype=np.float32), resposta, escopo, criada_em, pergunta)
+            self._criacao[self._proximo_id] = criada_em
+            self._proximo_id += 1
+            while len(self._data) > self.max_size:
+                chave, _ = self._data.popitem(last=False)
+                del self._criacao[chave]
+            self._matriz = None
+
+    def invalidar(self):
+        with self._lock:
+            if self._data:
+                self.invalidacoes += 1
+            self._data.clear()
+            self._criacao.clear()
+            self._matriz = None
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "tamanho": len(self._data),
+            "max": self.max_size,
+            "acertos": self.hits,
+            "erros": self.misses,
+            "taxa_acerto": self.hits / total if total else 0.0,
+            "invalidacoes": self.invalidacoes,
+        }
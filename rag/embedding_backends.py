@@ -0,0 +1,187 @@
+"""
+Backends de embeddings para o VectorStoreManager.
+
+- "torch" (padrão): SentenceTransformer com PyTorch.
+- "onnx": o mesmo modelo exportado para ONNX (opcionalmente quantizado em int8)
+  rodando no onnxruntime, sem importar torch. Usa o mesmo pooling (token CLS) e
+  a mesma normalização, então os vetores são compatíveis com a coleção existente.
+
+Uso:
+    python -m rag.embedding_backends export [--int8]   # gera ./data/onnx/<modelo>
+    python -m rag.embedding_backends parity [--int8]   # compara com o PyTorch
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+MODELO_PADRAO = "BAAI/bge-small-en-v1.5"
+
+TEXTOS_PARIDADE = [
+    "Qual o processador do Xiaomi 13T?",
+    "Quanto custa o iPhone 15 Pro Max?",
+    "Qual a diferença entre Samsung Galaxy A54 e Motorola Moto G54?",
+    "qual o melhor celular pra foto?",
+    "Oi, tudo bem? Vocês entregam em São Paulo?",
+    "Modelo: Samsung Galaxy S24 Ultra\nFabricante: Samsung\nPontos Fortes: câmera, tela, bateria",
+]
+
+
+def diretorio_onnx(model_name: str = MODELO_PADRAO) -> str:
+    return os.getenv("EMBEDDING_ONNX_DIR") or os.path.join("data", "onnx", model_name.split("/")[-1])
+
+
+def nome_backend() -> str:
+    """Identifica o backend configurado (usado também para separar caches)."""
+    backend = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+    if backend == "onnx" and os.getenv("EMBEDDING_ONNX_INT8", "0") == "1":
+        return "onnx-int8"
+    return backend
+
+
+def _normalizar(vetores: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    return vetores / np.clip(normas, 1e-12, None)
+
+
+class SentenceTransformerBackend:
+    name = "torch"
+
+    def __init__(self, model_name: str = MODELO_PADRAO):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts) -> np.ndarray:
+        return self.model.encode(texts, normalize_embeddings=True)
+
+
+class OnnxBackend:
+    """Executa o modelo exportado no onnxruntime (CPU), com pooling CLS como o SentenceTransformer do BGE."""
+
+    def __init__(self, model_dir: str, int8: bool = False, max_length: int = 512, batch_size: int = 32):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("O backend ONNX precisa de 'onnxruntime' e 'tokenizers' (pip install onnxruntime tokenizers).") from e
+
+        arquivo = os.path.join(model_dir, "model.int8.onnx" if int8 else "model.onnx")
+        if not os.path.exists(arquivo):
+            raise FileNotFoundError(f"{arquivo} não encontrado. Rode: python -m rag.embedding_backends export{' --int8' if int8 else ''}")
+
+        self.name = "onnx-int8" if int8 else "onnx"
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+
+        opcoes = ort.SessionOptions()
+        threads = os.getenv("EMBEDDING_ONNX_THREADS")
+        if threads:
+            opcoes.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(arquivo, sess_options=opcoes, providers=["CPUExecutionProvider"])
+        self._entradas = {entrada.name for entrada in self.session.get_inputs()}
+
+    def encode(self, texts) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+        resultados = []
+        for inicio in range(0, len(texts), self.batch_size):
+            lote = self.tokenizer.encode_batch(list(texts[inicio:inicio + self.batch_size]))
+            entradas = {
+                "input_ids": np.array([t.ids for t in lote], dtype=np.int64),
+                "attention_mask": np.array([t.attention_mask for t in lote], dtype=np.int64),
+            }
+            if "token_type_ids" in self._entradas:
+                entradas["token_type_ids"] = np.array([t.type_ids for t in lote], dtype=np.int64)
+            ultima_camada = self.session.run(None, entradas)[0]
+            resultados.append(_normalizar(ultima_camada[:, 0]))
+        return np.concatenate(resultados).astype(np.float32)
+
+
+def criar_backend(model_name: str = MODELO_PADRAO):
+    """Cria o backend escolhido por EMBEDDING_BACKEND ("torch" ou "onnx")."""
+    backend = nome_backend()
+    if backend.startswith("onnx"):
+        return OnnxBackend(diretorio_onnx(model_name), int8=backend == "onnx-int8")
+    return SentenceTransformerBackend(model_name)
+
+
+def export_onnx(model_name: str = MODELO_PADRAO, out_dir: str = None, int8: bool = False) -> str:
+    """Exporta o modelo para ONNX (e opcionalmente gera a versão int8). Precisa de torch e transformers."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = out_dir or diretorio_onnx(model_name)
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out_dir)
+
+    exemplo = tokenizer(["exemplo"], return_tensors="pt")
+    nomes = list(exemplo.keys())
+    eixos = {nome: {0: "batch", 1: "sequencia"} for nome in nomes}
+    eixos["last_hidden_state"] = {0: "batch", 1: "sequencia"}
+    arquivo = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            model, tuple(exemplo[nome] for nome in nomes), arquivo,
+            input_names=nomes, output_names=["last_hidden_state"],
+            dynamic_axes=eixos, opset_version=14,
+        )
+    print(f"✅ Modelo exportado para {arquivo}", file=sys.stderr)
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        arquivo_int8 = os.path.join(out_dir, "model.int8.onnx")
+        quantize_dynamic(arquivo, arquivo_int8, weight_type=QuantType.QInt8)
+        print(f"✅ Versão int8 gerada em {arquivo_int8}", file=sys.stderr)
+    return out_dir
+
+
+def parity_check(referencia, candidato, textos=None, min_cosine: float = 0.99) -> dict:
+    """
+    Compara dois backends nos mesmos textos. Como ambos normalizam os vetores,
+    o produto escalar é a similaridade de cosseno entre eles.
+    """
+    textos = textos or TEXTOS_PARIDADE
+    t0 = time.perf_counter()
+    a = np.asarray(referencia.encode(textos), dtype=np.float32)
+    t1 = time.perf_counter()
+    b = np.asarray(candidato.encode(textos), dtype=np.float32)
+    t2 = time.perf_counter()
+    cossenos = np.sum(a * b, axis=1)
+    return {
+        "cosseno_min": float(cossenos.min()),
+        "cosseno_medio": float(cossenos.mean()),
+        "ms_por_texto_referencia": (t1 - t0) * 1000 / len(textos),
+        "ms_por_texto_candidato": (t2 - t1) * 1000 / len(textos),
+        "ok": bool(cossenos.min() >= min_cosine),
+    }
+
+
+def main():
+    args = sys.argv[1:]
+    int8 = "--int8" in args
+    if not args or args[0] not in ("export", "parity"):
+        print(__doc__)
+        sys.exit(1)
+
+    if args[0] == "export":
+        export_onnx(int8=int8)
+        return
+
+    resultado = parity_check(
+        SentenceTransformerBackend(),
+        OnnxBackend(diretorio_onnx(), int8=int8),
+        min_cosine=0.98 if int8 else 0.999,
+    )
+    for chave, valor in resultado.items():
+        print(f"{chave}: {valor}")
+    if not resultado["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
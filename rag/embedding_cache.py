@@ -0,0 +1,103 @@
+import atexit
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalizar_consulta(texto: str) -> str:
+    """Chave do cache: minúsculas e espaços colapsados ('Oi,  Tudo bem?' -> 'oi, tudo bem?')."""
+    return " ".join(texto.lower().split())
+
+
+class EmbeddingCache:
+    """
+    Cache LRU de embeddings de consultas, com tamanho máximo e contadores de
+    acerto/erro. Se `path` for informado, o cache é lido na criação e gravado
+    em disco (formato .npz) a cada `save_every` inserções e ao sair do processo.
+    Vetores gravados por outro modelo (`model_id` diferente) são ignorados.
+    """
+
+    def __init__(self, max_size: int = 2048, path: str = None, model_id: str = "", save_every: int = 100):
+        self.max_size = max_size
+        self.path = path
+        self.model_id = model_id
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, texto: str):
+        chave = normalizar_consulta(texto)
+        with self._lock:
+            vetor = self._data.get(chave)
+            if vetor is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(chave)
+            self.hits += 1
+            return vetor
+
+    def put(self, texto: str, vetor):
+        chave = normalizar_consulta(texto)
+        with self._lock:
+            self._data[chave] = np.asarray(vetor, dtype=np.float32)
+            self._data.move_to_end(chave)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+            self._unsaved += 1
+            salvar = self.path and self._unsaved >= self.save_every
+        if salvar:
+            self.save()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "tamanho": len(self._data),
+            "max": self.max_size,
+            "acertos": self.hits,
+            "erros": self.misses,
+            "taxa_acerto": self.hits / total if total else 0.0,
+        }
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as arquivo:
+                if str(arquivo["model_id"]) != self.model_id:
+                    return
+                chaves, vetores = arquivo["chaves"], arquivo["vetores"]
+            with self._lock:
+                for chave, vetor in zip(chaves[-self.max_size:], vetores[-self.max_size:]):
+                    self._data[str(chave)] = vetor
+            print(f"💾 Cache de embeddings carregado: {len(self._data)} consultas", file=sys.stderr)
+        except Exception as e:
+            print(f"⚠️ Não foi possível ler o cache de embeddings: {e}", file=sys.stderr)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._data:
+                return
+            chaves = np.array(list(self._data.keys()))
+            vetores = np.stack(list(self._data.values()))
+            self._unsaved = 0
+        try:
+            diretorio = os.path.dirname(self.path)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            temporario = self.path + ".tmp.npz"
+            np.savez(temporario, chaves=chaves, vetores=vetores, model_id=np.array(self.model_id))
+            os.replace(temporario, self.path)
+        except Exception as e:
+            print(f"⚠️ Não foi possível gravar o cache de embeddings: {e}", file=sys.stderr)
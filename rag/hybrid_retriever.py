@@ -0,0 +1,165 @@
+import hashlib
+import math
+import sys
+import threading
+import time
+from collections import Counter
+
+import metrics
+from text_utils import normalizar_texto
+
+STOPWORDS = {
+    "a", "o", "as", "os", "um", "uma", "de", "da", "do", "das", "dos", "e", "em", "no", "na",
+    "nos", "nas", "para", "pra", "por", "com", "que", "qual", "quais", "se", "me", "eu", "voce",
+    "ele", "ela", "isso", "esse", "essa", "este", "esta", "mais", "muito", "tem", "ter", "ser",
+    "ou", "ao", "aos", "the", "of", "and", "to", "is",
+}
+
+
+def tokenizar(texto: str) -> list:
+    return [token for token in normalizar_texto(texto).split() if token not in STOPWORDS]
+
+
+class HybridRetriever:
+    """
+    Busca híbrida sobre a coleção do ChromaDB: BM25 em um índice invertido em
+    memória + busca vetorial, combinadas por Reciprocal Rank Fusion.
+
+    Quando a mensagem cita modelos ou fabricantes, os candidatos são
+    pré-filtrados pelos metadados `modelo`/`fabricante` antes das duas buscas.
+    O índice é reconstruído quando o número de documentos da coleção muda
+    (verificado no máximo a cada `refresh_interval` segundos) e, de qualquer
+    forma, a cada `rebuild_interval` segundos, para captar textos atualizados.
+    """
+
+    def __init__(self, vs_manager, k1: float = 1.5, b: float = 0.75, rrf_k: int = 60,
+                 refresh_interval: float = 60.0, rebuild_interval: float = 600.0):
+        self.vs_manager = vs_manager
+        self.k1 = k1
+        self.b = b
+        self.rrf_k = rrf_k
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+
+        # Índice trocado de uma vez a cada reconstrução (leituras concorrentes veem um estado consistente)
+        self._snap = {"ids": [], "posicoes": {}, "documentos": [], "metadados": [], "indice": {},
+                      "tamanhos": [], "tamanho_medio": 0.0, "fabricantes": {}}
+        self._total = None
+        # Impressão digital do conteúdo indexado: muda quando algum documento entra, sai ou é alterado
+        self.versao = None
+        self._checked_at = 0.0
+        self._built_at = 0.0
+        self._lock = threading.Lock()
+
+    # ---------- Índice ----------
+
+    def _build(self):
+        dados = self.vs_manager.collection.get(include=["documents", "metadatas"])
+        indice = {}
+        tamanhos = []
+        fabricantes = {}
+        for posicao, documento in enumerate(dados["documents"]):
+            termos = Counter(tokenizar(documento or ""))
+            tamanhos.append(sum(termos.values()))
+            for termo, frequencia in termos.items():
+                indice.setdefault(termo, []).append((posicao, frequencia))
+            fabricante = (dados["metadatas"][posicao] or {}).get("fabricante")
+            if fabricante:
+                fabricantes[normalizar_texto(fabricante)] = fabricante
+
+        self._snap = {
+            "ids": dados["ids"],
+            "posicoes": {doc_id: i for i, doc_id in enumerate(dados["ids"])},
+            "documentos": dados["documents"],
+            "metadados": [metadata or {} for metadata in dados["metadatas"]],
+            "indice": indice,
+            "tamanhos": tamanhos,
+            "tamanho_medio": (sum(tamanhos) / len(tamanhos)) if tamanhos else 0.0,
+            "fabricantes": fabricantes,
+        }
+        self._total = len(dados["ids"])
+        digest = hashlib.md5()
+        for doc_id, documento in sorted(zip(dados["ids"], dados["documents"])):
+            digest.update(f"{doc_id}\0{documento or ''}\0".encode("utf-8"))
+        self.versao = digest.hexdigest()
+        self._built_at = time.monotonic()
+        print(f"🔎 Índice BM25 construído: {self._total} documentos, {len(indice)} termos", file=sys.stderr)
+
+    def ensure_fresh(self):
+        if self._total is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return
+        with self._lock:
+            if (self._total is None or time.monotonic() - self._built_at >= self.rebuild_interval
+                    or self.vs_manager.collection.count() != self._total):
+                self._build()
+            self._checked_at = time.monotonic()
+
+    # ---------- Busca ----------
+
+    def _bm25(self, snap: dict, termos: list, candidatos) -> list:
+        total = len(snap["ids"])
+        tamanhos, tamanho_medio = snap["tamanhos"], snap["tamanho_medio"] or 1
+        notas = {}
+        for termo in set(termos):
+            postagens = snap["indice"].get(termo)
+            if not postagens:
+                continue
+            idf = math.log(1 + (total - len(postagens) + 0.5) / (len(postagens) + 0.5))
+            for posicao, frequencia in postagens:
+                if candidatos is not None and posicao not in candidatos:
+                    continue
+                normalizacao = 1 - self.b + self.b * tamanhos[posicao] / tamanho_medio
+                notas[posicao] = notas.get(posicao, 0.0) + idf * frequencia * (self.k1 + 1) / (frequencia + self.k1 * normalizacao)
+        return sorted(notas, key=notas.get, reverse=True)
+
+    def fabricantes_mencionados(self, texto: str) -> list:
+        tokens = f" {normalizar_texto(texto)} "
+        return [nome for chave, nome in self._snap["fabricantes"].items() if f" {chave} " in tokens]
+
+    @staticmethod
+    def _filtro(snap: dict, modelos: list, fabricantes: list):
+        """Retorna (where do ChromaDB, posições candidatas) ou (None, None) sem filtro."""
+        if modelos:
+            campo, valores = "modelo", set(modelos)
+        elif fabricantes:
+            campo, valores = "fabricante", set(fabricantes)
+        else:
+            return None, None
+        candidatos = {i for i, metadata in enumerate(snap["metadados"]) if metadata.get(campo) in valores}
+        if not candidatos:
+            return None, None
+        return {campo: {"$in": sorted(valores)}}, candidatos
+
+    def search(self, query: str, n_results: int = 2, modelos: list = None) -> dict:
+        """Mesmo formato de VectorStoreManager.search (listas aninhadas por consulta)."""
+        with metrics.medir("retrieval"):
+            return self._search(query, n_results, modelos)
+
+    def _search(self, query: str, n_results: int, modelos: list) -> dict:
+        self.ensure_fresh()
+        snap = self._snap
+        where, candidatos = self._filtro(snap, modelos, self.fabricantes_mencionados(query))
+        limite = len(candidatos) if candidatos is not None else len(snap["ids"])
+        profundidade = min(max(n_results * 5, 10), limite)
+        if profundidade == 0:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]]}
+
+        lexicos = self._bm25(snap, tokenizar(query), candidatos)[:profundidade]
+        vetoriais = self.vs_manager.search(query, n_results=profundidade, where=where)
+        posicoes = snap["posicoes"]
+
+        # Reciprocal Rank Fusion: só a posição em cada ranking importa, não a escala das notas
+        notas = {}
+        for rank, posicao in enumerate(lexicos):
+            notas[posicao] = notas.get(posicao, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        for rank, doc_id in enumerate(vetoriais.get("ids", [[]])[0]):
+            posicao = posicoes.get(doc_id)
+            if posicao is not None:
+                notas[posicao] = notas.get(posicao, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+
+        melhores = sorted(notas, key=notas.get, reverse=True)[:n_results]
+        return {
+            "ids": [[snap["ids"][i] for i in melhores]],
+            "documents": [[snap["documentos"][i] for i in melhores]],
+            "metadatas": [[snap["metadados"][i] for i in melhores]],
+        }
@@ -0,0 +1,136 @@
+"""
+Ingestão incremental de arquivos de texto (manuais, anotações) no ChromaDB.
+
+Os arquivos são lidos em blocos e divididos em trechos com sobreposição, sem
+carregar o arquivo inteiro na memória. Cada trecho recebe um ID derivado do
+hash do seu conteúdo (e do arquivo de origem): trechos que já estão na coleção
+não são reenviados ao modelo de embeddings, e trechos que sumiram do arquivo
+são apagados.
+
+Uso:
+    python -m rag.ingest                      # todos os .txt de backup_info/
+    python -m rag.ingest manual.txt outro.txt
+"""
+import glob
+import hashlib
+import os
+import sys
+
+ORIGEM_PADRAO = os.path.join("backup_info", "*.txt")
+
+
+def ler_em_blocos(caminho: str, tamanho_bloco: int = 64 * 1024):
+    """Lê um arquivo de texto em blocos de até `tamanho_bloco` caracteres."""
+    with open(caminho, "r", encoding="utf-8", errors="replace") as arquivo:
+        while True:
+            bloco = arquivo.read(tamanho_bloco)
+            if not bloco:
+                return
+            yield bloco
+
+
+def _ponto_de_corte(texto: str, limite: int) -> int:
+    """Melhor ponto para cortar até `limite`: fim de parágrafo, de frase ou espaço."""
+    minimo = limite // 2
+    for separador in ("\n\n", "\n", ". ", " "):
+        posicao = texto.rfind(separador, minimo, limite)
+        if posicao != -1:
+            return posicao + len(separador)
+    return limite
+
+
+def gerar_trechos(blocos, tamanho: int = 1000, sobreposicao: int = 200):
+    """
+    Divide um fluxo de blocos de texto em trechos de até `tamanho` caracteres,
+    repetindo os últimos `sobreposicao` caracteres no início do trecho seguinte.
+    A memória usada é limitada a um bloco mais um trecho.
+    """
+    if sobreposicao >= tamanho:
+        raise ValueError("A sobreposição deve ser menor que o tamanho do trecho.")
+
+    buffer = ""
+    for bloco in blocos:
+        buffer += bloco
+        while len(buffer) > tamanho:
+            corte = _ponto_de_corte(buffer, tamanho)
+            trecho = buffer[:corte].strip()
+            if trecho:
+                yield trecho
+            inicio = max(corte - sobreposicao, 1)
+            # Começa a sobreposição em um limite de palavra
+            espaco = buffer.find(" ", inicio, corte)
+            buffer = buffer[espaco + 1 if espaco != -1 else inicio:]
+    trecho = buffer.strip()
+    if trecho:
+        yield trecho
+
+
+def id_trecho(texto: str, fonte: str = "") -> str:
+    """ID determinístico: hash do arquivo de origem e do conteúdo do trecho."""
+    normalizado = " ".join(texto.split())
+    return hashlib.sha256(f"{fonte}\x00{normalizado}".encode("utf-8")).hexdigest()[:32]
+
+
+def ingerir_arquivo(vs_manager, caminho: str, batch_size: int = 32,
+                    tamanho: int = 1000, sobreposicao: int = 200) -> dict:
+    """
+    Ingere um arquivo de forma incremental. Retorna quantos trechos foram
+    adicionados, quantos já existiam e quantos foram removidos.
+    """
+    fonte = os.path.basename(caminho)
+    colecao = vs_manager.collection
+    vistos = set()
+    stats = {"novos": 0, "inalterados": 0, "removidos": 0}
+    lote = []
+
+    def enviar(lote):
+        ids = [item[0] for item in lote]
+        existentes = set(colecao.get(ids=ids, include=[])["ids"])
+        novos = [item for item in lote if item[0] not in existentes]
+        stats["inalterados"] += len(lote) - len(novos)
+        if novos:
+            documentos = [item[1] for item in novos]
+            colecao.upsert(
+                ids=[item[0] for item in novos],
+                embeddings=vs_manager.encode(documentos),
+                documents=documentos,
+                metadatas=[item[2] for item in novos],
+            )
+            stats["novos"] += len(novos)
+
+    for i, trecho in enumerate(gerar_trechos(ler_em_blocos(caminho), tamanho, sobreposicao)):
+        trecho_id = id_trecho(trecho, fonte)
+        if trecho_id in vistos:
+            continue
+        vistos.add(trecho_id)
+        lote.append((trecho_id, trecho, {"fonte": fonte, "trecho": i, "tipo": "conhecimento"}))
+        if len(lote) >= batch_size:
+            enviar(lote)
+            lote = []
+    if lote:
+        enviar(lote)
+
+    # Remove trechos desse arquivo que não existem mais
+    antigos = colecao.get(where={"fonte": fonte}, include=[])["ids"]
+    obsoletos = [trecho_id for trecho_id in antigos if trecho_id not in vistos]
+    if obsoletos:
+        colecao.delete(ids=obsoletos)
+    stats["removidos"] = len(obsoletos)
+    return stats
+
+
+def ingerir(vs_manager, caminhos: list = None, **kwargs) -> dict:
+    """Ingere vários arquivos (padrão: backup_info/*.txt) e retorna as estatísticas por arquivo."""
+    caminhos = caminhos or sorted(glob.glob(ORIGEM_PADRAO))
+    resultado = {}
+    for caminho in caminhos:
+        stats = ingerir_arquivo(vs_manager, caminho, **kwargs)
+        resultado[caminho] = stats
+        print(f"📚 {caminho}: {stats['novos']} novos, {stats['inalterados']} inalterados, "
+              f"{stats['removidos']} removidos", file=sys.stderr)
+    return resultado
+
+
+if __name__ == "__main__":
+    from rag.vector_store import VectorStoreManager
+    ingerir(VectorStoreManager(), sys.argv[1:])
@@ -1,34 +1,110 @@
-import chromadb
-from sentence_transformers import SentenceTransformer
-import uuid
+import hashlib
+import os
+
+import numpy as np
+
+import metrics
+from rag.embedding_backends import criar_backend, nome_backend
+from rag.embedding_cache import EmbeddingCache
+
+def content_id(document: str) -> str:
+    """ID determinístico derivado do conteúdo do documento."""
+    return hashlib.sha256(" ".join(document.split()).encode("utf-8")).hexdigest()[:32]
 
 class VectorStoreManager:
-    def __init__(self, collection_name="renato_smartphones"):
-        self.client = chromadb.PersistentClient(path="./data/chroma_db")
-        self.text_model = SentenceTransformer("BAAI/bge-small-en-v1.5")
-        self.collection = self.client.get_or_create_collection(
-            name=collection_name,
-            metadata={"hnsw:space": "cosine"}
+    """
+    Os componentes pesados (ChromaDB e o backend de embeddings) só são
+    carregados no primeiro uso ou em warm_up().
+    """
+
+    def __init__(self, collection_name="renato_smartphones", model_name="BAAI/bge-small-en-v1.5"):
+        self.collection_name = collection_name
+        self.model_name = model_name
+        self._client = None
+        self._collection = None
+        self._backend = None
+        # Cache das consultas: clientes repetem as mesmas saudações e perguntas
+        self.query_cache = EmbeddingCache(
+            max_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+            path=os.getenv("EMBEDDING_CACHE_PATH") or None,
+            model_id=f"{model_name}:{nome_backend()}",
         )
 
-    def add_documents(self, documents, metadatas):
-        embeddings = self.text_model.encode(documents, normalize_embeddings=True)
-        ids = [str(uuid.uuid4()) for _ in documents]
-        self.collection.add(
-            ids=ids,
+    @property
+    def client(self):
+        if self._client is None:
+            import chromadb
+            self._client = chromadb.PersistentClient(path="./data/chroma_db")
+        return self._client
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            self._collection = self.client.get_or_create_collection(
+                name=self.collection_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+        return self._collection
+
+    @property
+    def backend(self):
+        # torch (SentenceTransformer) ou onnx/onnx-int8, conforme EMBEDDING_BACKEND
+        if self._backend is None:
+            self._backend = criar_backend(self.model_name)
+        return self._backend
+
+    def warm_up(self):
+        """Carrega o modelo de embeddings e abre a coleção antes do primeiro uso."""
+        self.encode(["aquecimento"])
+        self.collection.count()
+
+    def encode(self, texts):
+        with metrics.medir("embedding"):
+            return self.backend.encode(texts)
+
+    def encode_queries(self, texts):
+        """
+        Embeddings de consultas curtas, passando pelo cache LRU.
+        Só os textos ausentes do cache vão para o modelo, em um único lote.
+        """
+        vetores = [self.query_cache.get(texto) for texto in texts]
+        faltando = [i for i, vetor in enumerate(vetores) if vetor is None]
+        if faltando:
+            novos = self.encode([texts[i] for i in faltando])
+            for i, vetor in zip(faltando, novos):
+                self.query_cache.put(texts[i], vetor)
+                vetores[i] = vetor
+        return np.stack(vetores)
+
+    def add_documents(self, documents, metadatas, ids=None):
+        """
+        Insere ou atualiza documentos. Sem `ids` explícitos, o ID é o hash do
+        conteúdo, então reenviar o mesmo documento não cria duplicatas.
+        """
+        ids = ids or [content_id(document) for document in documents]
+        # IDs repetidos no mesmo lote fazem o ChromaDB rejeitar o upsert
+        unicos = {}
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            unicos[doc_id] = (document, metadata)
+        documents = [item[0] for item in unicos.values()]
+        embeddings = self.encode(documents)
+        self.collection.upsert(
+            ids=list(unicos),
             embeddings=embeddings,
             documents=documents,
-            metadatas=metadatas
+            metadatas=[item[1] for item in unicos.values()]
         )
         return ids
 
-    def search(self, query, n_results=1):
-        query_embedding = self.text_model.encode([query], normalize_embeddings=True)
-        results = self.collection.query(
-            query_embeddings=query_embedding,
-            n_results=n_results
-        )
+    def search(self, query, n_results=1, where=None):
+        with metrics.medir("vector_search"):
+            query_embedding = self.encode_queries([query])
+            results = self.collection.query(
+                query_embeddings=query_embedding,
+                n_results=n_results,
+                where=where
+            )
         return results
 
     def get_collection_stats(self):
-        return {"total_documents": self.collection.count()}
\ No newline at end of file
+        return {"total_documents": self.collection.count()}
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import sys
+import threading
+import time
+
+from psycopg2 import errors
+
+NOMES_MESES = {
+    1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
+    5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
+    9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro',
+}
+
+QUERY_CUBO = """
+    SELECT modelo, fabricante, ano, mes,
+           SUM(unidades_vendidas) as unidades, SUM(receita) as receita
+    FROM vendas_smartphones
+    {where}
+    GROUP BY modelo, fabricante, ano, mes;
+"""
+
+QUERY_RECENTES = """
+    SELECT id, modelo, fabricante, ano, mes, unidades_vendidas, receita
+    FROM vendas_smartphones
+    WHERE id > %s;
+"""
+
+
+class SalesRollup:
+    """
+    Cubo de vendas pré-agregado por (modelo, fabricante, ano, mes), mantido em memória.
+
+    As ferramentas de análise de vendas respondem a partir do cubo e de índices
+    derivados (por mês, por ano, por fabricante), cujo tamanho depende do número
+    de modelos e meses, e não do número de linhas de `vendas_smartphones`.
+
+    Atualização incremental: a cada `refresh_interval` segundos são lidas as linhas
+    com `id` acima da marca d'água menos `rescan_window`. Uma transação que pegou
+    um id menor mas fez commit depois de outra com id maior ainda cai nessa janela;
+    os ids já somados dentro dela ficam guardados para não contar duas vezes.
+    Uma recarga completa acontece a cada `full_reload_interval` segundos (para
+    captar UPDATE/DELETE e commits que chegarem depois da janela) ou após
+    `invalidate()`.
+    Se a tabela não tiver a coluna `id`, toda atualização é uma recarga completa.
+    """
+
+    def __init__(self, pool, refresh_interval: float = 30.0, full_reload_interval: float = 3600.0,
+                 rescan_window: int = 1000):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.rescan_window = rescan_window
+
+        self.loaded = False
+        self._incremental = True
+        self._watermark = 0
+        self._vistos = set()   # ids já somados dentro da janela abaixo da marca d'água
+        self._checked_at = 0.0
+        self._full_loaded_at = 0.0
+        self._dirty = False
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._cubo = {}        # (modelo, fabricante, ano, mes) -> [unidades, receita]
+        self._por_mes = {}     # (ano, mes) -> {(modelo, fabricante): [unidades, receita]}
+        self._por_ano = {}     # ano -> {(modelo, fabricante): [unidades, receita]}
+        self._por_modelo = {}  # (modelo, fabricante) -> [unidades, receita]
+        self._total_mes = {}   # (ano, mes) -> [unidades, receita]
+        self._fab_mes = {}     # (ano, mes) -> {fabricante: [unidades, receita]}
+        self._fab_ano = {}     # ano -> {fabricante: [unidades, receita]}
+
+    # ---------- Carga ----------
+
+    def _fetch(self, query: str, params: tuple = None) -> list:
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                return cur.fetchall()
+
+    def _max_id(self) -> int:
+        return self._fetch("SELECT coalesce(max(id), 0) FROM vendas_smartphones;")[0][0]
+
+    @staticmethod
+    def _somar(destino: dict, chave, unidades, receita):
+        acumulado = destino.get(chave)
+        if acumulado is None:
+            destino[chave] = [unidades, receita]
+        else:
+            acumulado[0] += unidades
+            acumulado[1] += receita
+
+    def _aplicar(self, linhas):
+        for modelo, fabricante, ano, mes, unidades, receita in linhas:
+            unidades = unidades or 0
+            receita = receita or 0
+            produto = (modelo, fabricante)
+            periodo = (ano, mes)
+            self._somar(self._cubo, (modelo, fabricante, ano, mes), unidades, receita)
+            self._somar(self._por_mes.setdefault(periodo, {}), produto, unidades, receita)
+            self._somar(self._por_ano.setdefault(ano, {}), produto, unidades, receita)
+            self._somar(self._por_modelo, produto, unidades, receita)
+            self._somar(self._total_mes, periodo, unidades, receita)
+            self._somar(self._fab_mes.setdefault(periodo, {}), fabricante, unidades, receita)
+            self._somar(self._fab_ano.setdefault(ano, {}), fabricante, unidades, receita)
+
+    def _absorver(self, recentes) -> int:
+        """Soma as linhas da janela ainda não vistas e avança a marca d'água (sob o lock)."""
+        novas = [linha for linha in recentes if linha[0] not in self._vistos]
+        self._aplicar(linha[1:] for linha in novas)
+        self._vistos.update(linha[0] for linha in novas)
+        self._watermark = max([self._watermark] + [linha[0] for linha in novas])
+        piso = self._watermark - self.rescan_window
+        self._vistos = {id_ for id_ in self._vistos if id_ > piso}
+        return len(novas)
+
+    def load(self):
+        """Recarrega o cubo inteiro a partir de um único GROUP BY."""
+        watermark = 0
+        if self._incremental:
+            try:
+                watermark = self._max_id()
+            except errors.UndefinedColumn:
+                print("⚠️ vendas_smartphones sem coluna id: rollup sem atualização incremental.", file=sys.stderr)
+                self._incremental = False
+
+        recentes = []
+        piso = 0
+        if self._incremental:
+            # Abaixo da janela, agregado no banco; dentro dela, linha a linha
+            piso = max(watermark - self.rescan_window, 0)
+            linhas = self._fetch(QUERY_CUBO.format(where="WHERE id <= %s"), (piso,))
+            recentes = self._fetch(QUERY_RECENTES, (piso,))
+        else:
+            linhas = self._fetch(QUERY_CUBO.format(where=""))
+
+        with self._lock:
+            self._reset()
+            self._aplicar(linhas)
+            self._vistos = set()
+            self._watermark = max(watermark, piso)
+            self._absorver(recentes)
+            self._checked_at = self._full_loaded_at = time.monotonic()
+            self._dirty = False
+            self.loaded = True
+        print(f"📊 Rollup de vendas carregado: {len(self._cubo)} células", file=sys.stderr)
+
+    def _refresh_incremental(self):
+        # A janela é relida inteira: pega commits atrasados de ids abaixo da marca d'água
+        recentes = self._fetch(QUERY_RECENTES, (self._watermark - self.rescan_window,))
+        with self._lock:
+            novas = self._absorver(recentes)
+        if novas:
+            print(f"📊 Rollup de vendas atualizado com {novas} vendas novas", file=sys.stderr)
+        self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        agora = time.monotonic()
+        if self.loaded and not self._dirty and agora - self._checked_at < self.refresh_interval:
+            return
+        # Só uma thread atualiza; as outras respondem com o cubo atual (se existir).
+        if not self._refresh_lock.acquire(blocking=not self.loaded):
+            return
+        try:
+            agora = time.monotonic()
+            if not self.loaded or self._dirty or agora - self._full_loaded_at >= self.full_reload_interval:
+                self.load()
+            elif agora - self._checked_at >= self.refresh_interval:
+                if self._incremental:
+                    self._refresh_incremental()
+                else:
+                    self.load()
+        finally:
+            self._refresh_lock.release()
+
+    def invalidate(self):
+        """Força uma recarga completa na próxima consulta."""
+        self._dirty = True
+
+    def _pronto(self) -> bool:
+        try:
+            self.ensure_fresh()
+        except Exception as e:
+            print(f"⚠️ Rollup de vendas indisponível: {e}", file=sys.stderr)
+        return self.loaded
+
+    # ---------- Consultas (mesmo formato das queries SQL de DatabaseTools) ----------
+
+    @staticmethod
+    def _linhas_produto(grupo: dict) -> list:
+        return [
+            {"modelo": modelo, "fabricante": fabricante,
+             "unidades_vendidas": valores[0], "receita_total": valores[1]}
+            for (modelo, fabricante), valores in grupo.items()
+        ]
+
+    def top_sold(self, limit: int = 1, month: int = None, year: int = None):
+        if not self._pronto():
+            return None
+        with self._lock:
+            if month and year:
+                grupo = self._por_mes.get((year, month), {})
+            elif year:
+                grupo = self._por_ano.get(year, {})
+            else:
+                grupo = self._por_modelo
+            linhas = self._linhas_produto(grupo)
+        linhas.sort(key=lambda p: p["unidades_vendidas"], reverse=True)
+        return linhas[:limit]
+
+    def least_sold(self, year: int, limit: int = 1):
+        if not self._pronto():
+            return None
+        with self._lock:
+            linhas = self._linhas_produto(self._por_ano.get(year, {}))
+        linhas.sort(key=lambda p: p["receita_total"])
+        return linhas[:limit]
+
+    def monthly_revenue(self, month: int, year: int):
+        if not self._pronto():
+            return None
+        with self._lock:
+            total = self._total_mes.get((year, month))
+        if total is None:
+            return [{"receita_total": None, "total_unidades": None}]
+        return [{"receita_total": total[1], "total_unidades": total[0]}]
+
+    def comparison_by_manufacturer(self, year: int, month: int = None):
+        if not self._pronto():
+            return None
+        with self._lock:
+            grupo = self._fab_mes.get((year, month), {}) if month else self._fab_ano.get(year, {})
+            linhas = [
+                {"fabricante": fabricante, "total_unidades": valores[0], "receita_total": valores[1]}
+                for fabricante, valores in grupo.items()
+            ]
+        linhas.sort(key=lambda f: f["total_unidades"], reverse=True)
+        return linhas
+
+    def _meses(self, year: int) -> list:
+        return [(mes, valores) for (ano, mes), valores in self._total_mes.items() if ano == year]
+
+    def average_monthly_sales(self, year: int):
+        if not self._pronto():
+            return None
+        with self._lock:
+            meses = self._meses(year)
+        if not meses:
+            return [{"media_receita": None, "media_unidades": None}]
+        return [{
+            "media_receita": sum(v[1] for _, v in meses) / len(meses),
+            "media_unidades": sum(v[0] for _, v in meses) / len(meses),
+        }]
+
+    def best_selling_month(self, year: int):
+        if not self._pronto():
+            return None
+        with self._lock:
+            meses = self._meses(year)
+        if not meses:
+            return []
+        mes, valores = max(meses, key=lambda item: item[1][1])
+        return [{"mes_nome": NOMES_MESES.get(mes), "receita_total": valores[1], "total_unidades": valores[0]}]
@@ -1,18 +1,20 @@
-import chromadb
 import os
 
+from rag.ingest import ingerir
+from rag.vector_store import VectorStoreManager
+
 # Criar diretório
 os.makedirs("./data/chroma_db", exist_ok=True)
 
-# Configurar ChromaDB com persistência
-client = chromadb.PersistentClient(path="./data/chroma_db")
-
-# Criar collection
-collection = client.get_or_create_collection(
-    name="renato_smartphones",
-    metadata={"hnsw:space": "cosine"}
-)
+# Configurar ChromaDB com persistência e criar (ou abrir) a collection
+vs_manager = VectorStoreManager()
+collection = vs_manager.collection
 
 print(f"✅ ChromaDB inicializado")
 print(f"📦 Collection: {collection.name}")
-print(f"📊 Total docs: {collection.count()}")
\ No newline at end of file
+
+# Ingerir a base de conhecimento (manuais e anotações de backup_info/).
+# Trechos já indexados e inalterados são pulados, então rodar de novo é barato.
+ingerir(vs_manager)
+
+print(f"📊 Total docs: {collection.count()}")
@@ -1,12 +1,17 @@
+import argparse
+import hashlib
 import json
 import logging
 import os
+from decimal import Decimal
 
 import psycopg2
 from dotenv import load_dotenv
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_batch, execute_values
 
-from rag.vector_store import VectorStoreManager
+from catalog import CANAL_CATALOGO
+from db_migrations import aplicar_migracoes
+from rag.vector_store import VectorStoreManager, content_id
 from smartphones_data import smartphones
 
 load_dotenv()
@@ -89,25 +94,21 @@ def setup_database():
     vs_manager = VectorStoreManager()
     
     try:
+        aplicar_migracoes(conn)
         # Inserir dados no PostgreSQL
         for smartphone in smartphones:
             logging.info(f"Inserindo dados do {smartphone['modelo']} no PostgreSQL...")
             insert_postgres_data(conn, smartphone)
+        with conn.cursor() as cur:
+            # Avisa os agentes em execução para recarregarem o catálogo em memória
+            cur.execute(f"NOTIFY {CANAL_CATALOGO};")
         conn.commit()
         logging.info("Dados inseridos no PostgreSQL com sucesso.")
 
         # Inserir dados no ChromaDB
-        documents_to_add = []
-        metadatas_to_add = []
-        ids_to_add = []
-        for i, smartphone in enumerate(smartphones):
-            logging.info(f"Preparando documento do {smartphone['modelo']} para o ChromaDB...")
-            document = create_document_for_chroma(smartphone)
-            documents_to_add.append(document)
-            metadatas_to_add.append({'modelo': smartphone['modelo'], 'fabricante': smartphone['fabricante']})
-            ids_to_add.append(f"doc_{i}")
+        documents_to_add, metadatas_to_add, ids_to_add = documentos_chroma(smartphones)
         
-        vs_manager.add_documents(documents_to_add, metadatas_to_add)
+        vs_manager.add_documents(documents_to_add, metadatas_to_add, ids_to_add)
         logging.info("Documentos inseridos no ChromaDB com sucesso.")
 
     except Exception as e:
@@ -117,5 +118,171 @@ def setup_database():
         if conn:
             conn.close()
 
+def documentos_chroma(smartphones):
+    """Documentos, metadados e IDs estáveis (um por modelo) dos smartphones para o ChromaDB."""
+    documents, metadatas, ids = [], [], []
+    for smartphone in smartphones:
+        document = create_document_for_chroma(smartphone)
+        documents.append(document)
+        metadatas.append({
+            'modelo': smartphone['modelo'],
+            'fabricante': smartphone['fabricante'],
+            'tipo': 'smartphone',
+            'hash': content_id(document),
+        })
+        ids.append(f"smartphone:{smartphone['modelo']}")
+    return documents, metadatas, ids
+
+def _linha_smartphone(smartphone):
+    """Valores da tabela smartphones na ordem das colunas usadas nos INSERT/UPDATE."""
+    specs = smartphone['especificacoes_tecnicas']
+    return (
+        smartphone['fabricante'], Json(smartphone['info_geral']), Json(specs),
+        specs.get('performance_score', 0), specs.get('categoria', 'N/A'), specs.get('segmento', 'N/A'),
+    )
+
+def _assinatura(fabricante, info_geral, especificacoes, performance_score, categoria, segmento, fotos):
+    """Hash do conteúdo de um smartphone, igual para a fonte e para o que está no banco."""
+    if isinstance(performance_score, (int, float, Decimal)):
+        performance_score = float(performance_score)
+    conteudo = {
+        'fabricante': fabricante, 'info_geral': info_geral, 'especificacoes_tecnicas': especificacoes,
+        'performance_score': performance_score, 'categoria': categoria, 'segmento': segmento,
+        'fotos': sorted(fotos),
+    }
+    return hashlib.sha256(json.dumps(conteudo, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+def _assinatura_fonte(smartphone):
+    specs = smartphone['especificacoes_tecnicas']
+    return _assinatura(
+        smartphone['fabricante'], smartphone['info_geral'], specs,
+        specs.get('performance_score', 0), specs.get('categoria', 'N/A'), specs.get('segmento', 'N/A'),
+        smartphone['fotos_reais'],
+    )
+
+def sync_postgres(conn, smartphones):
+    """
+    Sincroniza smartphones e fotos com a fonte em UMA transação, tocando só o
+    que mudou: novos modelos entram com um INSERT em lote, alterados são
+    atualizados em lote (e têm as fotos regravadas) e os que saíram da fonte
+    são removidos. Como nada é apagado antes do commit, o bot nunca vê o banco vazio.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT s.id, s.modelo, s.fabricante, s.info_geral, s.especificacoes_tecnicas,
+                   s.performance_score, s.categoria, s.segmento,
+                   array_remove(array_agg(f.url_imagem), NULL)
+            FROM smartphones s
+            LEFT JOIN fotos f ON s.id = f.smartphone_id
+            GROUP BY s.id
+            ORDER BY s.id
+        """)
+        existentes = {}
+        duplicados = []
+        for row in cur.fetchall():
+            if row[1] in existentes:
+                duplicados.append(row[0])
+                continue
+            existentes[row[1]] = (row[0], _assinatura(*row[2:8], row[8] or []))
+
+        fonte = {smartphone['modelo']: smartphone for smartphone in smartphones}
+        novos = [s for modelo, s in fonte.items() if modelo not in existentes]
+        alterados = [
+            s for modelo, s in fonte.items()
+            if modelo in existentes and existentes[modelo][1] != _assinatura_fonte(s)
+        ]
+        removidos = [id_ for modelo, (id_, _) in existentes.items() if modelo not in fonte] + duplicados
+
+        ids_por_modelo = {modelo: id_ for modelo, (id_, _) in existentes.items()}
+        if novos:
+            inseridos = execute_values(
+                cur,
+                """INSERT INTO smartphones (modelo, fabricante, info_geral, especificacoes_tecnicas, performance_score, categoria, segmento)
+                   VALUES %s RETURNING id, modelo""",
+                [(s['modelo'],) + _linha_smartphone(s) for s in novos],
+                fetch=True,
+            )
+            ids_por_modelo.update({modelo: id_ for id_, modelo in inseridos})
+
+        if alterados:
+            execute_batch(
+                cur,
+                """UPDATE smartphones SET fabricante = %s, info_geral = %s, especificacoes_tecnicas = %s,
+                       performance_score = %s, categoria = %s, segmento = %s
+                   WHERE id = %s""",
+                [_linha_smartphone(s) + (ids_por_modelo[s['modelo']],) for s in alterados],
+            )
+
+        # Fotos: regrava as dos modelos novos/alterados e apaga as dos removidos
+        regravar = [ids_por_modelo[s['modelo']] for s in alterados] + removidos
+        if regravar:
+            cur.execute("DELETE FROM fotos WHERE smartphone_id = ANY(%s)", (regravar,))
+        fotos = [
+            (ids_por_modelo[s['modelo']], url)
+            for s in novos + alterados for url in s['fotos_reais']
+        ]
+        if fotos:
+            execute_values(cur, "INSERT INTO fotos (smartphone_id, url_imagem) VALUES %s", fotos)
+        if removidos:
+            cur.execute("DELETE FROM smartphones WHERE id = ANY(%s)", (removidos,))
+
+        if novos or alterados or removidos:
+            # Avisa os agentes em execução para recarregarem o catálogo em memória
+            cur.execute(f"NOTIFY {CANAL_CATALOGO};")
+    conn.commit()
+    return {'novos': len(novos), 'alterados': len(alterados), 'removidos': len(removidos)}
+
+def sync_chromadb(vs_manager, smartphones):
+    """Reenvia ao ChromaDB apenas os documentos cujo texto mudou e apaga os que saíram do catálogo."""
+    documents, metadatas, ids = documentos_chroma(smartphones)
+
+    # Documentos de produto já indexados (os trechos da base de conhecimento têm 'fonte')
+    atuais = vs_manager.collection.get(include=["metadatas"])
+    hashes = {
+        doc_id: (metadata or {}).get('hash')
+        for doc_id, metadata in zip(atuais['ids'], atuais['metadatas'])
+        if metadata and 'modelo' in metadata and 'fonte' not in metadata
+    }
+
+    alterados = [i for i, doc_id in enumerate(ids) if hashes.get(doc_id) != metadatas[i]['hash']]
+    if alterados:
+        vs_manager.add_documents(
+            [documents[i] for i in alterados],
+            [metadatas[i] for i in alterados],
+            [ids[i] for i in alterados],
+        )
+    obsoletos = [doc_id for doc_id in hashes if doc_id not in set(ids)]
+    if obsoletos:
+        vs_manager.collection.delete(ids=obsoletos)
+    return {'reindexados': len(alterados), 'removidos': len(obsoletos)}
+
+def sync_database():
+    """Sincroniza PostgreSQL e ChromaDB com a fonte sem limpar nada antes."""
+    conn = get_db_connection()
+    try:
+        aplicadas = aplicar_migracoes(conn)
+        if aplicadas:
+            logging.info(f"Migrações aplicadas: {', '.join(aplicadas)}.")
+        stats = sync_postgres(conn, smartphones)
+        logging.info(f"PostgreSQL sincronizado: {stats['novos']} novos, {stats['alterados']} alterados, {stats['removidos']} removidos.")
+    except Exception as e:
+        conn.rollback()
+        logging.error(f"Erro ao sincronizar o PostgreSQL: {e}")
+        return
+    finally:
+        conn.close()
+
+    try:
+        stats = sync_chromadb(VectorStoreManager(), smartphones)
+        logging.info(f"ChromaDB sincronizado: {stats['reindexados']} documentos reindexados, {stats['removidos']} removidos.")
+    except Exception as e:
+        logging.error(f"Erro ao sincronizar o ChromaDB: {e}")
+
 if __name__ == "__main__":
-    setup_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Carrega o catálogo de smartphones no PostgreSQL e no ChromaDB.")
+    parser.add_argument("--reset", action="store_true",
+                        help="apaga tudo e recarrega do zero (padrão: sincronização incremental)")
+    if parser.parse_args().reset:
+        setup_database()
+    else:
+        sync_database()
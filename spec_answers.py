@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Respostas diretas para perguntas técnicas sobre UM modelo (FLUXO 1.2).
+
+A pergunta é mapeada para campos da ficha ("processador", "bateria", "preço"...)
+e a resposta é montada por template a partir de `especificacoes_tecnicas` e
+`info_geral`, sem chamar o LLM. Perguntas abertas ("vale a pena?", "é bom pra
+jogos?") ou sem campo reconhecido retornam None e seguem para o LLM.
+"""
+from text_utils import normalizar_texto
+
+ESPEC = "especificacoes_tecnicas"
+INFO = "info_geral"
+
+# campo -> (rótulo, palavras-chave, caminhos candidatos na linha do produto, unidade)
+CAMPOS = {
+    "processador": ("🔧 Processador", {"processador", "chip", "chipset", "cpu"},
+                    [(ESPEC, "processador"), (ESPEC, "chipset"), (ESPEC, "cpu")], ""),
+    "ram": ("💾 RAM", {"ram"},
+            [(ESPEC, "ram"), (ESPEC, "ram_gb"), (ESPEC, "memoria", "ram_gb"), (ESPEC, "memoria", "ram")], "GB"),
+    "armazenamento": ("💿 Armazenamento", {"armazenamento", "espaco", "memoria", "interna"},
+                      [(ESPEC, "armazenamento"), (ESPEC, "armazenamento_gb"),
+                       (ESPEC, "memoria", "armazenamento_opcoes"), (ESPEC, "memoria", "armazenamento")], "GB"),
+    "camera": ("📸 Câmera", {"camera", "cameras", "megapixel", "megapixels", "mp"},
+               [(ESPEC, "camera_principal"), (ESPEC, "cameras", "principal"), (ESPEC, "camera", "principal"),
+                (ESPEC, "cameras"), (ESPEC, "camera")], ""),
+    "camera_frontal": ("🤳 Câmera frontal", {"frontal", "selfie", "selfies"},
+                       [(ESPEC, "camera_frontal"), (ESPEC, "cameras", "frontal"), (ESPEC, "camera", "frontal")], ""),
+    "bateria": ("🔋 Bateria", {"bateria", "autonomia", "mah"},
+                [(ESPEC, "bateria"), (ESPEC, "bateria_mah")], "mAh"),
+    "carregamento": ("⚡ Carregamento", {"carregamento", "carregador", "recarga", "wireless"},
+                     [(ESPEC, "carregamento"), (ESPEC, "bateria", "carregamento")], ""),
+    "tela": ("📺 Tela", {"tela", "display", "polegadas", "resolucao"},
+             [(ESPEC, "tela"), (ESPEC, "display")], ""),
+    "sistema": ("⚙️ Sistema", {"sistema", "android", "ios"},
+                [(ESPEC, "so"), (ESPEC, "sistema_operacional"), (ESPEC, "sistema")], ""),
+    "peso": ("⚖️ Peso", {"peso", "pesa", "gramas"},
+             [(ESPEC, "peso"), (ESPEC, "peso_g")], "g"),
+    "dimensoes": ("📏 Dimensões", {"dimensoes", "medidas", "espessura"},
+                  [(ESPEC, "dimensoes")], ""),
+    "conectividade": ("📶 Conectividade", {"5g", "wifi", "bluetooth", "nfc", "conectividade"},
+                      [(ESPEC, "conectividade")], ""),
+    "preco": ("💰 Preço", {"preco", "precos", "valor", "custa", "custam", "custo"},
+              [(INFO, "preco"), (INFO, "preco_brasil_atual"), (INFO, "preco_atual")], "R$"),
+    "cores": ("🎨 Cores", {"cor", "cores"}, [(INFO, "cores")], ""),
+}
+
+# Pedido da ficha inteira: responde com o card completo já formatado
+PALAVRAS_FICHA = {"ficha", "especificacoes", "especificacao", "specs", "caracteristicas", "detalhes", "configuracoes"}
+
+# Perguntas de opinião/contexto: o LLM decide a resposta
+PALAVRAS_ABERTAS = {
+    "vale", "compensa", "recomenda", "recomendaria", "indica", "indicaria", "acha", "opiniao",
+    "melhor", "pior", "bom", "boa", "bons", "boas", "ruim", "diferenca", "comparado", "comparar",
+    "vs", "porque", "jogos", "jogar", "aguenta", "explica", "explique", "significa", "caro", "barato",
+}
+
+MAX_ITENS = 6
+
+
+def _valor(produto: dict, caminho: tuple):
+    atual = produto
+    for chave in caminho:
+        if not isinstance(atual, dict):
+            return None
+        atual = atual.get(chave)
+    return atual
+
+
+def _legivel(chave: str) -> str:
+    return str(chave).replace("_", " ")
+
+
+def _formatar_numero(valor, unidade: str) -> str:
+    if unidade == "R$":
+        texto = f"{float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return f"R$ {texto}"
+    return f"{valor} {unidade}".strip()
+
+
+def formatar_valor(valor, unidade: str = "") -> str:
+    """Texto de um valor da ficha: números com unidade, listas e dicionários resumidos."""
+    if isinstance(valor, bool):
+        return "sim" if valor else "não"
+    if isinstance(valor, (int, float)):
+        return _formatar_numero(valor, unidade)
+    if isinstance(valor, list):
+        if valor and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in valor):
+            return f"{', '.join(str(v) for v in valor)} {unidade}".strip()
+        return ", ".join(formatar_valor(v) for v in valor[:MAX_ITENS])
+    if isinstance(valor, dict):
+        # Um "nome" (ex.: processador) vem primeiro, sem rótulo
+        partes = [str(valor["nome"])] if valor.get("nome") else []
+        for chave, item in list(valor.items())[:MAX_ITENS]:
+            if chave == "nome":
+                continue
+            if isinstance(item, dict):
+                internos = ", ".join(f"{_legivel(k)}: {formatar_valor(v)}" for k, v in list(item.items())[:3]
+                                     if not isinstance(v, (dict, list)))
+                partes.append(f"{_legivel(chave)} ({internos})" if internos else _legivel(chave))
+            else:
+                partes.append(f"{_legivel(chave)}: {formatar_valor(item)}")
+        return "; ".join(partes)
+    return str(valor)
+
+
+def campos_da_pergunta(pergunta: str) -> list:
+    """Campos da ficha citados na pergunta, na ordem de CAMPOS."""
+    palavras = set(normalizar_texto(pergunta).split())
+    palavras |= {palavra[:-1] for palavra in palavras if palavra.endswith("s")}
+    campos = [campo for campo, (_, chaves, _, _) in CAMPOS.items() if palavras & chaves]
+    texto = f" {normalizar_texto(pergunta)} "
+    if "preco" not in campos and (" quanto sai " in texto or " quanto ta " in texto or " quanto esta " in texto):
+        campos.append("preco")
+    # "memória RAM" não é pergunta sobre armazenamento
+    if "ram" in campos and "armazenamento" in campos and "memoria" in palavras and not palavras & {"armazenamento", "espaco", "interna"}:
+        campos.remove("armazenamento")
+    return campos
+
+
+def pergunta_aberta(pergunta: str) -> bool:
+    palavras = set(normalizar_texto(pergunta).split())
+    return bool(palavras & PALAVRAS_ABERTAS) or " por que " in f" {normalizar_texto(pergunta)} "
+
+
+def responder_especificacao(pergunta: str, produto: dict, ficha: str = None):
+    """
+    Resposta pronta para a pergunta sobre `produto` (linha de
+    get_smartphone_details_and_photos), ou None se o LLM deve responder.
+    `ficha` é o card completo, usado quando a pergunta pede todos os dados.
+    """
+    if not produto or pergunta_aberta(pergunta):
+        return None
+
+    campos = campos_da_pergunta(pergunta)
+    if not campos:
+        palavras = set(normalizar_texto(pergunta).split())
+        return ficha if ficha and palavras & PALAVRAS_FICHA else None
+
+    linhas = []
+    for campo in campos:
+        rotulo, _, caminhos, unidade = CAMPOS[campo]
+        valor = next((v for v in (_valor(produto, c) for c in caminhos) if v not in (None, "", [], {})), None)
+        if valor is not None:
+            linhas.append(f"{rotulo}: {formatar_valor(valor, unidade)}")
+    if not linhas:
+        return None
+
+    return f"📱 *{produto.get('modelo', 'Modelo')}*\n" + "\n".join(linhas) + "\n\nQuer saber mais alguma coisa sobre ele? 😊"
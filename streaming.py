@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+
+_FIM_DE_FRASE = re.compile(r"[.!?…:](?=\s)|\n")
+
+
+class SentenceChunker:
+    """
+    Agrupa tokens do LLM em pedaços que terminam em fim de frase ou de linha.
+
+    O primeiro pedaço é liberado na primeira frase completa com pelo menos
+    `primeiro_min` caracteres, para o cliente ver algo o quanto antes; os
+    seguintes esperam juntar `min_chars` caracteres para não fragmentar demais
+    a conversa no WhatsApp.
+    """
+
+    def __init__(self, primeiro_min: int = 20, min_chars: int = 200):
+        self.primeiro_min = primeiro_min
+        self.min_chars = min_chars
+        self._buffer = ""
+        self._enviados = 0
+
+    def add(self, token: str) -> list:
+        """Acrescenta um token e retorna os pedaços prontos (possivelmente nenhum)."""
+        self._buffer += token
+        minimo = self.min_chars if self._enviados else self.primeiro_min
+        if len(self._buffer) < minimo:
+            return []
+        cortes = [m.end() for m in _FIM_DE_FRASE.finditer(self._buffer) if m.end() >= minimo]
+        if not cortes:
+            return []
+        pedaco, self._buffer = self._buffer[:cortes[-1]], self._buffer[cortes[-1]:]
+        pedaco = pedaco.strip()
+        if not pedaco:
+            return []
+        self._enviados += 1
+        return [pedaco]
+
+    def flush(self) -> list:
+        """Retorna o que sobrou no buffer ao fim da geração."""
+        pedaco, self._buffer = self._buffer.strip(), ""
+        return [pedaco] if pedaco else []
+
+
+def evento_sse(pedaco: str = None, fim: bool = False) -> str:
+    """Formata um evento Server-Sent Events; o texto vai em JSON porque pode conter quebras de linha."""
+    if fim:
+        return "event: done\ndata: {}\n\n"
+    return f"data: {json.dumps({'chunk': pedaco}, ensure_ascii=False)}\n\n"
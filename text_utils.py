@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import re
+import unicodedata
+
+_NAO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+
+def remover_acentos(texto: str) -> str:
+    """Remove acentos e cedilhas ('câmera' -> 'camera')."""
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Normaliza um texto para comparação: minúsculas, sem acentos e com qualquer
+    sequência de pontuação/espaços reduzida a um único espaço.
+    Ex.: 'Galaxy  S24-Ultra!' -> 'galaxy s24 ultra'
+    """
+    if not texto:
+        return ""
+    return _NAO_ALFANUMERICO.sub(" ", remover_acentos(texto).lower()).strip()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Registro declarativo das ferramentas oferecidas ao LLM.
+
+Cada ferramenta é um método de `DatabaseTools` com descrições escritas aqui.
+Os tipos e parâmetros obrigatórios vêm da assinatura do método, e os esquemas
+JSON (completo e compacto) são montados uma única vez, na importação; o
+AIAgent só os reaproveita.
+"""
+import inspect
+import json
+
+from tools import DatabaseTools
+
+TIPOS_JSON = {int: "integer", float: "number", bool: "boolean", list: "array", str: "string"}
+
+# MUDANÇA CRÍTICA 2: poucas ferramentas, para não confundir o modelo.
+# nome -> descrição completa, descrição curta (variante compacta) e descrição de cada parâmetro
+FERRAMENTAS = {
+    "get_smartphone_details_and_photos": {
+        # MUDANÇA CRÍTICA 3: Descrições ULTRA específicas
+        "descricao": """
+FERRAMENTA OBRIGATÓRIA para QUALQUER pergunta sobre especificações técnicas de smartphones.
+Use esta ferramenta quando o usuário perguntar sobre:
+- Processador, RAM, memória, armazenamento
+- Câmera, bateria, tela, display
+- Preço, valor, custo
+- Características, especificações, detalhes técnicos
+- Comparação entre dois modelos específicos
+Exemplos de perguntas que EXIGEM esta ferramenta:
+- "Qual o processador do Xiaomi 13T?"
+- "Quanto custa o iPhone 15 Pro Max?"
+- "Qual a diferença entre Samsung A54 e Xiaomi 13T?"
+""",
+        "curta": "Especificações técnicas, preço e fotos de UM smartphone (nome exato do modelo).",
+        "parametros": {"modelo": "Nome exato do modelo, ex.: 'Xiaomi 13T'."},
+    },
+    "get_top_sold_products": {
+        "descricao": "Retorna os produtos MAIS VENDIDOS. Use quando perguntarem sobre 'mais vendido', 'campeão de vendas', 'líder', 'top vendas'.",
+        "curta": "Produtos mais vendidos, opcionalmente por mês/ano.",
+        "parametros": {
+            "limit": "Quantos produtos retornar (padrão 1).",
+            "month": "Mês (1-12); exige 'year'.",
+            "year": "Ano com quatro dígitos.",
+        },
+    },
+    "get_monthly_revenue": {
+        "descricao": "Retorna o FATURAMENTO TOTAL de um mês/ano. Use quando perguntarem sobre 'receita', 'faturamento', 'quanto vendeu em dinheiro'.",
+        "curta": "Faturamento total e unidades vendidas de um mês/ano.",
+        "parametros": {"month": "Mês (1-12).", "year": "Ano com quatro dígitos."},
+    },
+    "get_product_sales": {
+        "descricao": "Retorna as VENDAS de UM produto específico. Use quando perguntarem 'quantos [modelo] foram vendidos?', 'vendas do [modelo]'.",
+        "curta": "Vendas de UM produto em um mês/ano.",
+        "parametros": {
+            "produto": "Nome do modelo, ex.: 'Samsung Galaxy A54'.",
+            "month": "Mês (1-12).",
+            "year": "Ano com quatro dígitos.",
+        },
+    },
+}
+
+
+def _assinatura(nome: str) -> dict:
+    """Parâmetros do método: nome -> (tipo JSON, tipo Python, obrigatório)."""
+    parametros = {}
+    for param in inspect.signature(getattr(DatabaseTools, nome)).parameters.values():
+        if param.name == "self":
+            continue
+        tipo = param.annotation if param.annotation in TIPOS_JSON else str
+        parametros[param.name] = (TIPOS_JSON[tipo], tipo, param.default is inspect.Parameter.empty)
+    return parametros
+
+
+ASSINATURAS = {nome: _assinatura(nome) for nome in FERRAMENTAS}
+
+for _nome, _definicao in FERRAMENTAS.items():
+    _sobrando = set(_definicao["parametros"]) - set(ASSINATURAS[_nome])
+    if _sobrando:
+        raise TypeError(f"Parâmetros descritos que não existem em DatabaseTools.{_nome}: {', '.join(sorted(_sobrando))}")
+
+
+def _montar_esquema(nome: str, compacto: bool) -> dict:
+    definicao = FERRAMENTAS[nome]
+    propriedades = {}
+    for param, (tipo_json, _, _) in ASSINATURAS[nome].items():
+        propriedades[param] = {"type": tipo_json}
+        # Na variante compacta, os nomes dos parâmetros bastam
+        if not compacto:
+            propriedades[param]["description"] = definicao["parametros"].get(param, "")
+    return {
+        "type": "function",
+        "function": {
+            "name": nome,
+            "description": definicao["curta"] if compacto else definicao["descricao"],
+            "parameters": {
+                "type": "object",
+                "properties": propriedades,
+                "required": [param for param, (_, _, obrigatorio) in ASSINATURAS[nome].items() if obrigatorio],
+            },
+        },
+    }
+
+
+ESQUEMAS = [_montar_esquema(nome, compacto=False) for nome in FERRAMENTAS]
+ESQUEMAS_COMPACTOS = [_montar_esquema(nome, compacto=True) for nome in FERRAMENTAS]
+
+
+def esquemas(compacto: bool = False) -> list:
+    """Esquemas das ferramentas no formato de `tools` da API de chat."""
+    return ESQUEMAS_COMPACTOS if compacto else ESQUEMAS
+
+
+def preparar_chamada(nome: str, argumentos) -> dict:
+    """
+    Valida uma chamada de ferramenta feita pelo LLM e retorna os argumentos
+    prontos para o método: parâmetros desconhecidos são descartados e números
+    que vieram como texto ("10") são convertidos. Levanta ValueError se a
+    ferramenta não existir, faltar um parâmetro obrigatório ou um valor não
+    servir para o tipo do parâmetro (ex.: 10.7 para um inteiro).
+    """
+    if nome not in FERRAMENTAS:
+        raise ValueError(f"Ferramenta '{nome}' não encontrada.")
+    if isinstance(argumentos, str):
+        try:
+            argumentos = json.loads(argumentos or "{}")
+        except ValueError:
+            raise ValueError(f"Argumentos inválidos para {nome}: {argumentos}")
+    argumentos = argumentos or {}
+    if not isinstance(argumentos, dict):
+        raise ValueError(f"Argumentos de {nome} deveriam ser um objeto JSON: {argumentos}")
+
+    preparados = {}
+    for param, (_, tipo, obrigatorio) in ASSINATURAS[nome].items():
+        valor = argumentos.get(param)
+        if valor is None:
+            if obrigatorio:
+                raise ValueError(f"Faltou o parâmetro '{param}' de {nome}.")
+            continue
+        if tipo in (int, float) and not isinstance(valor, bool):
+            # Inteiros não são truncados: 10.7 é recusado, 10.0 e "10" viram 10
+            if tipo is int and isinstance(valor, float) and not valor.is_integer():
+                raise ValueError(f"Parâmetro '{param}' de {nome} deveria ser inteiro: {valor}")
+            try:
+                valor = tipo(valor)
+            except (TypeError, ValueError):
+                raise ValueError(f"Parâmetro '{param}' de {nome} deveria ser numérico: {valor}")
+        preparados[param] = valor
+    return preparados
@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 import psycopg2
 import os
+import re
+import threading
+import weakref
 from datetime import date
+from functools import lru_cache
 from dotenv import load_dotenv
 
+import metrics
+from catalog import CatalogSnapshot
+from db_pool import ConnectionPool, PoolTimeout
+from sales_rollup import SalesRollup
+from text_utils import normalizar_texto
+
 load_dotenv()
 
 def get_db_connection():
@@ -13,52 +23,157 @@ def get_db_connection():
         db_url = db_url.split("?schema=")[0]
     return psycopg2.connect(db_url)
 
+# SQLSTATE de "prepared statement does not exist" (a sessão perdeu os planos)
+PREPARADA_INEXISTENTE = "26000"
+
+@lru_cache(maxsize=None)
+def _sql_preparado(nome: str, query: str) -> str:
+    """PREPARE equivalente à query: os %s viram $1, $2... na ordem em que aparecem."""
+    contador = iter(range(1, query.count("%s") + 1))
+    corpo = re.sub(r"%s", lambda _: f"${next(contador)}", query).strip().rstrip(";")
+    return f"PREPARE {nome} AS {corpo}"
+
 class DatabaseTools:
     """
     Classe que gerencia as consultas ao banco de dados de vendas de smartphones.
     """
     
     def __init__(self):
-        self.conn = self.conectar_banco()
+        self.pool = self.conectar_banco()
+        self.catalog = CatalogSnapshot(
+            self.pool,
+            connect=get_db_connection,
+            refresh_interval=float(os.getenv("CATALOG_REFRESH_INTERVAL", "300")),
+            listen=os.getenv("CATALOG_LISTEN", "1") != "0",
+        )
+        self.rollup = SalesRollup(
+            self.pool,
+            refresh_interval=float(os.getenv("SALES_ROLLUP_REFRESH_INTERVAL", "30")),
+            full_reload_interval=float(os.getenv("SALES_ROLLUP_FULL_RELOAD_INTERVAL", "3600")),
+            rescan_window=int(os.getenv("SALES_ROLLUP_RESCAN_WINDOW", "1000")),
+        )
+        # Consultas fixas são preparadas uma vez por conexão e o servidor reaproveita o plano.
+        # Desligue (DB_PREPARED_STATEMENTS=0) atrás de um pgbouncer em modo transação.
+        self.usar_preparadas = os.getenv("DB_PREPARED_STATEMENTS", "1") != "0"
+        self._preparadas = weakref.WeakKeyDictionary()  # conexão -> nomes já preparados nela
+        self._preparadas_lock = threading.Lock()
 
     def conectar_banco(self):
         """
-        Estabelece conexão com o banco de dados PostgreSQL.
+        Cria o pool de conexões com o banco de dados PostgreSQL.
+        As conexões são abertas sob demanda, uma por requisição em andamento.
         """
-        try:
-            return get_db_connection()
-        except Exception as e:
-            print(f"❌ ERRO DE CONEXÃO: {repr(e)}")
-            return None
+        return ConnectionPool(
+            get_db_connection,
+            size=int(os.getenv("DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("DB_POOL_MAX_OVERFLOW", "5")),
+            timeout=float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+        )
+
+    def _executar_preparada(self, conn, cur, nome: str, query: str, params: tuple):
+        """Executa a query pelo plano preparado `nome`, preparando-o na conexão se preciso."""
+        with self._preparadas_lock:
+            preparadas = self._preparadas.setdefault(conn, set())
+        if nome not in preparadas:
+            cur.execute(_sql_preparado(nome, query))
+            preparadas.add(nome)
+        cur.execute(f"EXECUTE {nome} ({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {nome}", params)
 
-    def executar_query(self, query: str, params: tuple = None) -> list:
+    def executar_query(self, query: str, params: tuple = None, nome: str = None) -> list:
         """
         Executa uma query no banco de dados de forma segura.
+        Cada chamada usa sua própria conexão do pool; consultas de leitura são
+        repetidas uma vez se a conexão tiver caído no meio do caminho.
+        Com `nome`, a query (de texto fixo) vira um prepared statement da conexão,
+        e as próximas chamadas pulam a análise e o planejamento no servidor.
         """
-        if self.conn is None:
-            return [{"erro": "Sem conexão com o banco de dados."}]
-        
-        try:
-            with self.conn.cursor() as cur:
-                cur.execute(query, params)
-                
-                if cur.description:
-                    colunas = [desc[0] for desc in cur.description]
-                    return [dict(zip(colunas, row)) for row in cur.fetchall()]
-                else:
-                    self.conn.commit()
-                    return [{"status": "sucesso", "linhas_afetadas": cur.rowcount}]
-
-        except Exception as e:
-            self.conn.rollback()
-            return [{"erro": f"Erro ao executar query: {e}"}]
+        leitura = query.lstrip().upper().startswith(("SELECT", "WITH"))
+        tentativas = 2 if leitura else 1
+        conexao = None
+
+        with metrics.medir("db_query"):
+            for tentativa in range(tentativas):
+                try:
+                    with self.pool.connection() as conn:
+                        conexao = conn
+                        with conn.cursor() as cur:
+                            if nome and self.usar_preparadas:
+                                self._executar_preparada(conn, cur, nome, query, params)
+                            else:
+                                cur.execute(query, params)
+                            
+                            if cur.description:
+                                colunas = [desc[0] for desc in cur.description]
+                                return [dict(zip(colunas, row)) for row in cur.fetchall()]
+                            return [{"status": "sucesso", "linhas_afetadas": cur.rowcount}]
+
+                except PoolTimeout as e:
+                    print(f"❌ ERRO DE CONEXÃO: {repr(e)}")
+                    metrics.contar_erro("db_query")
+                    return [{"erro": "Sem conexão com o banco de dados."}]
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                    if tentativa + 1 < tentativas:
+                        continue
+                    print(f"❌ ERRO DE CONEXÃO: {repr(e)}")
+                    metrics.contar_erro("db_query")
+                    return [{"erro": f"Erro ao executar query: {e}"}]
+                except psycopg2.Error as e:
+                    if e.pgcode == PREPARADA_INEXISTENTE and tentativa + 1 < tentativas:
+                        # A sessão perdeu o plano (ex.: DISCARD ALL): prepara de novo
+                        with self._preparadas_lock:
+                            self._preparadas.get(conexao, set()).discard(nome)
+                        continue
+                    metrics.contar_erro("db_query")
+                    return [{"erro": f"Erro ao executar query: {e}"}]
+                except Exception as e:
+                    metrics.contar_erro("db_query")
+                    return [{"erro": f"Erro ao executar query: {e}"}]
+
+    def pool_metrics(self) -> dict:
+        """Métricas do pool de conexões (espera, conexões em uso, overflow)."""
+        return self.pool.metrics()
 
     def fechar_conexao(self):
-        if self.conn:
-            self.conn.close()
+        if self.pool:
+            self.pool.close()
 
     def get_smartphone_details_and_photos(self, modelo: str) -> list:
         """Busca os detalhes de um smartphone e as URLs de suas fotos."""
+        # Responde do catálogo em memória; só vai ao banco se ele estiver indisponível
+        dados = self.catalog.lookup(modelo)
+        if dados is not None:
+            return dados
+
+        query = """
+            SELECT
+                s.modelo, s.fabricante, s.info_geral, s.especificacoes_tecnicas,
+                s.performance_score, s.categoria, s.segmento,
+                array_agg(f.url_imagem) as fotos
+            FROM smartphones s
+            LEFT JOIN fotos f ON s.id = f.smartphone_id
+            WHERE s.modelo_chave LIKE %s
+            GROUP BY s.id;
+        """
+        return self.executar_query(query, (f"%{normalizar_texto(modelo)}%",), nome="detalhes_smartphone")
+
+    def get_multiple_smartphone_details(self, modelos: list) -> dict:
+        """
+        Busca os detalhes e fotos de vários smartphones de uma vez (usado nas comparações).
+        Retorna {modelo pedido: linhas}. Sem o catálogo em memória, faz UMA consulta
+        para todos os nomes exatos e só recorre à busca por trecho para os que faltarem.
+        """
+        resultado = {}
+        faltando = []
+        for modelo in modelos:
+            dados = self.catalog.lookup(modelo)
+            if dados is None:
+                faltando.append(modelo)
+            else:
+                resultado[modelo] = dados
+        if not faltando:
+            return resultado
+
         query = """
             SELECT
                 s.modelo, s.fabricante, s.info_geral, s.especificacoes_tecnicas,
@@ -66,10 +181,20 @@ class DatabaseTools:
                 array_agg(f.url_imagem) as fotos
             FROM smartphones s
             LEFT JOIN fotos f ON s.id = f.smartphone_id
-            WHERE lower(s.modelo) LIKE %s
+            WHERE s.modelo_chave = ANY(%s)
             GROUP BY s.id;
         """
-        return self.executar_query(query, (f"%{modelo.lower()}%",))
+        linhas = self.executar_query(query, ([normalizar_texto(modelo) for modelo in faltando],),
+                                     nome="detalhes_smartphones")
+        if linhas and "erro" in linhas[0]:
+            return {**resultado, **{modelo: linhas for modelo in faltando}}
+
+        por_nome = {}
+        for linha in linhas:
+            por_nome.setdefault(normalizar_texto(linha["modelo"]), []).append(linha)
+        for modelo in faltando:
+            resultado[modelo] = por_nome.get(normalizar_texto(modelo)) or self.get_smartphone_details_and_photos(modelo)
+        return resultado
 
     def get_top_sold_products(self, limit: int = 1, month: int = None, year: int = None) -> list:
         """
@@ -78,6 +203,11 @@ class DatabaseTools:
         - Para filtrar por ano, use o parâmetro 'year'.
         - Para filtrar por mês e ano, use os parâmetros 'month' e 'year'.
         """
+        # Responde do cubo pré-agregado; só vai ao banco se ele estiver indisponível
+        dados = self.rollup.top_sold(limit, month, year)
+        if dados is not None:
+            return dados
+
         params = []
         query = """
             SELECT 
@@ -110,6 +240,10 @@ class DatabaseTools:
 
     def get_monthly_revenue(self, month: int, year: int) -> list:
         """Retorna a receita total e o total de unidades vendidas de um mês e ano específicos."""
+        dados = self.rollup.monthly_revenue(month, year)
+        if dados is not None:
+            return dados
+
         query = """
             SELECT 
                 SUM(receita) as receita_total,
@@ -117,7 +251,7 @@ class DatabaseTools:
             FROM vendas_smartphones
             WHERE mes = %s AND ano = %s;
         """
-        return self.executar_query(query, (month, year))
+        return self.executar_query(query, (month, year), nome="receita_mensal")
 
     def get_product_sales_by_month(self, month: int, year: int) -> list:
         """Retorna todos os produtos vendidos em um mês e ano específicos, ordenados por unidades vendidas."""
@@ -131,7 +265,7 @@ class DatabaseTools:
             WHERE mes = %s AND ano = %s
             ORDER BY unidades_vendidas DESC;
         """
-        return self.executar_query(query, (month, year))
+        return self.executar_query(query, (month, year), nome="vendas_do_mes")
 
     def get_product_sales(self, produto: str, month: int, year: int) -> list:
         """Retorna as vendas de um produto específico em um mês e ano específicos."""
@@ -142,9 +276,9 @@ class DatabaseTools:
                 unidades_vendidas, 
                 receita
             FROM vendas_smartphones
-            WHERE lower(modelo) LIKE %s AND mes = %s AND ano = %s;
+            WHERE modelo_chave LIKE %s AND mes = %s AND ano = %s;
         """
-        return self.executar_query(query, (f"%{produto.lower()}%", month, year))
+        return self.executar_query(query, (f"%{normalizar_texto(produto)}%", month, year), nome="vendas_produto")
 
     def get_comparison_by_manufacturer(self, year: int, month: int = None) -> list:
         """
@@ -153,6 +287,10 @@ class DatabaseTools:
         - Para filtrar por ano, use o parâmetro 'year'.
         - Para filtrar por mês e ano, use os parâmetros 'month' e 'year'.
         """
+        dados = self.rollup.comparison_by_manufacturer(year, month)
+        if dados is not None:
+            return dados
+
         params = []
         query = """
             SELECT 
@@ -185,6 +323,10 @@ class DatabaseTools:
         Esta função é ideal para perguntas como 'Qual a média de faturamento mensal?' ou 'Qual a média de vendas por mês?'.
         Ela retorna a receita média e o número médio de unidades vendidas por mês.
         """
+        dados = self.rollup.average_monthly_sales(year)
+        if dados is not None:
+            return dados
+
         query = """
             WITH vendas_mensais AS (
                 SELECT 
@@ -200,10 +342,14 @@ class DatabaseTools:
                 AVG(unidades_mensais) as media_unidades
             FROM vendas_mensais;
         """
-        return self.executar_query(query, (year,))
+        return self.executar_query(query, (year,), nome="media_mensal")
 
     def get_best_selling_month(self, year: int) -> list:
         """Retorna o mês com a maior receita de vendas em um ano."""
+        dados = self.rollup.best_selling_month(year)
+        if dados is not None:
+            return dados
+
         query = """
             SELECT 
                 CASE mes
@@ -228,10 +374,14 @@ class DatabaseTools:
             ORDER BY receita_total DESC
             LIMIT 1;
         """
-        return self.executar_query(query, (year,))
+        return self.executar_query(query, (year,), nome="melhor_mes")
 
     def get_least_sold_products(self, year: int, limit: int = 1) -> list:
         """Retorna os N produtos menos vendidos de um ano, com base na receita total."""
+        dados = self.rollup.least_sold(year, limit)
+        if dados is not None:
+            return dados
+
         query = """
             SELECT 
                 modelo, 
@@ -244,28 +394,24 @@ class DatabaseTools:
             ORDER BY receita_total ASC
             LIMIT %s;
         """
-        return self.executar_query(query, (year, limit))
+        return self.executar_query(query, (year, limit), nome="menos_vendidos")
 
     def get_multiple_product_sales(self, products: list, year: int) -> list:
         """Retorna as vendas de múltiplos produtos em um ano específico."""
         if not products:
             return []
 
-        # Cria os placeholders para a cláusula IN
-        placeholders = ', '.join(['%s'] * len(products))
-        
-        query = f"""
+        # Uma lista só (= ANY) em vez de um IN com N placeholders: o texto da query é
+        # sempre o mesmo e o plano preparado serve para qualquer quantidade de produtos
+        query = """
             SELECT 
                 modelo, 
                 fabricante,
                 SUM(unidades_vendidas) as unidades_vendidas, 
                 SUM(receita) as receita_total
             FROM vendas_smartphones
-            WHERE lower(modelo) IN ({placeholders}) AND ano = %s
+            WHERE modelo_chave = ANY(%s) AND ano = %s
             GROUP BY modelo, fabricante
             ORDER BY receita_total DESC;
         """
-        
-        # Prepara os parâmetros: produtos em minúsculas e o ano
-        params = [p.lower() for p in products] + [year]
-        return self.executar_query(query, tuple(params))
\ No newline at end of file
+        return self.executar_query(query, ([normalizar_texto(p) for p in products], year), nome="vendas_produtos")
\ No newline at end of file
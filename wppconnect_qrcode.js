@@ -1,9 +1,75 @@
 const wppconnect = require('@wppconnect-team/wppconnect');
 const fs = require('fs');
 const axios = require('axios'); // Adicionado axios
+const http = require('http');
+
+const STREAM = process.env.WEBHOOK_STREAM === '1';
+// Modo fila: o /webhook só enfileira e a resposta chega depois em POST /resposta
+const FILA = process.env.WEBHOOK_QUEUE === '1';
+const CALLBACK_PORT = parseInt(process.env.WEBHOOK_CALLBACK_PORT || '5001', 10);
+const CALLBACK_URL = `http://127.0.0.1:${CALLBACK_PORT}/resposta`;
 
 console.log('🚀 Iniciando WPPConnect...\n');
 
+// Consome o /webhook/stream (Server-Sent Events) e envia cada pedaço ao usuário
+// assim que ele chega. Retorna quantas mensagens foram enviadas.
+async function responderEmStreaming(client, message) {
+  const response = await axios.post('http://localhost:5000/webhook/stream', {
+    message: message.body,
+    sender: message.from
+  }, { responseType: 'stream' });
+
+  let buffer = '';
+  let enviados = 0;
+  for await (const parte of response.data) {
+    buffer += parte.toString('utf8');
+    let fim;
+    while ((fim = buffer.indexOf('\n\n')) !== -1) {
+      const evento = buffer.slice(0, fim);
+      buffer = buffer.slice(fim + 2);
+      if (evento.startsWith('event: done')) {
+        return enviados;
+      }
+      const linha = evento.split('\n').find((l) => l.startsWith('data: '));
+      if (!linha) continue;
+      const { chunk } = JSON.parse(linha.slice(6));
+      if (chunk) {
+        await client.sendText(message.from, chunk);
+        enviados += 1;
+      }
+    }
+  }
+  return enviados;
+}
+
+// Recebe as respostas geradas pelos workers da fila ({id, sender, response})
+function iniciarCallback(client) {
+  const servidor = http.createServer((req, res) => {
+    if (req.method !== 'POST' || req.url !== '/resposta') {
+      res.writeHead(404);
+      res.end();
+      return;
+    }
+    let corpo = '';
+    req.on('data', (parte) => { corpo += parte; });
+    req.on('end', async () => {
+      try {
+        const { sender, response } = JSON.parse(corpo);
+        await client.sendText(sender, response || 'Desculpe, não consegui obter uma resposta.');
+        res.writeHead(200);
+      } catch (error) {
+        // Status de erro faz o worker tentar entregar de novo mais tarde
+        console.error('❌ Erro ao entregar resposta da fila:', error.message);
+        res.writeHead(500);
+      }
+      res.end();
+    });
+  });
+  servidor.listen(CALLBACK_PORT, '127.0.0.1', () => {
+    console.log(`📥 Aguardando respostas da fila em ${CALLBACK_URL}\n`);
+  });
+}
+
 async function start() {
   try {
     const client = await wppconnect.create({
@@ -25,6 +91,10 @@ async function start() {
 
     console.log('✅ Cliente criado! Aguardando leitura do QR code e conexão...\n');
 
+    if (FILA) {
+      iniciarCallback(client);
+    }
+
     // STATUS CONEXÃO
     client.onStateChange((state) => {
       console.log(`📡 Estado: ${state}\n`);
@@ -45,11 +115,37 @@ async function start() {
       console.log(`   Texto: ${message.body}\n`);
 
       try {
+        // Modo fila: a resposta chega pelo callback; o ID evita processar reentregas duas vezes
+        if (FILA) {
+          await axios.post('http://localhost:5000/webhook', {
+            id: message.id,
+            message: message.body,
+            sender: message.from,
+            callback: CALLBACK_URL
+          });
+          return;
+        }
+
+        // Modo streaming: envia cada pedaço da resposta assim que ele chega
+        if (STREAM) {
+          const enviados = await responderEmStreaming(client, message);
+          if (enviados === 0) {
+            client.sendText(message.from, 'Desculpe, não consegui obter uma resposta.');
+          }
+          return;
+        }
+
         // Envia a mensagem para o webhook do Flask
         const response = await axios.post('http://localhost:5000/webhook', {
-          message: message.body
+          message: message.body,
+          sender: message.from
         });
 
+        // Mensagem agrupada com uma mais nova do mesmo remetente: a resposta vai com a última
+        if (response.data && response.data.status === 'coalesced') {
+          return;
+        }
+
         // Envia a resposta do agente de IA de volta para o usuário
         if (response.data && response.data.response) {
           client.sendText(message.from, response.data.response);